@@ -0,0 +1,175 @@
+"""
+Result depth benchmark of the adaptive knowledge base searches (oheroAct/adaptive_retrieval.py).
+
+Loads the Health events of the test-events corpus, re-targeted at synthetic accounts and regions as in
+event_vectors_benchmark.py, into the knowledge base stand-in (stubs.FakeBedrockAgentRuntime) and runs search_ops_events
+for narrow queries (event type and description of one event, filtered by its service and region), event queries
+(the accounts of one event ARN) and broad ones (a service name only), once at the fixed maximum depth and once adaptively.
+It also runs search_sec_findings over a single-document source: Security Hub findings written as one CSV export by the
+secHubReport function and split into fixed size chunks, as the knowledge base does with EXPORT_MODE=full. It reports per
+search:
+  - retrieve calls, results and result tokens
+  - the share of the fixed depth's top 5 that the adaptive results include
+  - the stopping reasons of the adaptive searches
+Fails when the adaptive searches return more tokens than the fixed ones, take more than two retrieve calls, or stop a
+single-document search as redundant (all its chunks share one source document).
+
+Usage (from the repo root, with oheroAct requirements installed):
+    python benchmark/adaptive_retrieval_benchmark.py
+    python benchmark/adaptive_retrieval_benchmark.py --events 5000 --max-results 25
+"""
+import argparse
+import collections
+import importlib.util
+import io
+import itertools
+import json
+import os
+import statistics
+import sys
+import uuid
+from contextlib import redirect_stdout
+
+from event_vectors_benchmark import lake_events, query_of, regions
+from run_benchmark import handler_env, handler_dir, load_corpus, parse_detail, repo_root
+from stubs import CallRecorder, FakeBedrockAgentRuntime, Latency
+
+sechub_report_path = os.path.join(repo_root, 'lambda', 'src', 'handlers', 'secHubReport', 'app.py')
+# Security Hub controls the synthetic findings fail, (SecurityControlId, Title)
+controls = [
+    ('S3.8', 'S3 general purpose buckets should block public access'),
+    ('IAM.1', 'IAM policies should not allow full administrative privileges'),
+    ('EC2.2', 'VPC default security groups should not allow inbound or outbound traffic'),
+    ('CloudTrail.1', 'CloudTrail should be enabled and configured with at least one multi-Region trail'),
+    ('RDS.3', 'RDS DB instances should have encryption at-rest enabled'),
+]
+
+
+def sechub_export_chunks(corpus, count, chunk_chars, overlap_chars):
+    """
+    Chunks of a full mode Security Hub export of count findings, the corpus finding failing the controls above over
+    synthetic accounts and regions. Chunks are fixed size character windows of the one CSV document.
+    """
+    os.environ.setdefault('S3_NAME', 'sechub-bucket')
+    spec = importlib.util.spec_from_file_location('sechub_report', sechub_report_path)
+    sechub_report = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sechub_report)
+
+    finding = next(parse_detail(entry)['findings'][0] for _, entry in corpus if entry['DetailType'] == 'Security Hub Findings - Imported')
+    findings = []
+    accounts = (f"{100000000000 + number}" for number in itertools.count())
+    for account in accounts:
+        for (control_id, title), region in itertools.product(controls, regions):
+            if len(findings) == count:
+                break
+            findings.append(dict(
+                finding,
+                Id=f"arn:aws:securityhub:{region}:{account}:security-control/{control_id}/finding/{uuid.uuid4()}",
+                AwsAccountId=account,
+                Region=region,
+                Title=title,
+                Compliance=dict(finding.get('Compliance', {}), SecurityControlId=control_id)
+            ))
+        if len(findings) == count:
+            break
+    out = io.StringIO()
+    with redirect_stdout(io.StringIO()):
+        sechub_report.write_findings_csv([{'Findings': findings}], out)
+    text = out.getvalue()
+    metadata = {'x-amz-bedrock-kb-source-uri': f"s3://sechub-bucket/{sechub_report.filename}"}
+    step = chunk_chars - overlap_chars
+    chunks = [{'text': text[start:start + chunk_chars], 'metadata': metadata} for start in range(0, len(text), step)]
+    return chunks, findings
+
+
+def run_searches(search, kb, searches):
+    """(results, calls, tokens, stop reasons) per search, the results as texts."""
+    runs = []
+    for arguments in searches:
+        calls_before = len(kb.returned)
+        log = io.StringIO()
+        with redirect_stdout(log):
+            results = search(**arguments)
+        reasons = [line.rsplit('stopped: ', 1)[1] for line in log.getvalue().splitlines() if 'stopped: ' in line]
+        texts = [result['content'] for result in results]
+        runs.append((texts, len(kb.returned) - calls_before, sum(len(text) // 4 for text in texts), reasons))
+    return runs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=2000, help='number of Health events in the knowledge base')
+    parser.add_argument('--queries', type=int, default=50, help='number of queries of each kind')
+    parser.add_argument('--max-results', type=int, default=25, help='fixed depth and maximum adaptive depth')
+    parser.add_argument('--findings', type=int, default=2000, help='number of Security Hub findings in the single-document export')
+    args = parser.parse_args()
+
+    os.environ.update(handler_env)
+    os.environ['OPS_EVENT_RESULTS'] = str(args.max_results)
+    os.environ['SEC_FINDING_RESULTS'] = str(args.max_results)
+    os.environ['OPS_EVENT_VECTOR_MODE'] = 'off'
+    os.environ['EMIT_METRICS'] = 'false'
+    sys.path.insert(0, handler_dir)
+    import aws_clients
+    import event_vectors
+
+    events = lake_events(load_corpus(), args.events)
+    documents = {
+        event_vectors.event_key(event['detail']): {'text': json.dumps(event['detail']), 'metadata': event_vectors.event_metadata(event['detail'])}
+        for event in events
+    }
+    kb = FakeBedrockAgentRuntime(Latency(0), CallRecorder(), list(documents.values()))
+    # Fixed size chunking of the knowledge base data source, 1000 tokens with 10% overlap at ~4 characters per token
+    chunks, findings = sechub_export_chunks(load_corpus(), args.findings, 4000, 400)
+    sechub_kb = FakeBedrockAgentRuntime(Latency(0), CallRecorder(), chunks)
+    aws_clients._clients.update({'bedrock-agent-runtime:retrieve': kb})
+    import adaptive_retrieval
+    import tools
+
+    step = max(1, len(events) // args.queries)
+    details = [event['detail'] for event in itertools.islice(events, 0, None, step)][:args.queries]
+    step = max(1, len(findings) // args.queries)
+    sampled_findings = findings[::step][:args.queries]
+    search_ops_events = lambda **arguments: tools.search_ops_events(**arguments)['search_ops_events']
+    search_sec_findings = lambda **arguments: tools.search_sec_findings(**arguments)['search_sec_findings']
+    # (name, knowledge base, search, searches, single document source)
+    scenarios = [
+        ('narrow', kb, search_ops_events, [{'query': query_of(detail), 'service': detail['service'], 'region': detail['eventRegion']} for detail in details], False),
+        ('event', kb, search_ops_events, [{'query': f"Which accounts does {detail['eventTypeCode']} affect?", 'event_arn': detail['eventArn']} for detail in details], False),
+        ('broad', kb, search_ops_events, [{'query': f"Any open issues with {detail['service']}?"} for detail in details], False),
+        ('sechub', sechub_kb, search_sec_findings, [{'query': f"Failed {finding['Compliance']['SecurityControlId']} findings"} for finding in sampled_findings], True),
+    ]
+
+    initial_results, result_token_budget = adaptive_retrieval.initial_results, adaptive_retrieval.result_token_budget
+    print(f"{len(documents)} events in the knowledge base, {len(findings)} Security Hub findings in {len(chunks)} chunks of one export, "
+          f"maximum depth {args.max_results}, initial depth {initial_results}, token budget {result_token_budget}")
+    print(f"{'queries':<10}{'mode':<10}{'calls':>7}{'results':>9}{'tokens':>9}{'top 5 kept':>12}  stop reasons")
+    regressions = []
+    for name, scenario_kb, search, searches, single_document in scenarios:
+        aws_clients._clients['bedrock-agent-runtime'] = scenario_kb
+        # Fixed depth as before adaptive retrieval: one retrieve at the maximum depth without token budget
+        adaptive_retrieval.initial_results, adaptive_retrieval.result_token_budget = args.max_results, sys.maxsize
+        fixed = run_searches(search, scenario_kb, searches)
+        adaptive_retrieval.initial_results, adaptive_retrieval.result_token_budget = initial_results, result_token_budget
+        adaptive = run_searches(search, scenario_kb, searches)
+        kept = [len(set(fixed_texts[:5]) & set(texts)) / (len(fixed_texts[:5]) or 1) for (fixed_texts, *_), (texts, *_) in zip(fixed, adaptive)]
+        for mode, runs, top_kept in (('fixed', fixed, 1.0), ('adaptive', adaptive, statistics.mean(kept))):
+            reasons = collections.Counter(reason for *_, run_reasons in runs for reason in run_reasons)
+            print(f"{name:<10}{mode:<10}{statistics.mean(run[1] for run in runs):>7.1f}{statistics.mean(len(run[0]) for run in runs):>9.1f}"
+                  f"{statistics.mean(run[2] for run in runs):>9.0f}{top_kept:>12.2f}  {dict(reasons)}")
+        if sum(run[2] for run in adaptive) > sum(run[2] for run in fixed):
+            regressions.append(f"{name}: more tokens than fixed depth searches")
+        # Every retrieve starts over, a search that keeps widening costs more latency than the fixed depth
+        if max(run[1] for run in adaptive) > 2:
+            regressions.append(f"{name}: more than two retrieve calls")
+        if single_document and any('redundant' in run[3] for run in adaptive):
+            regressions.append(f"{name}: single-document searches stopped as redundant")
+
+    if regressions:
+        print(f"✗ Adaptive search regressions: {'; '.join(regressions)}")
+        sys.exit(1)
+    print("✓ Adaptive searches within the token use and retrieve calls of fixed depth searches")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""
+Recall and latency benchmark of the local ops event vector index (oheroAct/event_vectors.py) against the knowledge base.
+
+Archives the Health events of the test-events corpus, re-targeted at synthetic accounts and regions,
+as event lake Firehose objects, indexes them with the indexer handler and syncs the memory-mapped index. The same
+events form the knowledge base stand-in (stubs.FakeBedrockAgentRuntime), embeddings come from stubs.FakeBedrockRuntime.
+Relevance is fixed per query from how the events were generated, independent of either scorer:
+  - event queries (service, event type and description of an indexed event): relevant are all indexed events with
+    the same service, event type and description, in any account and region
+  - instance queries (service, event type, account and region): relevant is the one archived event
+For both it reports recall@k of the local index and, for reference, of the knowledge base stand-in:
+the share of the relevant events (at most k) found in the top k.
+It also reports p50/p99 latency of the knowledge base and of the local index (embedding call plus matrix product)
+and checks that search_ops_events still returns events from the local index while the knowledge base throttles.
+Fails when recall@k of the local index on either query set is below --min-recall.
+
+Usage (from the repo root, with oheroAct requirements installed):
+    python benchmark/event_vectors_benchmark.py
+    python benchmark/event_vectors_benchmark.py --events 20000 --latency-scale 0
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+from run_benchmark import handler_env, handler_dir, load_corpus, parse_detail
+from stubs import CallRecorder, FakeBedrockAgentRuntime, FakeBedrockRuntime, FakeS3, Latency
+
+lake_bucket = 'benchmark-event-lake'
+regions = ['us-east-1', 'us-west-2', 'eu-west-1', 'ap-southeast-2']
+
+
+def lake_events(corpus, count):
+    """EventBridge envelopes of the corpus Health events spread over synthetic accounts and regions."""
+    details = [(entry, parse_detail(entry)) for _, entry in corpus]
+    details = [(entry, detail) for entry, detail in details if 'eventArn' in detail]
+    accounts = (f"{100000000000 + number}" for number in itertools.count())
+    events = []
+    for account in accounts:
+        for (entry, detail), region in itertools.product(details, regions):
+            if len(events) == count:
+                return events
+            events.append({
+                'version': '0',
+                'id': str(uuid.uuid4()),
+                'detail-type': entry['DetailType'],
+                'source': entry['Source'],
+                'detail': dict(detail, affectedAccount=account, eventRegion=region)
+            })
+
+
+def query_of(detail):
+    description = detail.get('eventDescription', [{}])
+    text = description[0].get('latestDescription', '') if isinstance(description, list) and description else ''
+    return f"{detail.get('service', '')} {detail.get('eventTypeCode', '')} {' '.join(text.split()[:12])}"
+
+
+def instance_query_of(detail):
+    return f"{detail.get('service', '')} {detail.get('eventTypeCode', '')} in account {detail['affectedAccount']} region {detail['eventRegion']}"
+
+
+def content_of(detail):
+    description = detail.get('eventDescription', [{}])
+    return detail.get('service'), detail.get('eventTypeCode'), description[0].get('latestDescription', '') if description else ''
+
+
+def recall_at(keys, relevant, k):
+    return sum(1 for key in keys[:k] if key in relevant) / min(k, len(relevant))
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=2000, help='number of archived Health events to index')
+    parser.add_argument('--events-per-object', type=int, default=100, help='events per event lake object')
+    parser.add_argument('--queries', type=int, default=100, help='number of queries to time')
+    parser.add_argument('--k', type=int, default=5, help='results compared per query')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='multiplier applied to the simulated service latencies of queries')
+    parser.add_argument('--min-recall', type=float, default=0.6, help='fail when recall@k is below this value')
+    args = parser.parse_args()
+
+    os.environ.update(handler_env)
+    os.environ['EVENT_LAKE_BUCKET'] = lake_bucket
+    os.environ['OPS_EVENT_VECTORS_DIR'] = tempfile.mkdtemp(prefix='ops-event-vectors-')
+    sys.path.insert(0, handler_dir)
+    import aws_clients
+    import event_vectors
+
+    latency = Latency(0)
+    recorder = CallRecorder()
+    s3 = FakeS3(latency, recorder)
+    events = lake_events(load_corpus(), args.events)
+    # One knowledge base document per event, the latest update replaces the earlier ones as in the index
+    documents = {
+        event_vectors.event_key(event['detail']): {'text': json.dumps(event['detail']), 'metadata': {'key': event_vectors.event_key(event['detail'])}}
+        for event in events
+    }
+    documents = list(documents.values())
+    kb = FakeBedrockAgentRuntime(latency, recorder, documents)
+    aws_clients._clients.update({'s3': s3, 'bedrock-runtime': FakeBedrockRuntime(latency, recorder), 'bedrock-agent-runtime': kb, 'bedrock-agent-runtime:retrieve': kb})
+
+    records = []
+    for number, start in enumerate(range(0, len(events), args.events_per_object)):
+        key = f"ops-events/source=ohero.health/detail_type=AWS Health Event/lake-{number:05d}"
+        s3.put_object(Bucket=lake_bucket, Key=key, Body=''.join(json.dumps(event) for event in events[start:start + args.events_per_object]))
+        records.append({'body': json.dumps({'detail': {'bucket': {'name': lake_bucket}, 'object': {'key': key}}})})
+
+    started = time.perf_counter()
+    for start in range(0, len(records), 10):
+        event_vectors.lambda_handler({'Records': records[start:start + 10]}, None)
+    index_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    index = event_vectors.get_event_vector_index()
+    sync_ms = (time.perf_counter() - started) * 1000
+
+    latency.scale = args.latency_scale
+    # Ground truth: events are copies of a few corpus events, those with the same content answer the same event query
+    indexed = [json.loads(document['text']) for document in documents]
+    keys_by_content = {}
+    for detail in indexed:
+        keys_by_content.setdefault(content_of(detail), set()).add(event_vectors.event_key(detail))
+    sampled = indexed[::max(1, len(indexed) // args.queries)][:args.queries]
+    scenarios = {
+        'event': [(query_of(detail), keys_by_content[content_of(detail)]) for detail in sampled],
+        'instance': [(instance_query_of(detail), {event_vectors.event_key(detail)}) for detail in sampled],
+    }
+
+    kb_latencies, local_latencies = [], []
+    recalls = {name: {'local': [], 'kb': []} for name in scenarios}
+    for name, queries in scenarios.items():
+        for query, relevant in queries:
+            started = time.perf_counter()
+            kb_results = kb.retrieve(knowledgeBaseId='OPSKB', retrievalQuery={'text': query}, retrievalConfiguration={'vectorSearchConfiguration': {'numberOfResults': args.k}})['retrievalResults']
+            kb_latencies.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            local_results = event_vectors.search_event_vectors(query, args.k)
+            local_latencies.append((time.perf_counter() - started) * 1000)
+
+            recalls[name]['kb'].append(recall_at([result['metadata']['key'] for result in kb_results], relevant, args.k))
+            recalls[name]['local'].append(recall_at([event_vectors.event_key(json.loads(result['content'])) for result in local_results], relevant, args.k))
+
+    import tools
+    kb.error_code = 'ThrottlingException'
+    fallback = tools.search_ops_events(scenarios['event'][0][0])['search_ops_events']
+
+    recall = min(statistics.mean(recalls[name]['local']) for name in scenarios)
+    print(f"Indexed {len(index.documents)} events from {len(records)} lake objects in {index_ms:.0f}ms, synced in {sync_ms:.1f}ms ({index.vectors.nbytes / 1024:.0f} KB matrix, {index.dimensions} dimensions)")
+    for name, queries in scenarios.items():
+        print(f"{name:<9} queries: {len(queries)}, recall@{args.k} local index {statistics.mean(recalls[name]['local']):.3f}, knowledge base {statistics.mean(recalls[name]['kb']):.3f}")
+    print(f"Knowledge base: p50 {statistics.median(kb_latencies):.1f}ms, p99 {percentile(kb_latencies, 0.99):.1f}ms")
+    print(f"Local index:    p50 {statistics.median(local_latencies):.1f}ms, p99 {percentile(local_latencies, 0.99):.1f}ms")
+    print(f"Knowledge base throttled: search_ops_events returned {len(fallback)} events from the local index")
+
+    if recall < args.min_recall or not fallback:
+        print(f"✗ Recall@{args.k} below {args.min_recall} or no fallback results")
+        sys.exit(1)
+    print("✓ Local index within recall budget and serving fallbacks")
+
+
+if __name__ == '__main__':
+    main()
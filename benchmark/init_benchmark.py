@@ -0,0 +1,111 @@
+"""
+Init duration benchmark for the oheroAct handler.
+
+Measures, in fresh interpreters, what a cold start pays before the first model call: importing app.py (Lambda INIT
+phase) and building the ops agent with its Bedrock models and first AWS clients (start of the first invocation).
+Nothing is sent over the network, clients are only constructed. With --ref the same measurement runs against the
+handler sources of another git revision so before/after numbers come from the same machine.
+
+Usage (from the repo root, with oheroAct requirements installed):
+    python benchmark/init_benchmark.py                      # current tree
+    python benchmark/init_benchmark.py --ref HEAD~1         # compare with the previous commit
+    python benchmark/init_benchmark.py --importtime 15      # also list the 15 slowest modules by self time
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from run_benchmark import handler_env, repo_root
+
+handler_rel_dir = os.path.join('lambda', 'src', 'handlers', 'oheroAct')
+
+# Runs in a fresh interpreter inside the handler directory, prints the phase timings as JSON
+probe = """
+import json, time
+started = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - started) * 1000
+
+import agent_utils
+started = time.perf_counter()
+agent = agent_utils.create_ops_agent(agent_utils.ContextVisualizationHook(), False)
+build_ms = (time.perf_counter() - started) * 1000
+
+started = time.perf_counter()
+try:
+    from aws_clients import get_client
+    for service in ('s3', 'bedrock-agent-runtime', 'dynamodb', 'stepfunctions', 'events'):
+        get_client(service)
+except ImportError:
+    pass # revisions before lazy clients created them at import
+clients_ms = (time.perf_counter() - started) * 1000
+
+print(json.dumps({'importMs': import_ms, 'agentBuildMs': build_ms, 'clientsMs': clients_ms}))
+"""
+
+
+def run_probe(handler_dir):
+    env = dict(os.environ, **handler_env)
+    output = subprocess.run([sys.executable, '-c', probe], cwd=handler_dir, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(handler_dir, count):
+    """Modules with the highest self import time, from python -X importtime."""
+    env = dict(os.environ, **handler_env)
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=handler_dir, env=env, capture_output=True, text=True, check=True).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        modules.append((int(self_us), int(cumulative_us), name))
+    return sorted(modules, reverse=True)[:count]
+
+
+def measure(handler_dir, repeat):
+    runs = [run_probe(handler_dir) for _ in range(repeat)]
+    result = {key: round(statistics.median(run[key] for run in runs), 1) for key in runs[0]}
+    result['totalMs'] = round(result['importMs'] + result['agentBuildMs'] + result['clientsMs'], 1)
+    return result
+
+
+def export_revision(ref, target_dir):
+    """Extract the handler sources of a git revision into target_dir, returns the handler directory."""
+    archive = subprocess.run(['git', 'archive', ref, handler_rel_dir], cwd=repo_root, capture_output=True, check=True).stdout
+    subprocess.run(['tar', '-x', '-C', target_dir], input=archive, check=True)
+    return os.path.join(target_dir, handler_rel_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='fresh interpreters per tree, the median is reported')
+    parser.add_argument('--ref', help='git revision to compare with, e.g. HEAD~1')
+    parser.add_argument('--importtime', type=int, default=0, help='list this many slowest modules of the current tree')
+    args = parser.parse_args()
+
+    results = {'current': measure(os.path.join(repo_root, handler_rel_dir), args.repeat)}
+    if args.ref:
+        with tempfile.TemporaryDirectory() as target_dir:
+            results[args.ref] = measure(export_revision(args.ref, target_dir), args.repeat)
+
+    print(f"{'tree':<16}{'import':>10}{'agent build':>13}{'clients':>10}{'total':>10}")
+    for name, metrics in results.items():
+        print(f"{name:<16}{metrics['importMs']:>10.1f}{metrics['agentBuildMs']:>13.1f}{metrics['clientsMs']:>10.1f}{metrics['totalMs']:>10.1f}")
+    if args.ref:
+        delta = results['current']['totalMs'] - results[args.ref]['totalMs']
+        print(f"Init change against {args.ref}: {delta:+.1f}ms")
+
+    if args.importtime:
+        print(f"\nSlowest imports (self ms / cumulative ms):")
+        for self_us, cumulative_us, name in slowest_imports(os.path.join(repo_root, handler_rel_dir), args.importtime):
+            print(f"  {self_us / 1000:>8.1f} {cumulative_us / 1000:>8.1f}  {name}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+"""
+Offline evaluation of the model router (oheroAct/model_router.py) on recorded runs.
+
+Record the test-events corpus once per model tier with routing off, live or with the scripted stand-in:
+    MODEL_ROUTER_MODE=off OPS_AGENT_MODEL_IDX=2 python benchmark/run_benchmark.py --model bedrock --cassette runs-preferred.json --cassette-mode record
+    MODEL_ROUTER_MODE=off OPS_AGENT_MODEL_IDX=0 python benchmark/run_benchmark.py --model bedrock --cassette runs-light.json --cassette-mode record
+then evaluate the routes against them:
+    python benchmark/model_router_eval.py --runs preferred=runs-preferred.json --runs light=runs-light.json
+
+Every corpus event is routed as the handler would route it. An event routed to a lighter tier uses that tier's recorded
+run, escalated to the preferred run when the recorded output has low confidence (model_router.low_confidence), and its
+decision (acknowledgement, tickets and their severities) is compared with the decision of the preferred run. Reports
+per event and in total the model latency and cost of always using the preferred model against routing, and the
+decision agreement of the routed events. Costs use on-demand prices per million input/output tokens.
+"""
+import argparse
+import json
+import os
+import sys
+
+from run_benchmark import handler_env, handler_dir, load_corpus, to_ai_integration_payload
+
+# USD per million input and output tokens
+prices = {
+    'nova-pro': (0.8, 3.2),
+    'claude-haiku-4-5': (1.0, 5.0),
+    'claude-sonnet-4': (3.0, 15.0),
+    'claude-3-7-sonnet': (3.0, 15.0),
+}
+
+
+def price_of(model_id):
+    for name, price in prices.items():
+        if name in model_id:
+            return price
+    return prices['claude-sonnet-4']
+
+
+def parse_interaction(interaction):
+    """Model id, latency, token usage, tool uses and text of a recorded model call."""
+    tool_uses = []
+    text = ''
+    usage = {}
+    for event in interaction['events']:
+        start = event.get('contentBlockStart', {}).get('start', {})
+        delta = event.get('contentBlockDelta', {}).get('delta', {})
+        if 'toolUse' in start:
+            tool_uses.append({'name': start['toolUse']['name'], 'input': ''})
+        elif 'toolUse' in delta and tool_uses:
+            tool_uses[-1]['input'] += delta['toolUse'].get('input', '')
+        elif 'text' in delta:
+            text += delta['text']
+        elif 'metadata' in event:
+            usage = event['metadata'].get('usage', {})
+    for tool_use in tool_uses:
+        try:
+            tool_use['input'] = json.loads(tool_use['input'] or '{}')
+        except ValueError:
+            tool_use['input'] = {}
+    return {'model_id': interaction['model_id'], 'latencyMs': interaction.get('latencyMs', 0), 'usage': usage, 'tool_uses': tool_uses, 'text': text}
+
+
+def split_runs(path):
+    """Recorded ops agent runs of a cassette in recording order, a run starts with the task prompt of the ops agent."""
+    with open(path, 'r') as f:
+        interactions = json.load(f).get('interactions', [])
+    runs = []
+    for interaction in interactions:
+        request = interaction.get('request', {})
+        ops_agent = 'acknowledge_event' in request.get('tools', [])
+        if ops_agent and 'toolResult' not in request.get('last_message', ''):
+            runs.append([])
+        if runs:
+            runs[-1].append(dict(parse_interaction(interaction), ops_agent=ops_agent))
+    return runs
+
+
+def summarize_run(calls):
+    """Decision, tools called, final text, model latency and cost of a recorded run."""
+    ops_calls = [call for call in calls if call['ops_agent']]
+    tool_uses = [tool_use for call in ops_calls for tool_use in call['tool_uses']]
+    acknowledgements = [tool_use['input'].get('action_taken') for tool_use in tool_uses if tool_use['name'] == 'acknowledge_event']
+    tickets = sorted(str(tool_use['input'].get('severity', '')) for tool_use in tool_uses if tool_use['name'] in ('create_ticket', 'update_ticket'))
+    cost = 0.0
+    for call in calls:
+        input_price, output_price = price_of(call['model_id'])
+        cost += (call['usage'].get('inputTokens', 0) * input_price + call['usage'].get('outputTokens', 0) * output_price) / 1e6
+    return {
+        'decision': (acknowledgements[0] if acknowledgements else None, tuple(tickets)),
+        'tools': [tool_use['name'] for tool_use in tool_uses],
+        'text': ops_calls[-1]['text'] if ops_calls else '',
+        'latencyMs': sum(call['latencyMs'] for call in calls),
+        'cost': cost,
+        'model_id': ops_calls[0]['model_id'] if ops_calls else 'unknown',
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', action='append', default=[], metavar='TIER=CASSETTE', help="recorded runs of a tier, 'preferred' is required")
+    parser.add_argument('--events', nargs='*', help='corpus events the cassettes were recorded for (run_benchmark --events)')
+    parser.add_argument('--min-agreement', type=float, default=0.9, help='fail when the decision agreement of routed events is below this value')
+    args = parser.parse_args()
+
+    os.environ.update(handler_env)
+    sys.path.insert(0, handler_dir)
+    import model_router
+
+    corpus = [(name, entry) for name, entry in load_corpus() if not args.events or name in args.events]
+    recorded = {}
+    for spec in args.runs:
+        tier, path = spec.split('=', 1)
+        runs = split_runs(path)
+        if len(runs) < len(corpus):
+            parser.error(f"{path} holds {len(runs)} runs, the corpus has {len(corpus)} events")
+        recorded[tier] = [summarize_run(calls) for calls in runs[:len(corpus)]]
+    if model_router.preferred_tier not in recorded:
+        parser.error("recorded runs of the preferred tier are required, e.g. --runs preferred=runs-preferred.json")
+
+    rows = []
+    for position, (name, entry) in enumerate(corpus):
+        payload = to_ai_integration_payload(name, entry)
+        event = payload['detail']['event']
+        decision = model_router.route_task(payload['detail-type'], event.get('eventContext'), event['text'], 0, mode='rules')
+        preferred = recorded[model_router.preferred_tier][position]
+        tier = decision.tier if decision.tier in recorded else model_router.preferred_tier
+        routed = recorded[tier][position]
+        escalation = None
+        latency, cost = routed['latencyMs'], routed['cost']
+        if tier != model_router.preferred_tier:
+            escalation = model_router.low_confidence(routed['text'], routed['tools'], awaiting_acknowledgement=bool(event.get('eventContext')))
+            if escalation:
+                # The lighter run is paid for, then the preferred run decides
+                latency, cost, routed = latency + preferred['latencyMs'], cost + preferred['cost'], preferred
+        rows.append({
+            'name': name, 'route': decision.route, 'tier': tier, 'escalation': escalation,
+            'agrees': routed['decision'] == preferred['decision'],
+            'preferredMs': preferred['latencyMs'], 'routedMs': latency,
+            'preferredCost': preferred['cost'], 'routedCost': cost,
+        })
+
+    print(f"{'event':<24}{'route':<26}{'tier':<11}{'escalation':<18}{'agrees':>7}{'preferred ms':>14}{'routed ms':>11}{'preferred $':>13}{'routed $':>10}")
+    for row in rows:
+        print(f"{row['name']:<24}{row['route']:<26}{row['tier']:<11}{row['escalation'] or '-':<18}{'yes' if row['agrees'] else 'NO':>7}"
+              f"{row['preferredMs']:>14}{row['routedMs']:>11}{row['preferredCost']:>13.4f}{row['routedCost']:>10.4f}")
+
+    routed_rows = [row for row in rows if row['tier'] != model_router.preferred_tier]
+    preferred_ms, routed_ms = sum(row['preferredMs'] for row in rows), sum(row['routedMs'] for row in rows)
+    preferred_cost, routed_cost = sum(row['preferredCost'] for row in rows), sum(row['routedCost'] for row in rows)
+    agreement = sum(row['agrees'] for row in routed_rows) / len(routed_rows) if routed_rows else 1.0
+    print(f"Routed to a lighter tier: {len(routed_rows)}/{len(rows)} events, {sum(1 for row in routed_rows if row['escalation'])} escalated")
+    print(f"Decision agreement of routed events: {agreement:.2f}, overall: {sum(row['agrees'] for row in rows) / len(rows):.2f}")
+    print(f"Model latency: {preferred_ms}ms preferred only, {routed_ms}ms routed ({(1 - routed_ms / (preferred_ms or 1)) * 100:.1f}% saved)")
+    print(f"Model cost: ${preferred_cost:.4f} preferred only, ${routed_cost:.4f} routed ({(1 - routed_cost / (preferred_cost or 1)) * 100:.1f}% saved)")
+
+    if agreement < args.min_agreement:
+        print(f"✗ Decision agreement below {args.min_agreement}")
+        sys.exit(1)
+    print("✓ Routed decisions agree with the preferred model")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Build and query benchmark for the past resolutions index (oheroAct/resolution_index.py).
+
+Writes synthetic knowledge reports with agent_utils.save_knowledge for the test-events corpus re-targeted at the
+packaged organization accounts, indexes them in SQS sized batches as the indexer function would, then loads the
+index cold and times search_past_resolutions queries built from the corpus events. Reports indexing throughput,
+shard sizes, load time and query latency percentiles, and fails when the p99 query latency exceeds --max-query-ms.
+S3 is the local stand-in without latency, so load time is parse and merge time only.
+
+Usage (from the repo root, with oheroAct requirements installed):
+    python benchmark/resolution_index_benchmark.py
+    python benchmark/resolution_index_benchmark.py --reports 10000 --queries 2000 --max-query-ms 20
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+from run_benchmark import handler_env, handler_dir, load_corpus, parse_detail, to_ai_integration_payload
+from stubs import CallRecorder, FakeS3, Latency
+
+report_tools = ['search_ops_events', 'acknowledge_event', 'search_tickets_by_event_key', 'lookup_accounts', 'ask_aws', 'create_ticket']
+
+
+def report_result(detail, tools):
+    """Stand-in for an agent result carrying what save_knowledge reads: metrics, tool traces and the final message."""
+    service = detail.get('service') or detail.get('findings', [{}])[0].get('ProductName', 'SecurityHub')
+    code = detail.get('eventTypeCode') or detail.get('findings', [{}])[0].get('Title', '')
+    description = json.dumps(detail.get('eventDescription') or detail.get('findings', [{}])[0].get('Description', ''))[:400]
+    text = (f"[STAGE: TRIAGE] {service} {code}: accepted and triaged to the owner team. {description}\n"
+            f"Recommended actions: review the affected {service} resources and follow the AWS guidance for {code}.")
+    traces = [SimpleNamespace(children=[SimpleNamespace(metadata={'tool_name': name, 'toolUseId': f'tooluse_{i}'}, duration=lambda: 0.2) for i, name in enumerate(tools)])]
+    metrics = SimpleNamespace(
+        cycle_count=len(tools) + 1,
+        cycle_durations=[1.5] * (len(tools) + 1),
+        tool_metrics={name: SimpleNamespace(call_count=1, success_count=1, total_time=0.2) for name in tools},
+        traces=traces,
+        accumulated_usage={'inputTokens': 40000, 'outputTokens': 2000, 'totalTokens': 42000}
+    )
+    return SimpleNamespace(metrics=metrics, message={'content': [{'text': text}]})
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reports', type=int, default=2000, help='number of knowledge reports to index')
+    parser.add_argument('--batch-size', type=int, default=100, help='reports per indexer invocation (SQS batch size)')
+    parser.add_argument('--queries', type=int, default=1000, help='number of queries to time')
+    parser.add_argument('--max-query-ms', type=float, default=50.0, help='fail when the p99 query latency exceeds this many milliseconds')
+    args = parser.parse_args()
+
+    os.environ.update(handler_env)
+    sys.path.insert(0, handler_dir)
+    import aws_clients
+    import org_index
+    import resolution_index
+    from agent_utils import save_knowledge
+
+    s3 = FakeS3(Latency(0), CallRecorder())
+    aws_clients._clients['s3'] = s3
+
+    corpus = [(name, entry) for name, entry in load_corpus()]
+    accounts = org_index.load_organization_data()['accounts']
+    agent = SimpleNamespace(name='ops_agent')
+
+    report_keys = []
+    queries = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for number, ((name, entry), account) in enumerate(itertools.islice(itertools.cycle(itertools.product(corpus, accounts)), args.reports)):
+            detail = parse_detail(entry)
+            if 'eventArn' in detail:
+                detail = dict(detail, affectedAccount=account['id'])
+                queries.append((f"{detail.get('service', '')} {detail.get('eventTypeCode', '')}", ''))
+            payload = to_ai_integration_payload(f'{name}-{number}', entry, detail=detail)
+            tools = report_tools[:2 + number % (len(report_tools) - 1)]
+            report_keys.append(save_knowledge(agent, report_result(detail, tools), payload['detail']['event']['text'], f'benchmark-{number:06d}'))
+            event_pk = payload['detail']['event']['eventContext']['eventPk']
+            queries.append(('', event_pk))
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for start in range(0, len(report_keys), args.batch_size):
+            resolution_index.index_reports(report_keys[start:start + args.batch_size])
+    index_ms = (time.perf_counter() - started) * 1000
+
+    manifest, _ = resolution_index.load_manifest()
+    shard_bytes = [len(s3.objects[(resolution_index.resolution_index_bucket, entry['key'])]) for entry in manifest['shards']]
+
+    resolution_index._resolution_index_cache = None
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        index = resolution_index.get_resolution_index()
+    load_ms = (time.perf_counter() - started) * 1000
+
+    latencies = []
+    empty = 0
+    for query, event_pk in itertools.islice(itertools.cycle(queries), args.queries):
+        started = time.perf_counter()
+        matches = index.search(query, event_pk=event_pk)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if not matches:
+            empty += 1
+
+    p99 = percentile(latencies, 0.99)
+    print(f"Indexed {len(report_keys)} reports in batches of {args.batch_size}: {index_ms:.0f}ms ({index_ms / len(report_keys):.2f}ms per report)")
+    print(f"Index: {len(index.docs)} documents, {len(index.postings)} terms, {len(shard_bytes)} shards, {sum(shard_bytes) / 1024:.0f} KB compressed")
+    print(f"Cold load: {load_ms:.1f}ms")
+    print(f"Queries: {args.queries}, p50 {statistics.median(latencies):.2f}ms, p99 {p99:.2f}ms, max {max(latencies):.2f}ms, {empty} without results")
+
+    if p99 > args.max_query_ms:
+        print(f"✗ p99 query latency {p99:.2f}ms above {args.max_query_ms}ms")
+        sys.exit(1)
+    print("✓ Query latency within budget")
+
+
+if __name__ == '__main__':
+    main()
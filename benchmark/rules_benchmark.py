@@ -0,0 +1,91 @@
+"""
+Throughput benchmark for the oheroAct triage rules.
+
+Compiles ops_agent/triage_rules.json (with every rule enabled, including the examples that ship disabled) and
+evaluates it against the test-events corpus and synthetic variants spread over the packaged organization accounts.
+Reports compile time, events per second and how many events each rule matched, and fails below --min-eps.
+
+Usage (from the repo root, with oheroAct requirements installed):
+    python benchmark/rules_benchmark.py
+    python benchmark/rules_benchmark.py --events 50000 --min-eps 5000
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+
+from run_benchmark import handler_env, handler_dir, load_corpus, parse_detail
+
+detail_types = {'Health': ['Health.EventAdded', 'Health.EventUpdated'], 'SecHub': ['SecHub.EventAdded']}
+
+
+def synthetic_events(corpus, accounts):
+    """Corpus events re-targeted at every packaged account, with categories, statuses and workflow states varied."""
+    events = []
+    for (name, entry), account in itertools.product(corpus, accounts):
+        detail = parse_detail(entry)
+        if 'eventArn' in detail:
+            for category, status in [('plannedChange', 'upcoming'), ('scheduledChange', 'upcoming'), ('accountNotification', 'closed'), ('issue', 'open')]:
+                variant = dict(detail, affectedAccount=account['id'], eventTypeCategory=category, statusCode=status)
+                events.extend((detail_type, variant) for detail_type in detail_types['Health'])
+        else:
+            for workflow, label in [('NEW', 'HIGH'), ('SUPPRESSED', 'HIGH'), ('NEW', 'INFORMATIONAL')]:
+                finding = dict(detail['findings'][0], AwsAccountId=account['id'], Workflow={'Status': workflow}, Severity={'Label': label})
+                events.append(('SecHub.EventAdded', dict(detail, findings=[finding])))
+    return events
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=20000, help='number of rule evaluations to time')
+    parser.add_argument('--min-eps', type=float, default=1000.0, help='fail when throughput is below this many events per second')
+    args = parser.parse_args()
+
+    os.environ.update(handler_env)
+    sys.path.insert(0, handler_dir)
+    import rules
+    import org_index
+
+    with open(rules.rules_path, 'r') as f:
+        document = json.load(f)
+    for spec in document['rules']:
+        spec['enabled'] = True
+
+    started = time.perf_counter()
+    compiled = rules.compile_rules(document)
+    compile_ms = (time.perf_counter() - started) * 1000
+
+    # Packaged accounts plus a suspended one so the retired account rule is exercised
+    accounts = org_index.load_organization_data()['accounts']
+    accounts.append(dict(accounts[0], id='999999999999', name='retired-sandbox', status='SUSPENDED'))
+    org_index._org_index_cache = org_index.OrganizationIndex(accounts)
+    events = synthetic_events(load_corpus(), accounts)
+
+    matched = {rule.name: 0 for rule in compiled}
+    unmatched = 0
+    started = time.perf_counter()
+    for detail_type, detail in itertools.islice(itertools.cycle(events), args.events):
+        rule, _ = rules.match_rule(detail_type, detail, compiled)
+        if rule is None:
+            unmatched += 1
+        else:
+            matched[rule.name] += 1
+    elapsed = time.perf_counter() - started
+    events_per_second = args.events / elapsed
+
+    print(f"Rules: {len(compiled)} compiled in {compile_ms:.2f}ms, {len(events)} distinct events over {len(accounts)} accounts")
+    print(f"Evaluated {args.events} events in {elapsed * 1000:.1f}ms: {events_per_second:,.0f} events/s, {elapsed / args.events * 1e6:.1f}us per event")
+    for name, count in matched.items():
+        print(f"  {name:<36}{count:>8}")
+    print(f"  {'(unmatched, handled by the agent)':<36}{unmatched:>8}")
+
+    if events_per_second < args.min_eps:
+        print(f"Throughput below {args.min_eps:,.0f} events/s")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
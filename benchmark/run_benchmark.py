@@ -0,0 +1,543 @@
+"""
+Offline end-to-end benchmark for the oheroAct handler.
+
+Replays the test-events corpus through oheroAct/app.lambda_handler with Bedrock, the knowledge bases, DynamoDB,
+S3, EventBridge, Step Functions and the knowledge MCP server replaced by local stand-ins (see stubs.py), then
+reports per-stage wall time, prompt token sizes and peak RSS. Results are compared with benchmark/baselines.json
+and the run fails when a metric regresses beyond the tolerance.
+
+Usage (from the repo root, with oheroAct requirements installed):
+    python benchmark/run_benchmark.py                       # run and compare with baselines
+    python benchmark/run_benchmark.py --update-baselines    # record new baselines
+    python benchmark/run_benchmark.py --latency-scale 0     # measure framework overhead only
+    python benchmark/run_benchmark.py --model bedrock --cassette c.json --cassette-mode record   # record live Bedrock
+    python benchmark/run_benchmark.py --cassette c.json     # replay the recording offline, flagging prompt drift
+    python benchmark/run_benchmark.py --batch               # compare batched with one-by-one Health triage
+    python benchmark/run_benchmark.py --chat-turns 5        # replay a chat thread with and without the warm session cache
+"""
+import argparse
+import contextlib
+import glob
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+
+repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+handler_dir = os.path.join(repo_root, 'lambda', 'src', 'handlers', 'oheroAct')
+test_events_dir = os.path.join(repo_root, 'test-events')
+baselines_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+# Environment expected by the handler, set before it is imported
+handler_env = {
+    'AWS_REGION': 'us-east-1',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'benchmark',
+    'AWS_SECRET_ACCESS_KEY': 'benchmark',
+    'MEM_BUCKET': 'benchmark-mem',
+    'KNOWLEDGE_BUCKET': 'benchmark-knowledge',
+    'OPS_KNOWLEDGE_BASE_ID': 'OPSKB',
+    'SECHUB_KNOWLEDGE_BASE_ID': 'SECHUBKB',
+    'TICKET_TABLE': 'benchmark-tickets',
+    'TEAM_TABLE': 'benchmark-teams',
+    'EVENT_BUS_NAME': 'benchmark-bus',
+    'EVENT_SOURCE_NAME': 'ohero.ops-orchestration',
+    'EVENT_TABLE': 'benchmark-events',
+}
+
+teams = {'mgt01': 'C0MGT', 'fin01': 'C0FIN', 'sec01': 'C0SEC', 'inf01': 'C0INF', 'app01': 'C0APP'}
+
+# Same prompts the ai-integration state machine builds for the handler
+health_prompt = "Please handle the following event based on the event description within <eventDetails></eventDetails> tags. Start your final response with a brief summary of the reasons why you took the actions, then, if you created or updated any tickets, provide a short summary about the content/update. Use the EXACT callback token value within the <callbackToken></callbackToken> tags, the required EventPk value within <eventPk></eventPk> tags, and the EventLastUpdatedTime value within <eventLastUpdatedTime></eventLastUpdatedTime> tags. <eventDetails>{}</eventDetails>, <callbackToken>{}</callbackToken>, <eventPk>{}</eventPk>, <eventLastUpdatedTime>{}</eventLastUpdatedTime>"
+sechub_prompt = "Please handle the following security finding event based on the event description within <eventDetails></eventDetails> tags. Start your final response with a brief summary of the reasons why you took the actions, then, if you created or updated any tickets, provide a short summary about the content/update. Use the EXACT callback token value within the <callbackToken></callbackToken> tags, the required EventPk value within <eventPk></eventPk> tags, and the EventLastUpdatedTime value within <eventLastUpdatedTime></eventLastUpdatedTime> tags. <eventDetails>{}</eventDetails>, <callbackToken>{}</callbackToken>, <eventPk>{}</eventPk>, <eventLastUpdatedTime>{}</eventLastUpdatedTime>"
+
+# Metrics compared against baselines, counts must not grow, timings and sizes may grow within the tolerance
+count_metrics = ['llmCycles', 'toolCalls']
+tolerance_metrics = ['handlerMs', 'agentBuildMs', 'memoryLoadMs', 'persistenceMs', 'promptTokensMax', 'promptTokensTotal', 'peakRssMb']
+
+
+def load_corpus():
+    """Load test events as raw EventBridge entries, skipping the pretty-printed duplicates."""
+    entries = []
+    for path in sorted(glob.glob(os.path.join(test_events_dir, 'mockup-*.json'))):
+        if path.endswith('-pretty.json'):
+            continue
+        with open(path, 'r') as f:
+            for entry in json.load(f):
+                entries.append((os.path.basename(path)[:-len('.json')], entry))
+    return entries
+
+
+def parse_detail(entry):
+    """Decode the leading JSON object of an entry's Detail, tolerating trailing characters in hand-edited mockups."""
+    detail, _ = json.JSONDecoder().raw_decode(entry['Detail'].strip())
+    return detail
+
+
+def to_ai_integration_payload(name, entry, detail_type=None, detail=None):
+    """Translate a raw test event into the payload the ai-integration state machine sends to the handler."""
+    detail = detail or parse_detail(entry)
+    callback_token = f'benchmark-token-{name}'
+    event_context = None
+    if entry['DetailType'] == 'Security Hub Findings - Imported':
+        finding = detail['findings'][0]
+        event_pk = finding.get('ProductFields', {}).get('aws/securityhub/FindingId', finding.get('Id', ''))
+        text = sechub_prompt.format(json.dumps(detail), callback_token, event_pk, finding.get('LastObservedAt', ''))
+        detail_type = 'SecHub.EventAdded'
+        event_context = {'eventPk': event_pk, 'callbackToken': callback_token, 'eventLastUpdatedTime': finding.get('LastObservedAt', ''), 'eventDetail': detail}
+    else:
+        event_pk = f"{detail['eventArn']}~{detail.get('affectedAccount', '')}~{detail.get('eventRegion', '')}"
+        text = health_prompt.format(json.dumps(detail), callback_token, event_pk, detail.get('lastUpdatedTime', ''))
+        detail_type = detail_type or 'Health.EventAdded'
+        event_context = {'eventPk': event_pk, 'callbackToken': callback_token, 'eventLastUpdatedTime': detail.get('lastUpdatedTime', ''), 'eventDetail': detail}
+    payload = {
+        'detail-type': detail_type,
+        'detail': {
+            'event': {
+                'text': text
+            }
+        }
+    }
+    if event_context:
+        payload['detail']['event']['eventContext'] = event_context
+    return payload
+
+
+def to_health_update_payload(name, entry):
+    """Health.EventUpdated payload for a test event whose update only moved lastUpdatedTime."""
+    detail = parse_detail(entry)
+    if 'eventArn' not in detail:
+        return None
+    detail = dict(detail, lastUpdatedTime='2099-01-01T00:00:00Z')
+    return to_ai_integration_payload(name, entry, detail_type='Health.EventUpdated', detail=detail)
+
+
+def to_health_resolution_payload(name, entry):
+    """Health.EventUpdated payload for a test event whose pending affected entities were resolved, None without any."""
+    detail = parse_detail(entry)
+    entities = detail.get('affectedEntities', [])
+    if 'eventArn' not in detail or all(entity.get('statusCode') == 'RESOLVED' for entity in entities):
+        return None
+    detail = dict(detail, lastUpdatedTime='2099-01-02T00:00:00Z', affectedEntities=[dict(entity, statusCode='RESOLVED') for entity in entities])
+    return to_ai_integration_payload(name, entry, detail_type='Health.EventUpdated', detail=detail)
+
+
+def kb_documents(corpus):
+    import event_vectors
+
+    documents = []
+    for name, entry in corpus:
+        detail = parse_detail(entry)
+        metadata = {'source': name}
+        if 'eventArn' in detail:
+            # Attributes of the ingestion metadata sidecars (see ingestOpsKb), normalized as the local event index does
+            metadata.update(event_vectors.event_metadata(detail))
+        documents.append({'text': json.dumps(detail), 'metadata': metadata})
+    return documents
+
+
+class StageTimer:
+    """Wraps handler dependencies to time each stage of an invocation."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def wrap(self, stage, function):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.stages[stage] = self.stages.get(stage, 0.0) + (time.perf_counter() - started) * 1000
+        return timed
+
+    def reset(self):
+        self.stages = {}
+
+
+def install_stand_ins(latency, recorder, corpus, model='scripted'):
+    """Import the handler with stand-ins for every remote dependency, returns (app module, stage timer, hooks)."""
+    os.environ.update(handler_env)
+    os.environ.pop('ORG_DATA_BUCKET', None)
+    sys.path.insert(0, handler_dir)
+
+    import stubs
+
+    started = time.perf_counter()
+    import app
+    import agent_utils
+    import mcp_client
+    import aws_clients
+    import batch
+    import_ms = (time.perf_counter() - started) * 1000
+
+    dynamodb = stubs.FakeDynamoDB(latency, recorder, teams=teams)
+    dynamodb.seed_teams(handler_env['TEAM_TABLE'])
+
+    # Clients are created on first use, pre-populating the cache makes every module use the stand-ins
+    kb = stubs.FakeBedrockAgentRuntime(latency, recorder, kb_documents(corpus))
+    aws_clients._clients.update({
+        's3': stubs.FakeS3(latency, recorder),
+        'bedrock-agent-runtime': kb,
+        'bedrock-agent-runtime:retrieve': kb, # fail-fast client of search_ops_events
+        'dynamodb': dynamodb,
+        'stepfunctions': stubs.FakeStepFunctions(latency, recorder),
+        'events': stubs.FakeEventBridge(latency, recorder),
+    })
+
+    if model == 'scripted':
+        stubs.ScriptedModel.latency = latency
+        agent_utils.BedrockModel = stubs.ScriptedModel
+    stubs.FakeRemoteMCPClient.latency = latency
+    stubs.FakeRemoteMCPClient.recorder = recorder
+    mcp_client.RemoteMCPClient = stubs.FakeRemoteMCPClient
+
+    timer = StageTimer()
+    app.create_ops_agent = timer.wrap('agentBuildMs', agent_utils.create_ops_agent)
+    app.load_agent_memory = timer.wrap('memoryLoadMs', agent_utils.load_agent_memory)
+    app.save_knowledge = timer.wrap('persistenceMs', agent_utils.save_knowledge)
+    app.save_agent_memory = timer.wrap('persistenceMs', agent_utils.save_agent_memory)
+    batch.create_ops_agent = app.create_ops_agent
+    batch.save_knowledge = app.save_knowledge
+    batch.save_agent_memory = app.save_agent_memory
+
+    hooks = []
+
+    class BenchmarkHook(agent_utils.ContextVisualizationHook):
+        """Records model call timings and prompt sizes, and tool call timings when the SDK exposes tool hooks."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.model_calls = []
+            self.tool_calls = []
+            self._model_started = None
+            self._tools_started = {}
+            hooks.append(self)
+
+        def register_hooks(self, registry):
+            super().register_hooks(registry)
+            try:
+                from strands.hooks import BeforeToolCallEvent, AfterToolCallEvent
+            except ImportError:
+                from strands.hooks import BeforeToolInvocationEvent as BeforeToolCallEvent, AfterToolInvocationEvent as AfterToolCallEvent
+            registry.add_callback(BeforeToolCallEvent, self.on_before_tool_call)
+            registry.add_callback(AfterToolCallEvent, self.on_after_tool_call)
+
+        def on_before_model_call(self, event):
+            super().on_before_model_call(event)
+            agent = event.agent
+            prompt_tokens = stubs.estimate_tokens(agent.messages) + stubs.estimate_tokens(agent.system_prompt or '') + stubs.estimate_tokens(agent.tool_registry.get_all_tool_specs())
+            self._model_started = time.perf_counter()
+            self.model_calls.append({'agent': agent.name, 'promptTokens': prompt_tokens, 'startedAt': self._model_started})
+
+        def on_after_model_call(self, event):
+            super().on_after_model_call(event)
+            self.model_calls[-1]['durationMs'] = (time.perf_counter() - self._model_started) * 1000
+
+        def on_before_tool_call(self, event):
+            self._tools_started[event.tool_use['toolUseId']] = time.perf_counter()
+
+        def on_after_tool_call(self, event):
+            started = self._tools_started.pop(event.tool_use['toolUseId'], time.perf_counter())
+            self.tool_calls.append({'tool': event.tool_use['name'], 'startedAt': started, 'durationMs': (time.perf_counter() - started) * 1000})
+
+    app.ContextVisualizationHook = BenchmarkHook
+    batch.ContextVisualizationHook = BenchmarkHook
+    agent_utils.ContextVisualizationHook = BenchmarkHook
+
+    return app, timer, hooks, import_ms
+
+
+def run_event(app, timer, hooks, recorder, payload):
+    from stubs import LambdaContext, ScriptedModel
+
+    timer.reset()
+    ScriptedModel.usage_log.clear()
+    recorder.reset()
+    # hooks of cached agents (e.g. the research agent) stay registered across invocations, only their records reset
+    for hook in hooks:
+        hook.model_calls.clear()
+        hook.tool_calls.clear()
+    started = time.perf_counter()
+    response = app.lambda_handler(payload, LambdaContext())
+    handler_ms = (time.perf_counter() - started) * 1000
+
+    model_calls = sorted((call for hook in hooks for call in hook.model_calls), key=lambda call: call['startedAt'])
+    tool_calls = sorted((call for hook in hooks for call in hook.tool_calls), key=lambda call: call['startedAt'])
+    prompt_tokens = [call['promptTokens'] for call in model_calls] or [0]
+    return {
+        'handlerMs': handler_ms,
+        'agentBuildMs': timer.stages.get('agentBuildMs', 0.0),
+        'memoryLoadMs': timer.stages.get('memoryLoadMs', 0.0),
+        'persistenceMs': timer.stages.get('persistenceMs', 0.0),
+        'llmCycles': len(model_calls),
+        'llmCycleMs': [(call['agent'], round(call.get('durationMs', 0.0), 1)) for call in model_calls],
+        'toolCalls': len(tool_calls),
+        'toolMs': [(call['tool'], round(call['durationMs'], 1)) for call in tool_calls],
+        'promptTokensMax': max(prompt_tokens),
+        'promptTokensTotal': sum(prompt_tokens),
+        'cacheReadTokens': sum(usage.get('cacheReadInputTokens', 0) for usage in ScriptedModel.usage_log),
+        'cacheWriteTokens': sum(usage.get('cacheWriteInputTokens', 0) for usage in ScriptedModel.usage_log),
+        'uncachedTokens': sum(usage['inputTokens'] for usage in ScriptedModel.usage_log),
+        'serviceCalls': len(recorder.calls),
+        'peakRssMb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+        'memoryVersion': response.get('MemoryVersion') if isinstance(response, dict) else None,
+    }
+
+
+def to_batch_event(payloads):
+    """SQS event delivering queued ai-integration payloads to the handler in batch mode."""
+    return {
+        'Records': [
+            {'messageId': f'message-{i}', 'body': json.dumps({'taskToken': f'batch-task-{i}', 'payload': payload})}
+            for i, payload in enumerate(payloads)
+        ]
+    }
+
+
+def compare_batching(app, timer, hooks, recorder, corpus):
+    """Triage the Health events one by one and as one queued batch, returns the totals of both modes."""
+    import aws_clients
+
+    payloads = [to_ai_integration_payload(name, entry) for name, entry in corpus if 'eventArn' in parse_detail(entry)]
+    single = [run_event(app, timer, hooks, recorder, payload) for payload in payloads]
+
+    stepfunctions = aws_clients._clients['stepfunctions']
+    stepfunctions.outcomes.clear()
+    batched = run_event(app, timer, hooks, recorder, to_batch_event(payloads))
+    answered = {outcome['taskToken'] for outcome in stepfunctions.outcomes if outcome['taskToken'].startswith('batch-task-')}
+    acknowledged = {outcome['taskToken'] for outcome in stepfunctions.outcomes if outcome['taskToken'].startswith('benchmark-token-')}
+
+    totals = {'one-by-one': {}, 'batched': {}}
+    for key in ('handlerMs', 'llmCycles', 'toolCalls', 'promptTokensTotal'):
+        totals['one-by-one'][key] = sum(run[key] for run in single)
+        totals['batched'][key] = batched[key]
+    return len(payloads), totals, len(answered), len(acknowledged)
+
+
+def to_chat_payload(session_id, text, memory_version=None):
+    """Follow-up Slack message of an existing thread, as the ai-chat state machine passes it to the handler."""
+    item = {'AgentSessionID': {'S': session_id}}
+    if memory_version:
+        item['AgentMemoryVersion'] = {'S': memory_version}
+    return {
+        'detail-type': 'Chat.SlackMessageReceived',
+        'detail': {'event': {'text': text}},
+        'GetUserSession': {'Item': item}
+    }
+
+
+def compare_session_cache(app, timer, hooks, recorder, turns):
+    """
+    Replay a chat thread on a warm container (session cache kept), on containers that never served the thread
+    (cache cleared before each turn) and on a warm container whose session another container saved in between.
+    Returns memory load ms and downloaded memory bytes per turn for each scenario.
+    """
+    import aws_clients
+    from session_cache import session_cache
+
+    s3 = aws_clients._clients['s3']
+    scenarios = {}
+    for scenario in ('warm', 'cold', 'stale'):
+        session_id = f'benchmark-session-{scenario}'
+        memory_version = None
+        session_cache.clear()
+        loads = []
+        for turn in range(turns):
+            if scenario == 'cold':
+                session_cache.clear()
+            if scenario == 'stale' and turn:
+                # Another container served the previous turn: same object key, new version stored in the session item
+                key = (handler_env['MEM_BUCKET'], f'ops_agent-memory/{session_id}.json')
+                memory_version = s3.put_object(Bucket=key[0], Key=key[1], Body=s3.objects[key])['ETag']
+            downloaded = s3.downloaded_bytes
+            payload = to_chat_payload(session_id, f'Follow-up question {turn + 1} about the EKS upgrade', memory_version)
+            metrics = run_event(app, timer, hooks, recorder, payload)
+            memory_version = metrics['memoryVersion']
+            loads.append((metrics['memoryLoadMs'], s3.downloaded_bytes - downloaded, metrics['cacheReadTokens'], metrics['cacheWriteTokens'], metrics['uncachedTokens']))
+        scenarios[scenario] = loads
+    return scenarios
+
+
+def aggregate(runs):
+    """Median of each numeric metric across repeats, per-call lists are kept from the last run."""
+    result = dict(runs[-1])
+    for key, value in runs[-1].items():
+        if isinstance(value, (int, float)):
+            result[key] = round(statistics.median(run[key] for run in runs), 1)
+    return result
+
+
+def compare(results, baselines, tolerance, slack_ms):
+    regressions = []
+    for name, metrics in results.items():
+        baseline = baselines.get(name)
+        if not baseline:
+            continue
+        for key in count_metrics:
+            if key in baseline and metrics[key] > baseline[key]:
+                regressions.append(f'{name}: {key} {baseline[key]} -> {metrics[key]}')
+        for key in tolerance_metrics:
+            if key not in baseline:
+                continue
+            allowed = baseline[key] * (1 + tolerance) + (slack_ms if key.endswith('Ms') else 0)
+            if metrics[key] > allowed:
+                regressions.append(f'{name}: {key} {baseline[key]} -> {metrics[key]} (allowed {allowed:.1f})')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per event, the median is reported')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help='multiplier for all stand-in latencies, 0 disables them')
+    parser.add_argument('--model-latency-ms', type=int, help='latency of each model call')
+    parser.add_argument('--retrieve-latency-ms', type=int, help='latency of each knowledge base retrieve')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative growth of timing and size metrics')
+    parser.add_argument('--slack-ms', type=float, default=50.0, help='absolute allowance added to timing metrics')
+    parser.add_argument('--update-baselines', action='store_true', help='write results as the new baselines')
+    parser.add_argument('--events', nargs='*', help='only replay these test events, e.g. mockup-ops-event1')
+    parser.add_argument('--log', default=os.path.join(repo_root, 'bench_output.txt'), help='file receiving handler stdout')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--model', choices=['scripted', 'bedrock'], default='scripted', help='scripted stand-in or live Bedrock (for recording cassettes)')
+    parser.add_argument('--cassette', help='record model interactions into, or replay them from, this cassette file')
+    parser.add_argument('--cassette-mode', choices=['record', 'replay'], default='replay')
+    parser.add_argument('--cassette-latency-scale', type=float, default=1.0, help='multiplier for recorded model latencies on replay')
+    parser.add_argument('--replay-updates', action='store_true', help='replay each Health event as an update with only lastUpdatedTime changed, which should skip the agent, and as an update resolving its pending affected entities, which must not')
+    parser.add_argument('--batch', action='store_true', help='also triage the Health events as one queued batch and compare with one-by-one triage')
+    parser.add_argument('--chat-turns', type=int, default=0, help='also replay a chat thread of this many turns with and without the warm session cache')
+    parser.add_argument('--strict-cassette', action='store_true', help='fail on the first request that drifted from the cassette')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import stubs
+
+    latency = stubs.Latency(scale=args.latency_scale, model=args.model_latency_ms, retrieve=args.retrieve_latency_ms)
+    recorder = stubs.CallRecorder()
+    corpus = load_corpus()
+    if args.events:
+        corpus_to_run = [(name, entry) for name, entry in corpus if name in args.events]
+    else:
+        corpus_to_run = corpus
+
+    if args.cassette:
+        os.environ['MODEL_CASSETTE'] = os.path.abspath(args.cassette)
+        os.environ['MODEL_CASSETTE_MODE'] = args.cassette_mode
+        os.environ['MODEL_CASSETTE_LATENCY_SCALE'] = str(args.cassette_latency_scale)
+        os.environ['MODEL_CASSETTE_STRICT'] = str(args.strict_cassette).lower()
+
+    results = {}
+    updates = {}
+    resolutions = {}
+    with open(args.log, 'w') as log, contextlib.redirect_stdout(log):
+        app, timer, hooks, import_ms = install_stand_ins(latency, recorder, corpus, model=args.model)
+        for name, entry in corpus_to_run:
+            payload = to_ai_integration_payload(name, entry)
+            runs = [run_event(app, timer, hooks, recorder, payload) for _ in range(args.repeat)]
+            results[name] = aggregate(runs)
+            update_payload = to_health_update_payload(name, entry) if args.replay_updates else None
+            if update_payload:
+                updates[name] = run_event(app, timer, hooks, recorder, update_payload)
+            resolution_payload = to_health_resolution_payload(name, entry) if args.replay_updates else None
+            if resolution_payload:
+                resolutions[name] = run_event(app, timer, hooks, recorder, resolution_payload)
+        if args.batch:
+            batch_comparison = compare_batching(app, timer, hooks, recorder, corpus_to_run)
+        if args.chat_turns:
+            session_scenarios = compare_session_cache(app, timer, hooks, recorder, args.chat_turns)
+
+    print(f'Handler import: {import_ms:.1f}ms, latency scale: {args.latency_scale}, repeats: {args.repeat}')
+    print(f"{'event':<24}{'handler':>10}{'build':>8}{'memory':>8}{'persist':>9}{'cycles':>8}{'tools':>7}{'prompt max':>12}{'prompt sum':>12}{'rss MB':>8}")
+    for name, metrics in results.items():
+        print(f"{name:<24}{metrics['handlerMs']:>10.1f}{metrics['agentBuildMs']:>8.1f}{metrics['memoryLoadMs']:>8.1f}"
+              f"{metrics['persistenceMs']:>9.1f}{metrics['llmCycles']:>8}{metrics['toolCalls']:>7}"
+              f"{metrics['promptTokensMax']:>12}{metrics['promptTokensTotal']:>12}{metrics['peakRssMb']:>8.1f}")
+        print(f"{'':<24}cycles ms: {metrics['llmCycleMs']}")
+        print(f"{'':<24}tools ms: {metrics['toolMs']}")
+
+    cache_read, cache_write = sum(metrics['cacheReadTokens'] for metrics in results.values()), sum(metrics['cacheWriteTokens'] for metrics in results.values())
+    uncached = sum(metrics['uncachedTokens'] for metrics in results.values())
+    print(f'Prompt cache over the events: read {cache_read}, written {cache_write}, uncached {uncached} input tokens')
+
+    import prompts
+    modes = prompts.get_manifest()[0]
+    full_tokens = stubs.estimate_tokens(prompts.fallback_manifest()[0][prompts.fallback_mode].template)
+    print(f'Prompt modes (full prompt ~{full_tokens} tokens):')
+    print(f"  {'mode':<14}{'system':>9}{'tools':>7}{'tool specs':>12}{'total':>8}")
+    for mode_name, mode in modes.items():
+        system_tokens = stubs.estimate_tokens(mode.system_prompt(False))
+        spec_tokens = stubs.estimate_tokens([tool.tool_spec for tool in mode.tools])
+        print(f"  {mode_name:<14}{system_tokens:>9}{len(mode.tools):>7}{spec_tokens:>12}{system_tokens + spec_tokens:>8}")
+
+    import aws_clients
+    returned =aws_clients._clients['bedrock-agent-runtime'].returned
+    if returned:
+        results_per_call = sum(count for _, count, _ in returned) / len(returned)
+        tokens_per_call = sum(size for _, _, size in returned) / len(returned) // 4
+        depths = {depth: sum(1 for requested, _, _ in returned if requested == depth) for depth in sorted({requested for requested, _, _ in returned})}
+        print(f'Knowledge base retrieves: {len(returned)}, {results_per_call:.1f} results and ~{tokens_per_call:.0f} tokens per call, calls by requested depth {depths}')
+
+    if updates:
+        skipped = [name for name, metrics in updates.items() if metrics['llmCycles'] == 0]
+        saved = sum(results[name]['promptTokensTotal'] for name in skipped)
+        print(f'Unchanged Health updates: {len(skipped)}/{len(updates)} skipped the agent, ~{saved} prompt tokens saved')
+        for name, metrics in updates.items():
+            print(f"  - {name}: {'skipped' if name in skipped else 'processed'} in {metrics['handlerMs']:.1f}ms")
+    # Updates that resolve affected entities are material, the agent has to see them
+    wrongly_skipped = [name for name, metrics in resolutions.items() if metrics['llmCycles'] == 0]
+    if resolutions:
+        print(f'Health updates resolving affected entities: {len(resolutions) - len(wrongly_skipped)}/{len(resolutions)} processed by the agent')
+
+    if args.batch:
+        count, totals, answered, acknowledged = batch_comparison
+        print(f'Health triage of {count} events, one by one and as one queued batch ({answered}/{count} waiting tasks answered, {acknowledged}/{count} events acknowledged):')
+        print(f"  {'mode':<12}{'handler ms':>12}{'ms/event':>10}{'cycles':>8}{'tools':>7}{'prompt tokens':>15}{'tokens/event':>14}")
+        for mode, metrics in totals.items():
+            print(f"  {mode:<12}{metrics['handlerMs']:>12.1f}{metrics['handlerMs'] / count:>10.1f}{metrics['llmCycles']:>8}{metrics['toolCalls']:>7}"
+                  f"{metrics['promptTokensTotal']:>15}{metrics['promptTokensTotal'] // count:>14}")
+
+    if args.chat_turns:
+        print(f'Chat thread of {args.chat_turns} turns, memory load ms / downloaded KB per turn:')
+        for scenario, loads in session_scenarios.items():
+            print(f"  {scenario:<6}" + ''.join(f'{ms:>9.1f}/{downloaded / 1024:<6.1f}' for ms, downloaded, *_ in loads))
+        print('Prompt cache tokens per turn of the warm thread, read/written/uncached:')
+        print('  ' + ''.join(f"{read:>8}/{write}/{uncached:<8}" for *_, read, write, uncached in session_scenarios['warm']))
+
+    if args.cassette:
+        import cassette_model
+        cassette = cassette_model.get_cassette()
+        print(f'Cassette {args.cassette_mode}: {len(cassette.interactions)} interactions, {len(cassette.drift)} drifted requests')
+        for drift in cassette.drift:
+            print(f"  - request #{drift['position'] + 1} ({drift['model_id']}): {drift['request']} recorded as {drift['recorded_request']}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'importMs': import_ms, 'events': results}, f, indent=2)
+
+    if args.update_baselines:
+        baselines = {name: {key: metrics[key] for key in count_metrics + tolerance_metrics} for name, metrics in results.items()}
+        with open(baselines_path, 'w') as f:
+            json.dump(baselines, f, indent=2)
+        print(f'Baselines written to {baselines_path}')
+        return 0
+
+    if not os.path.exists(baselines_path):
+        print('No baselines recorded yet, run with --update-baselines to create them')
+        return 0
+
+    with open(baselines_path, 'r') as f:
+        baselines = json.load(f)
+    regressions = compare(results, baselines, args.tolerance, args.slack_ms)
+    regressions += [f'{name}: update resolving affected entities was skipped as unchanged' for name in wrongly_skipped]
+    if regressions:
+        print('REGRESSIONS:')
+        for regression in regressions:
+            print(f'  - {regression}')
+        return 1
+    print('No regressions against baselines')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -128,6 +128,7 @@ const opsHealthAgentStack = new OpsHealthAgentStack(app, 'OheroHealthAgentStack'
   },
   opsHealthBucketName: statefulStack.opsHealthBucket.bucketName,
   opsSecHubBucketName: statefulStack.secFindingsBucket.bucketName,
+  opsEventLakeBucketName: statefulStack.opsEventLakeBucket.bucketName,
   transientPayloadsBucketName: statefulStack.transientPayloadsBucket.bucketName,
   slackChannelId: process.env.SLACK_CHANNEL_ID as string,
   slackAccessToken: process.env.SLACK_ACCESS_TOKEN as string,
@@ -137,6 +138,7 @@ const opsHealthAgentStack = new OpsHealthAgentStack(app, 'OheroHealthAgentStack'
   sourceEventDomains: sourceEventDomains,
   appEventDomainPrefix: appEventDomainPrefix,
   teamManagementTableName: statefulStack.teamManagementTable.tableName,
+  healthTriageBatching: process.env.HEALTH_TRIAGE_BATCHING === 'true'
 });
 
 // Web Frontend Stack - only deploy if webchat notification channel is enabled
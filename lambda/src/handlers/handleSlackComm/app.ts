@@ -2,6 +2,7 @@ import { APIGatewayProxyEventV2 } from "aws-lambda"
 import { STSClient, GetCallerIdentityCommand } from "@aws-sdk/client-sts"
 import { EventBridgeClient, PutEventsCommand } from "@aws-sdk/client-eventbridge"
 import { PutObjectCommand, S3Client } from '@aws-sdk/client-s3';
+import { gzipSync } from 'zlib';
 import { fromNodeProviderChain } from "@aws-sdk/credential-providers";
 import { WebClient } from '@slack/web-api';
 
@@ -90,9 +91,10 @@ const dispatchRequest = async (requestParams: any): Promise<ApiGwResponse> => {
 
   // if the event detail payload is larger than 200k, store it in s3 and pass the key instead
   if (Buffer.byteLength(JSON.stringify(requestParams)) > 200000) {
-    const key = `ops-event-payloads/${requestParams.event.channel}-${requestParams.event.thread_ts}`
+    const key = `ops-event-payloads/${requestParams.event.channel}-${requestParams.event.thread_ts}.json.gz`
     const s3 = new S3Client();
-    const params = { Bucket: process.env.PAYLOAD_BUCKET, Key: key, Body: JSON.stringify(requestParams) };
+    // stored compressed, oheroAct decompresses payloads with gzip content encoding
+    const params = { Bucket: process.env.PAYLOAD_BUCKET, Key: key, Body: gzipSync(JSON.stringify(requestParams)), ContentType: 'application/json', ContentEncoding: 'gzip' };
     await s3.send(new PutObjectCommand(params));
     requestParams.event.text = ''
     requestParams.event.payloadS3Key = key
@@ -2,6 +2,7 @@ import { APIGatewayProxyEventV2 } from "aws-lambda"
 import { STSClient, GetCallerIdentityCommand } from "@aws-sdk/client-sts"
 import { EventBridgeClient, PutEventsCommand } from "@aws-sdk/client-eventbridge"
 import { PutObjectCommand, S3Client } from '@aws-sdk/client-s3';
+import { gzipSync } from 'zlib';
 import { DynamoDBClient, GetItemCommand, PutItemCommand, DeleteItemCommand, ScanCommand } from '@aws-sdk/client-dynamodb';
 import { ApiGatewayManagementApiClient, PostToConnectionCommand } from '@aws-sdk/client-apigatewaymanagementapi';
 import { fromNodeProviderChain } from "@aws-sdk/credential-providers";
@@ -189,12 +190,15 @@ const dispatchWebChatMessage = async (webChatEvent: WebChatEvent): Promise<ApiGw
 
     // Handle large payloads by storing in S3 (similar to Slack handler)
     if (Buffer.byteLength(eventDetail) > 200000) {
-      const key = `ops-event-payloads/webchat-${connectionId}-${Date.now()}`;
+      const key = `ops-event-payloads/webchat-${connectionId}-${Date.now()}.json.gz`;
       const s3 = new S3Client({ credentials: credentialProvider });
+      // Stored compressed, oheroAct decompresses payloads with gzip content encoding
       const params = {
         Bucket: process.env.PAYLOAD_BUCKET,
         Key: key,
-        Body: eventDetail
+        Body: gzipSync(eventDetail),
+        ContentType: 'application/json',
+        ContentEncoding: 'gzip'
       };
       await s3.send(new PutObjectCommand(params));
 
@@ -5,20 +5,82 @@ import {
   StartIngestionJobCommandInput,
   StartIngestionJobCommandOutput,
 } from '@aws-sdk/client-bedrock-agent';
+import { GetObjectCommand, PutObjectCommand, S3Client } from '@aws-sdk/client-s3';
 
 import { v4 as uuid } from 'uuid';
 
 const client = new BedrockAgentClient();
+const s3 = new S3Client();
+
+// Bedrock knowledge bases read the metadata attributes of a document from a sidecar object named <key>.metadata.json
+const metadataSuffix = '.metadata.json';
+
+// Metadata attributes of a Health event document, search_ops_events filters on them.
+// Times are epoch seconds so they can be range filtered, service and status are normalized to the case the tool uses.
+const healthEventMetadata = (document: any): Record<string, string | number> | undefined => {
+  const detail = document?.detail ?? document;
+  if (!detail?.eventArn) {
+    return undefined;
+  }
+  const attributes: Record<string, string | number> = {
+    eventArn: detail.eventArn,
+    service: String(detail.service ?? '').toUpperCase(),
+    eventTypeCode: detail.eventTypeCode ?? '',
+    eventRegion: detail.eventRegion ?? '',
+    affectedAccount: detail.affectedAccount ?? '',
+    statusCode: String(detail.statusCode ?? '').toLowerCase(),
+  };
+  for (const field of ['startTime', 'endTime', 'lastUpdatedTime']) {
+    const time = Date.parse(detail[field]);
+    if (!isNaN(time)) {
+      attributes[field] = Math.floor(time / 1000);
+    }
+  }
+  // Empty values cannot be filtered on, they are left out
+  return Object.fromEntries(Object.entries(attributes).filter(([, value]) => value !== ''));
+}
+
+const writeMetadataSidecars = async (bucket: string, keys: string[]): Promise<void> => {
+  for (const key of keys) {
+    try {
+      const object = await s3.send(new GetObjectCommand({ Bucket: bucket, Key: key }));
+      const metadataAttributes = healthEventMetadata(JSON.parse(await object.Body!.transformToString()));
+      if (!metadataAttributes) {
+        continue;
+      }
+      await s3.send(new PutObjectCommand({
+        Bucket: bucket,
+        Key: `${key}${metadataSuffix}`,
+        Body: JSON.stringify({ metadataAttributes }),
+        ContentType: 'application/json'
+      }));
+    } catch (error) {
+      // A document without metadata is still searchable, only not by the tool filters
+      console.log(`Skipping metadata of s3://${bucket}/${key}: `, error)
+    }
+  }
+}
 
 export const lambdaHandler = async (event: EventBridgeEvent<string, any>, context: Context): Promise<void> => {
   console.log("Incoming event: ", JSON.stringify(event, null, 2))
 
   const sourceBucketName = JSON.parse(event.Records[0].body).detail.bucket.name
+  const objectKeys: string[] = event.Records
+    .map((record: any) => JSON.parse(record.body).detail)
+    .filter((detail: any) => detail.bucket.name === sourceBucketName)
+    .map((detail: any) => detail.object?.key ?? '')
   let knowledgeBaseId = ''
   let dataSourceId = ''
   if (sourceBucketName.includes('ops-health')) {
     knowledgeBaseId = process.env.HEALTH_KNOWLEDGE_BASE_ID as string;
     dataSourceId = process.env.HEALTH_KB_DATA_SOURCE_ID as string;
+
+    // Sidecars written below arrive here as well, the ingestion job started with them already includes them
+    if (objectKeys.every((key) => key.endsWith(metadataSuffix))) {
+      console.log("Only metadata sidecars changed, skipping ingestion")
+      return
+    }
+    await writeMetadataSidecars(sourceBucketName, objectKeys.filter((key) => key.endsWith('.json') && !key.endsWith(metadataSuffix)));
   }
   if (sourceBucketName.includes('sec-findings')) {
     knowledgeBaseId = process.env.SECHUB_KNOWLEDGE_BASE_ID as string;
@@ -36,4 +98,4 @@ export const lambdaHandler = async (event: EventBridgeEvent<string, any>, contex
   console.log("Agent response: ", JSON.stringify(response, null, 2))
 
   // void return means the batch will always complete successfully and delete the messages from the SQS queue
-}
\ No newline at end of file
+}
@@ -0,0 +1,112 @@
+# ============================================================================
+# Adaptive result depth of knowledge base searches
+# ============================================================================
+# A search starts with KB_INITIAL_RESULTS results and asks again at the tool's maximum depth only when the results look
+# ambiguous: the scores are flat (the last result scores within KB_SCORE_GAP of the best one, so equally relevant
+# documents probably rank just below) and the results cover enough distinct keys (e.g. events) that a wider search adds
+# new ones rather than more copies of the same (at least KB_MIN_KEY_COVERAGE distinct keys per result). Every retrieve
+# starts over, so a search widens at most once instead of doubling its depth step by step. Sources that keep many
+# records in one document (the Security Hub CSV export) key results by their content instead of the source document,
+# otherwise every result of them counts as a copy of the first. It also stops
+# at the tool's maximum depth, when the knowledge base has no more matches, or when the results reach the per-call
+# token budget (KB_RESULT_TOKEN_BUDGET, results beyond it are dropped). The chosen depth and stopping reason are
+# logged and published as metrics to tune the policy.
+import os
+import time
+from metrics import emit_retrieval_metrics
+
+initial_results = int(os.environ.get('KB_INITIAL_RESULTS', '5'))
+score_gap = float(os.environ.get('KB_SCORE_GAP', '0.05'))
+min_key_coverage = float(os.environ.get('KB_MIN_KEY_COVERAGE', '0.5'))
+result_token_budget = int(os.environ.get('KB_RESULT_TOKEN_BUDGET', '6000'))
+
+# Metadata attribute Bedrock sets to the source document of a chunk
+source_uri_key = 'x-amz-bedrock-kb-source-uri'
+
+
+def estimate_tokens(text):
+    """Rough token estimate, ~4 characters per token."""
+    return len(text) // 4
+
+
+def result_key(result, key_fields):
+    """Values of the key fields of a result, its source document or text without them."""
+    metadata = result.get('metadata') or {}
+    key = tuple(metadata.get(field) for field in key_fields)
+    if any(key):
+        return key
+    return metadata.get(source_uri_key) or result['content']['text']
+
+
+def stop_reason(results, number_of_results, max_results, tokens, key):
+    """Why a search with these results should not be widened, None when it should."""
+    if len(results) < number_of_results:
+        return 'exhausted'
+    if tokens >= result_token_budget:
+        return 'token_budget'
+    if number_of_results >= max_results:
+        return 'max_results'
+    scores = [result.get('score', 0.0) for result in results]
+    if scores[0] - scores[-1] >= score_gap:
+        return 'confident'
+    keys = {key(result) for result in results}
+    if len(keys) < len(results) * min_key_coverage:
+        return 'redundant'
+    return None
+
+
+def within_budget(results):
+    """Leading results that fit the token budget, at least the first one."""
+    kept = []
+    tokens = 0
+    for result in results:
+        tokens += estimate_tokens(result['content']['text'])
+        if kept and tokens > result_token_budget:
+            break
+        kept.append(result)
+    return kept
+
+
+def retrieve_adaptive(client, tool_name, knowledge_base_id, query, vector_search_configuration, max_results, key_fields=(source_uri_key,), key=None):
+    """
+    Knowledge base retrieve results of a query with adaptive depth, up to max_results. The vector search configuration
+    is passed on as is, apart from numberOfResults. Results are told apart by key, a function of a result, or by their
+    key fields without one. Errors of the first retrieve are raised, errors of the wider one keep the results of the
+    first retrieve.
+    """
+    key = key or (lambda result: result_key(result, key_fields))
+    started = time.perf_counter()
+    number_of_results = min(initial_results, max_results)
+    results = []
+    calls = 0
+    while True:
+        try:
+            response = client.retrieve(
+                knowledgeBaseId=knowledge_base_id,
+                retrievalQuery={
+                    'text': query
+                },
+                retrievalConfiguration={
+                    'vectorSearchConfiguration': dict(vector_search_configuration, numberOfResults=number_of_results)
+                }
+            )
+        except Exception as e:
+            if not calls:
+                raise
+            print(f"✗ Widening {tool_name} to {number_of_results} results failed: {str(e)}")
+            number_of_results = len(results)
+            reason = 'error'
+            break
+        calls += 1
+        results = response['retrievalResults']
+        tokens = sum(estimate_tokens(result['content']['text']) for result in results)
+        reason = stop_reason(results, number_of_results, max_results, tokens, key)
+        if reason:
+            break
+        number_of_results = max_results
+
+    results = within_budget(results)
+    tokens = sum(estimate_tokens(result['content']['text']) for result in results)
+    print(f"ℹ {tool_name} retrieved {len(results)} results (~{tokens} tokens) at depth {number_of_results} after {calls} calls, stopped: {reason}")
+    emit_retrieval_metrics(tool_name, reason, number_of_results, len(results), tokens, calls, (time.perf_counter() - started) * 1000)
+    return results
@@ -1,19 +1,17 @@
 from strands import Agent
-import boto3
 from strands.models import BedrockModel
 from strands.hooks import HookProvider, HookRegistry, BeforeModelCallEvent, AfterModelCallEvent
 import json, os
 from datetime import datetime
-from tools import (
-    search_ops_events,
-    search_sec_findings,
-    acknowledge_event,
-    create_ticket,
-    update_ticket,
-    search_tickets_by_event_key,
-    ask_aws
-)
+from prompts import get_mode
 from botocore.config import Config
+from cassette_model import with_cassette
+from prompt_cache import cache_config, with_cache_checkpoints
+from budget import BudgetHook, agent_max_cycles, research_agent_max_cycles
+from tracing import start_span, set_span_error, instrument_client
+from aws_clients import get_client, get_boto_session, session_lock
+from session_cache import session_cache
+from botocore.exceptions import ClientError
 
 # custom boto3 retry config to be used by Bedrock calls
 retry_config = Config(
@@ -25,68 +23,59 @@ retry_config = Config(
 
 mem_bucket = os.environ['MEM_BUCKET']
 knowledge_bucket = os.environ['KNOWLEDGE_BUCKET']
-s3_client = boto3.client('s3')
+# Preferred model of the ops agent, the model router may start a task on a lighter one (model_router.py)
+ops_agent_model_idx = int(os.environ.get('OPS_AGENT_MODEL_IDX', '2'))
+
+# Models of ResilientAgent in fallback order, model indexes (OPS_AGENT_MODEL_IDX, model routes) point into this list
+supported_model_ids = [
+    "us.amazon.nova-pro-v1:0", # 4698ms
+    "us.anthropic.claude-haiku-4-5-20251001-v1:0", # 8642ms
+    "global.anthropic.claude-sonnet-4-20250514-v1:0", # 13984ms
+    "us.anthropic.claude-3-7-sonnet-20250219-v1:0", # 13984ms
+    "global.anthropic.claude-sonnet-4-5-20250929-v1:0", # 22273ms
+]
 
 class ResilientAgent(Agent):
     """Overridden Agent with automatic model fallback and retry logic."""
 
     def __init__(self, model_idx=0, max_retries_per_model=2, retry_delay=2.0,
-                 enable_cache_prompt=False, enable_cache_tools=False, **kwargs):
-
-        self.supported_models = [
-            BedrockModel(
-                model_id="us.amazon.nova-pro-v1:0",
-                temperature=0.0,
-                streaming=False,
-                # boto_session=session,
-                boto_client_config=retry_config,
-                cache_prompt="default" if enable_cache_prompt else None
-            ), # 4698ms
-            BedrockModel(
-                model_id="us.anthropic.claude-haiku-4-5-20251001-v1:0",
-                temperature=0.0,
-                # max_tokens=2048,
-                streaming=False,
-                # boto_session=session,
-                boto_client_config=retry_config,
-                cache_prompt="default" if enable_cache_prompt else None,
-                cache_tools="default" if enable_cache_tools else None
-            ), # 8642ms
-            BedrockModel(
-                model_id="global.anthropic.claude-sonnet-4-20250514-v1:0",
-                temperature=0.0,
-                # max_tokens=2048,
-                streaming=False,
-                # boto_session=session,
-                boto_client_config=retry_config,
-                cache_prompt="default" if enable_cache_prompt else None,
-                cache_tools="default" if enable_cache_tools else None
-            ), # 13984ms
-            BedrockModel(
-                model_id="us.anthropic.claude-3-7-sonnet-20250219-v1:0",
-                temperature=0.0,
-                # max_tokens=2048,
-                streaming=False,
-                # boto_session=session,
-                boto_client_config=retry_config,
-                cache_prompt="default" if enable_cache_prompt else None,
-                cache_tools="default" if enable_cache_tools else None
-            ), # 13984ms
-            BedrockModel(
-                model_id="global.anthropic.claude-sonnet-4-5-20250929-v1:0",
-                temperature=0.0,
-                # max_tokens=2048,
-                streaming=False,
-                # boto_session=session,
-                boto_client_config=retry_config,
-                cache_prompt="default" if enable_cache_prompt else None,
-                cache_tools="default" if enable_cache_tools else None
-            ), # 22273ms
-        ]
+                 enable_cache_prompt=False, enable_cache_tools=False, max_cycles=agent_max_cycles, **kwargs):
+
+        # All models share the container's boto3 session, building a Bedrock client from it takes a few ms instead of a new session per model
+        with session_lock:
+            session = get_boto_session()
+            self.supported_models = [
+                BedrockModel(
+                    model_id=model_id,
+                    temperature=0.0,
+                    streaming=False,
+                    boto_session=session,
+                    boto_client_config=retry_config,
+                    # Cache points after the tool definitions and system prompt, as the model family supports them
+                    **cache_config(model_id, enable_cache_prompt, enable_cache_tools)
+                )
+                for model_id in supported_model_ids
+            ]
+
+        # Cache points at the end of the restored history and of the latest user message (prompt_cache.py)
+        self.supported_models = with_cache_checkpoints(self.supported_models, enable_cache_prompt)
+
+        # Record or replay model interactions when a cassette is configured (MODEL_CASSETTE)
+        self.supported_models = with_cassette(self.supported_models)
+
+        # Bedrock API calls appear as child spans of the Strands model invocation spans (TRACE_EXPORT)
+        for model in self.supported_models:
+            instrument_client(getattr(model, 'client', None))
 
         self.model_idx = model_idx
         self.max_retries_per_model = max_retries_per_model
         self.retry_delay = retry_delay
+        self.retry_count = 0 # same model retries, reported in agent metrics
+        self.fallback_count = 0 # switches to a fallback model, reported in agent metrics
+
+        # Cycle limit and time budget of every invocation (budget.py), the handler sets the budget per invocation
+        self.budget_hook = BudgetHook(max_cycles)
+        kwargs['hooks'] = list(kwargs.get('hooks') or []) + [self.budget_hook]
 
         primary = self.supported_models[model_idx]
         super().__init__(model=primary, **kwargs)
@@ -95,6 +84,10 @@ class ResilientAgent(Agent):
         """
         Override invoke_async method with retry-then-fallback logic.
         """
+        with start_span("ResilientAgent.invoke_async", **{"gen_ai.agent.name": self.name}) as span:
+            return await self._invoke_with_fallback(span, prompt, **kwargs)
+
+    async def _invoke_with_fallback(self, span, prompt=None, **kwargs):
         import asyncio
         last_error = None
 
@@ -109,21 +102,35 @@ class ResilientAgent(Agent):
                 try:
                     self.model = model
 
+                    if retry_attempt > 0:
+                        self.retry_count += 1
+                    elif model_offset > 0:
+                        self.fallback_count += 1
+
                     if model_offset > 0 or retry_attempt > 0:
                         print(f"[Retry] Model {model_offset + 1}/{len(self.supported_models)}, "
                               f"Attempt {retry_attempt + 1}/{self.max_retries_per_model}: {model_id}")
 
+                    span.add_event("model_attempt", {"gen_ai.request.model": model_id, "ohero.attempt": retry_attempt + 1})
                     result = await super().invoke_async(prompt, **kwargs)
 
                     if model_offset > 0 or retry_attempt > 0:
                         print(f"[Success] ✓ {model_id}")
 
+                    span.set_attribute("gen_ai.request.model", model_id)
                     return result
 
                 except Exception as e:
                     last_error = e
                     error_type = type(e).__name__
                     print(f"[Failed] ✗ {model_id}: {error_type}")
+                    span.add_event("model_failed", {"gen_ai.request.model": model_id, "error.type": error_type})
+
+                    # Retries and fallbacks would run past the deadline, the error is raised as is
+                    if self.budget_hook.active_budget.exhausted():
+                        print(f"[Error] Time budget used up, not retrying: {error_type}")
+                        set_span_error(span, f"Time budget used up: {error_type}")
+                        raise
 
                     if retry_attempt < self.max_retries_per_model - 1:
                         print(f"[Wait] Retrying in {self.retry_delay}s...")
@@ -138,6 +145,7 @@ class ResilientAgent(Agent):
 
         # All models and retries exhausted
         print(f"[Error] All models exhausted. Last error: {type(last_error).__name__}")
+        set_span_error(span, f"All models exhausted: {type(last_error).__name__}")
         raise last_error
 
 class ContextVisualizationHook(HookProvider):
@@ -264,62 +272,20 @@ class ContextVisualizationHook(HookProvider):
         print("\n" + "=" * 80 + "\n")
 
 
-def create_ops_agent(hook, conversational) -> ResilientAgent:
-    """Create the OpsAgent with operational tools."""
-    # Load system prompt from modular files
-    prompts_dir = os.path.join(os.path.dirname(__file__), "ops_agent")
-
-    # Load the system.md file
-    system_md_path = os.path.join(prompts_dir, "system.md")
-    with open(system_md_path, 'r') as f:
-        system_content = f.read()
-
-    # Check if component files exist
-    component_files = {
-        "references.md": "",
-        "organization_data.md": "",
-        "acknowledge.md": "",
-        "consult.md": "",
-        "triage.md": ""
-    }
-
-    # Load each component file
-    for filename in component_files.keys():
-        try:
-            filepath = os.path.join(prompts_dir, filename)
-            with open(filepath, 'r') as f:
-                component_files[filename] = f.read()
-        except Exception as e:
-            print(f"Error loading {filename}: {str(e)}")
-            component_files[filename] = f"[ERROR: Could not load {filename}]"
-
-    # Replace placeholders with file contents
-    for filename, content in component_files.items():
-        placeholder = f"{{{{import:{filename}}}}}"
-        if placeholder in system_content:
-            system_content = system_content.replace(placeholder, content)
-
-    # Replace other placeholders with actual values
-    system_content = system_content.replace("{{currentDateTime}}", datetime.now().isoformat())
-    system_content = system_content.replace("{{USER_INTERACTION_ALLOWED_SETTING}}", str(conversational))
+def create_ops_agent(hook, conversational, mode=None) -> ResilientAgent:
+    """Create the OpsAgent with the system prompt and tools of a prompt mode (see prompts.py)."""
+    prompt_mode = get_mode(mode)
 
     return ResilientAgent(
         name="ops_agent",
-        model_idx=2, # points to the preferred model in list of supported models
+        model_idx=ops_agent_model_idx, # points to the preferred model in list of supported models
         enable_cache_prompt=True,
+        enable_cache_tools=True,
         description="Handles operational events and creates tickets",
         hooks=[hook],
         callback_handler=None,
-        system_prompt = system_content,
-        tools=[
-            search_ops_events,
-            search_sec_findings,
-            acknowledge_event,
-            create_ticket,
-            update_ticket,
-            search_tickets_by_event_key,
-            ask_aws
-        ]
+        system_prompt = prompt_mode.system_prompt(conversational),
+        tools=prompt_mode.tools
     )
 
 
@@ -339,6 +305,7 @@ def create_research_agent(hook, mcp_client) -> ResilientAgent:
     return ResilientAgent(
         name="research_agent",
         model_idx=0, # points to the preferred model in list of supported models
+        max_cycles=research_agent_max_cycles,
         enable_cache_prompt=True,
         enable_cache_tools=True,
         description="Provides technical research and recommendations using knowledge tools",
@@ -349,24 +316,45 @@ def create_research_agent(hook, mcp_client) -> ResilientAgent:
     )
 
 
-def load_agent_memory(agent, session_id: str):
-    """Load agent conversation history from S3."""
+def load_agent_memory(agent, session_id: str, memory_version: str = None):
+    """
+    Load agent conversation history from S3, or from the warm session cache when it holds the current version.
+    memory_version is the version the previous turn saved (from the chat session item), when it matches the cached
+    version S3 is not called at all, otherwise a conditional GET only downloads the memory when S3 holds a newer one.
+    """
 
     s3_key = f"{agent.name}-memory/{session_id}.json"
+    cached = session_cache.get(s3_key)
 
     try:
-        response = s3_client.get_object(Bucket=mem_bucket, Key=s3_key)
-        json_content = response['Body'].read().decode('utf-8')
-        messages = json.loads(json_content)
+        if cached and memory_version and cached[0] == memory_version:
+            content = cached[1]
+            source = 'warm session cache'
+        else:
+            request = {'Bucket': mem_bucket, 'Key': s3_key}
+            if cached:
+                request['IfNoneMatch'] = cached[0]
+            try:
+                response = get_client('s3').get_object(**request)
+                content = response['Body'].read()
+                session_cache.put(s3_key, response.get('ETag'), content)
+                source = 'S3'
+            except ClientError as e:
+                if not cached or e.response.get('Error', {}).get('Code') not in ('304', 'NotModified'):
+                    raise
+                content = cached[1]
+                source = 'warm session cache (S3 version unchanged)'
+        messages = json.loads(content.decode('utf-8'))
 
         agent.messages.extend(messages)
 
-        print(f"✓ Agent memory loaded from S3: s3://{mem_bucket}/{s3_key}")
+        print(f"✓ Agent memory loaded from {source}: s3://{mem_bucket}/{s3_key}")
         print(f"  - Agent: {agent.name}")
         print(f"  - Messages loaded: {len(messages)}")
         return s3_key
 
-    except s3_client.exceptions.NoSuchKey:
+    except get_client('s3').exceptions.NoSuchKey:
+        session_cache.discard(s3_key)
         print(f"ℹ No existing memory found for {agent.name} (session: {session_id})")
         return None
     except Exception as e:
@@ -385,12 +373,15 @@ def save_agent_memory(agent, session_id: str):
     json_content = json.dumps(complete_history, indent=2)
 
     try:
-        s3_client.put_object(
+        body = json_content.encode('utf-8')
+        response = get_client('s3').put_object(
             Bucket=mem_bucket,
             Key=s3_key,
-            Body=json_content.encode('utf-8'),
+            Body=body,
             ContentType='application/json'
         )
+        # The next turn of the session on this container only checks that S3 still holds this version
+        session_cache.put(s3_key, response.get('ETag'), body)
         print(f"✓ Agent memory saved to S3: s3://{mem_bucket}/{s3_key}")
         print(f"  - Agent: {agent.name}")
         print(f"  - Messages: {len(complete_history)}")
@@ -400,6 +391,12 @@ def save_agent_memory(agent, session_id: str):
         return None
 
 
+def memory_version(agent, session_id: str):
+    """Version (S3 ETag) of the agent memory this container last saved or loaded for the session, empty when unknown."""
+    cached = session_cache.get(f"{agent.name}-memory/{session_id}.json")
+    return cached[0] if cached else ""
+
+
 def save_knowledge(agent, result, task: str, session_id: str):
     """Save agent execution results to console and S3 as markdown."""
 
@@ -539,7 +536,7 @@ def save_knowledge(agent, result, task: str, session_id: str):
     print("\n" + markdown_content)
 
     try:
-        s3_client.put_object(
+        get_client('s3').put_object(
             Bucket=knowledge_bucket,
             Key=s3_key,
             Body=markdown_content.encode('utf-8'),
@@ -1,4 +1,4 @@
-import os, boto3, json
+import json
 import uuid
 from datetime import datetime
 from agent_utils import (
@@ -6,53 +6,147 @@ from agent_utils import (
     save_knowledge,
     save_agent_memory,
     load_agent_memory,
+    memory_version,
     create_ops_agent
 )
-
-transient_payload_bucket = os.environ['MEM_BUCKET']
-s3_client = boto3.client('s3')
+from metrics import emit_agent_metrics, set_invocation_dimensions
+from tracing import start_span, flush_traces
+from dedupe import skip_unchanged_update, record_processed
+from event_lease import acquire_event_lease, release_event_lease
+from rules import apply_triage_rules
+from batch import handle_batch
+from payload_offload import load_payload, offload_text
+from persistence import persist_in_background, wait_for_persistence, drain_persistence
+from model_router import route_task, run_routed
+from prompts import select_mode
+from prompt_cache import turn_cache_usage
+from budget import start_budget, final_text
 
 def lambda_handler(event, context):
+    try:
+        with start_span("lambda_handler", **{
+            "faas.invocation_id": getattr(context, "aws_request_id", None),
+            "ohero.detail_type": event.get("detail-type")
+        }):
+            drain_persistence()
+            # Agent runs stop in time to save their results and respond before the Lambda timeout
+            budget = start_budget(context)
+            print(f"Time budget: {budget.remaining_ms()}ms")
+            # Batch mode: Health events queued by the ai-integration state machine arrive as SQS records
+            if "Records" in event:
+                return handle_batch(event, context, handle_event)
+            return handle_event(event, context)
+    finally:
+        # Export the spans of this invocation (TRACE_EXPORT)
+        flush_traces()
+
+
+def handle_event(event, context):
 
     context.log("Incoming Event : " + json.dumps(event) + "\n")
 
     # Determine if user interaction is allowed
     ask_user_question_allowed = True if event.get("detail-type") == "Chat.SlackMessageReceived" else False
+    set_invocation_dimensions(detail_type=event.get("detail-type"))
 
     try:
         session_id = event["GetUserSession"]["Item"]["AgentSessionID"]["S"]
+        # Version of the memory saved by the previous turn, lets a warm container reuse its cached copy
+        saved_memory_version = event["GetUserSession"]["Item"].get("AgentMemoryVersion", {}).get("S")
+        continues_session = True
     except Exception as error:
         session_id = str(uuid.uuid4())
+        saved_memory_version = None
+        continues_session = False
         print('Could not fetch existing session id, using generated instead...')
 
-    hook = ContextVisualizationHook()
+    event_context = event["detail"]["event"].get("eventContext")
+    # Only one invocation at a time handles an event, later updates wait for it or are coalesced into the latest one
+    lease = acquire_event_lease(event.get("detail-type"), event_context, getattr(context, "aws_request_id", None))
+    if lease and lease.coalesced:
+        return {
+            "Output": {
+                "Text": lease.coalesced,
+            },
+            "SessionId": session_id,
+            "ExpiresAt": str(int(datetime.now().timestamp() + 20 * 60))
+        }
 
-    ops_agent = create_ops_agent(hook, ask_user_question_allowed)
+    try:
+        return handle_leased_event(event, context, event_context, session_id, saved_memory_version, continues_session, ask_user_question_allowed)
+    finally:
+        release_event_lease(lease)
 
-    # Load conversation history from S3 if previous session exists
-    load_agent_memory(ops_agent, session_id)
+
+def handle_leased_event(event, context, event_context, session_id, saved_memory_version, continues_session, ask_user_question_allowed):
+
+    # Health updates that only changed timestamps are acknowledged without running the agent
+    skipped_output = skip_unchanged_update(event.get("detail-type"), event_context)
+
+    # Events with a deterministic outcome are handled by the triage rules without an LLM call
+    rule_output = None if skipped_output else apply_triage_rules(event.get("detail-type"), event_context)
+    if rule_output:
+        record_processed(event.get("detail-type"), event_context, None)
+
+    if skipped_output or rule_output:
+        return {
+            "Output": {
+                "Text": skipped_output or rule_output,
+            },
+            "SessionId": session_id,
+            "ExpiresAt": str(int(datetime.now().timestamp() + 20 * 60))
+        }
 
     # Extract query from event payload
     task = event["detail"]["event"]["text"]
     payload_s3_key = event["detail"]["event"].get("payloadS3Key", None)
     if payload_s3_key:
-        response = s3_client.get_object(Bucket=transient_payload_bucket, Key=payload_s3_key)
-        task = response['Body'].read().decode('utf-8')
+        with start_span("load_event_payload", **{"ohero.payload_s3_key": payload_s3_key}):
+            task = load_payload(payload_s3_key)
         print(f'Getting prompt from event payload stored in S3 with object key={payload_s3_key}')
 
-    result = ops_agent(task)
+    hook = ContextVisualizationHook()
+
+    # The prompt mode decides which framework stages and tools the agent gets (prompts.py)
+    prompt_mode = select_mode(event.get("detail-type"), event_context, task, continues_session)
+    print(f"Prompt mode: {prompt_mode}")
+    with start_span("create_ops_agent", **{"ohero.prompt_mode": prompt_mode}):
+        ops_agent = create_ops_agent(hook, ask_user_question_allowed, prompt_mode)
+
+    # Load conversation history from S3 if previous session exists
+    with start_span("load_agent_memory", **{"ohero.session_id": session_id}):
+        load_agent_memory(ops_agent, session_id, saved_memory_version)
+
+    # Simple tasks start on a lighter model and only move to the preferred one when its output has low confidence
+    routing = route_task(event.get("detail-type"), event_context, task, len(ops_agent.messages))
+    print(f"Model route '{routing.route}': starting on the {routing.tier} model")
+    result = run_routed(ops_agent, task, routing, awaiting_acknowledgement=bool((event_context or {}).get("callbackToken")))
+
+    # Save knowledge and agent memory in the background while the response is prepared
+    persistence = [
+        persist_in_background("save_knowledge", save_knowledge, ops_agent, result, task, session_id),
+        persist_in_background("save_agent_memory", save_agent_memory, ops_agent, session_id)
+    ]
+
+    emit_agent_metrics(ops_agent, result, session_id)
+    cache_read, cache_write, uncached = turn_cache_usage(result)
+    print(f"Prompt cache this turn: read {cache_read}, write {cache_write}, uncached {uncached} input tokens")
+    record_processed(event.get("detail-type"), event_context, result)
+    # Long reports are passed by reference, Step Functions states are limited to 256 KB
+    response_text = offload_text(final_text(result), session_id)
 
-    # Save knowledge and agent memory
-    save_knowledge(ops_agent, result, task, session_id)
-    save_agent_memory(ops_agent, session_id)
+    # The memory version returned below is only known once the memory is saved
+    with start_span("wait_for_persistence"):
+        wait_for_persistence(persistence)
 
     session_expires_at = int(datetime.now().timestamp() + 20 * 60)
     final_response = {
         "Output": {
-            "Text": str(result).strip(),
+            "Text": response_text,
         },
         "SessionId": session_id,
-        "ExpiresAt": str(session_expires_at)
+        "ExpiresAt": str(session_expires_at),
+        "MemoryVersion": memory_version(ops_agent, session_id)
     }
 
     return final_response
@@ -0,0 +1,62 @@
+# ============================================================================
+# Lazily created AWS clients shared by the oheroAct modules
+# ============================================================================
+# Clients are created on first use instead of at import, so an invocation only pays for the services it calls.
+# All clients and Bedrock models share one boto3 session: creating a client from a warm session takes a few ms,
+# while every BedrockModel built without a session loads a new one (~60-100ms each, five models per agent).
+import boto3
+import os
+import threading
+from tracing import instrument_client
+
+_session = None
+_clients = {}
+# Reentrant so callers can hold it while building several clients from the shared session (boto3 sessions are not thread safe)
+session_lock = threading.RLock()
+
+
+def get_boto_session() -> boto3.Session:
+    global _session
+
+    if _session is None:
+        with session_lock:
+            if _session is None:
+                _session = boto3.Session(region_name=os.environ.get('AWS_REGION'))
+    return _session
+
+
+def get_client(service_name, config=None, config_name=None):
+    """
+    Return the cached client for a service, created on first use. A client with its own botocore config is cached
+    separately under "<service>:<config_name>", so it is never shared with the default client of the service.
+    """
+    if config is not None and not config_name:
+        # Cached under the service name alone, the config would be dropped whenever another caller created the client first
+        raise ValueError(f"A {service_name} client with its own config needs a config_name to be cached under")
+    key = f"{service_name}:{config_name}" if config_name else service_name
+    client = _clients.get(key)
+    if client is None:
+        session = get_boto_session()
+        with session_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = instrument_client(session.client(service_name=service_name, config=config))
+                _clients[key] = client
+    return client
+
+
+def reset_clients():
+    """Drop the session and clients so they are recreated with fresh credentials and connections."""
+    global _session
+
+    with session_lock:
+        _session = None
+        _clients.clear()
+
+
+# Lambda SnapStart: credentials and open connections captured in the snapshot are stale after resume
+try:
+    from snapshot_restore_py import register_after_restore
+    register_after_restore(reset_clients)
+except ImportError:
+    pass
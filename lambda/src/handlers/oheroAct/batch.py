@@ -0,0 +1,342 @@
+# ============================================================================
+# Micro-batched triage of related Health events in a single agent run
+# ============================================================================
+# In batch mode the ai-integration state machine queues Health events on an SQS queue and waits for a task token
+# instead of invoking the function directly. The queue delivers the events that arrived within its batching window
+# together, they are grouped by service, region and event type and each group is triaged by one agent run, so related
+# events share the knowledge base searches and research. The agent acknowledges every event on its own callback token
+# and creates its tickets, the per-event answers are then sent back to each waiting state machine task.
+# Events settled by dedupe or a triage rule, groups of one and events the batch run did not acknowledge are handled
+# one by one exactly as in direct invocation.
+# The waiting tasks get a heartbeat before every agent run (the state machine task has HeartbeatSeconds), and once the
+# time budget cannot fit another run (BATCH_MIN_RUN_MS) the remaining events go back to the queue as batch item failures,
+# visible again right away for the next invocation.
+import json
+import os
+import re
+import uuid
+from datetime import datetime
+import tools
+from agent_utils import (
+    ContextVisualizationHook,
+    save_knowledge,
+    save_agent_memory,
+    create_ops_agent
+)
+from metrics import emit_agent_metrics, emit_batch_metrics, set_invocation_dimensions
+from tracing import start_span, set_span_error
+from aws_clients import get_client
+from budget import current_budget
+from dedupe import skip_unchanged_update, record_processed
+from event_lease import try_event_lease, release_event_lease
+from rules import apply_triage_rules
+from payload_offload import offload_text
+from persistence import persist_in_background, wait_for_persistence
+
+batch_max_events = int(os.environ.get('BATCH_MAX_EVENTS', '10'))
+# Time an agent run needs at least, events are only taken while the budget has this much left
+batch_min_run_ms = int(os.environ.get('BATCH_MIN_RUN_MS', '180000'))
+
+# Health event fields whose values must be equal for events to be triaged together
+batch_group_fields = ('service', 'eventRegion', 'eventTypeCode')
+
+batch_prompt = "Please handle each of the following {} related events, they share the same service, region and event type. Research them together, but decide on each event separately based on its event description within <eventDetails></eventDetails> tags: acknowledge every event with its own EXACT callback token value within its <callbackToken></callbackToken> tags, and use its own EventPk value within <eventPk></eventPk> tags and EventLastUpdatedTime value within <eventLastUpdatedTime></eventLastUpdatedTime> tags for its tickets. Give your final response as one <eventResult eventPk=\"EVENT_PK\"></eventResult> section per event, with the EventPk of the event, each starting with a brief summary of the reasons why you took the actions for that event, then, if you created or updated any tickets, a short summary about the content/update.\n{}"
+batch_event_template = "<event index=\"{}\"><eventDetails>{}</eventDetails>, <callbackToken>{}</callbackToken>, <eventPk>{}</eventPk>, <eventLastUpdatedTime>{}</eventLastUpdatedTime></event>"
+
+_event_result_pattern = re.compile(r'<eventResult\s+eventPk="([^"]*)">(.*?)</eventResult>', re.DOTALL)
+
+# Items of the current batch whose state machine task still waits for an answer, by message id
+_waiting = {}
+
+
+def event_context_of(item):
+    return item['payload']['detail']['event'].get('eventContext') or {}
+
+
+def group_key(item):
+    """Events with the same key are triaged together, events without a complete Health detail are never grouped."""
+    detail = event_context_of(item).get('eventDetail') or {}
+    values = tuple(detail.get(field) for field in batch_group_fields)
+    if not all(values) or not event_context_of(item).get('callbackToken'):
+        return ('single', item['messageId'])
+    return values
+
+
+def build_batch_prompt(items):
+    events = []
+    for index, item in enumerate(items, start=1):
+        event_context = event_context_of(item)
+        events.append(batch_event_template.format(
+            index,
+            json.dumps(event_context['eventDetail']),
+            event_context['callbackToken'],
+            event_context.get('eventPk', ''),
+            event_context.get('eventLastUpdatedTime', '')
+        ))
+    return batch_prompt.format(len(items), "\n".join(events))
+
+
+def split_batch_output(text, items):
+    """Per-event answer from the <eventResult> sections of the batch output, the whole output for events without one."""
+    sections = {event_pk: section.strip() for event_pk, section in _event_result_pattern.findall(text)}
+    return {
+        item['messageId']: sections.get(event_context_of(item).get('eventPk'), text.strip())
+        for item in items
+    }
+
+
+def build_response(text, session_id):
+    return {
+        "Output": {
+            "Text": text,
+        },
+        "SessionId": session_id,
+        "ExpiresAt": str(int(datetime.now().timestamp() + 20 * 60))
+    }
+
+
+def send_response(item, response):
+    """Complete the state machine task waiting on the event with the handler response, False when it could not be sent."""
+    _waiting.pop(item['messageId'], None)
+    try:
+        get_client('stepfunctions').send_task_success(
+            taskToken=item['taskToken'],
+            output=json.dumps({
+                'Payload': response
+            })
+        )
+        return True
+    except Exception as e:
+        print(f"✗ Failed to send the response of batch message {item['messageId']}: {str(e)}")
+        return False
+
+
+def send_failure(item, cause):
+    """Fail the waiting state machine task with AiAgentError, which the state machine retries."""
+    _waiting.pop(item['messageId'], None)
+    try:
+        get_client('stepfunctions').send_task_failure(
+            taskToken=item['taskToken'],
+            error='AiAgentError',
+            cause=cause[:256]
+        )
+        return True
+    except Exception as e:
+        print(f"✗ Failed to send the failure of batch message {item['messageId']}: {str(e)}")
+        return False
+
+
+def send_heartbeats():
+    """Keep the waiting state machine tasks of the batch alive before an agent run."""
+    for item in list(_waiting.values()):
+        try:
+            get_client('stepfunctions').send_task_heartbeat(taskToken=item['taskToken'])
+        except Exception as e:
+            print(f"✗ Failed to send the heartbeat of batch message {item['messageId']}: {str(e)}")
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') in ('TaskTimedOut', 'TaskDoesNotExist', 'InvalidToken'):
+                # Nobody waits for the event any more, the state machine already moved on
+                _waiting.pop(item['messageId'], None)
+
+
+def has_time_for_run():
+    return current_budget().remaining_ms() >= batch_min_run_ms
+
+
+def queue_url(event_source_arn):
+    _, _, _, region, account, name = event_source_arn.split(':')
+    return f"https://sqs.{region}.amazonaws.com/{account}/{name}"
+
+
+def defer(items):
+    """Return items to the queue for the next invocation, returns their message ids as batch item failures."""
+    print(f"ℹ Not enough time left for another agent run, returning {len(items)} events to the queue")
+    for item in items:
+        _waiting.pop(item['messageId'], None)
+        if not item.get('receiptHandle') or not item.get('eventSourceARN'):
+            continue
+        try:
+            get_client('sqs').change_message_visibility(
+                QueueUrl=queue_url(item['eventSourceARN']),
+                ReceiptHandle=item['receiptHandle'],
+                VisibilityTimeout=0
+            )
+        except Exception as e:
+            print(f"✗ Failed to make batch message {item['messageId']} visible again, it is delivered after the visibility timeout: {str(e)}")
+    return [item['messageId'] for item in items]
+
+
+def handle_single(item, context, handle_event):
+    if item['messageId'] not in _waiting:
+        print(f"ℹ The state machine task of batch message {item['messageId']} no longer waits, skipping it")
+        return True
+    if not has_time_for_run():
+        defer([item])
+        return False
+    send_heartbeats()
+    try:
+        response = handle_event(item['payload'], context)
+    except Exception as e:
+        print(f"✗ Failed to handle batch message {item['messageId']}: {str(e)}")
+        return send_failure(item, str(e))
+    return send_response(item, response)
+
+
+def triage_group(key, items, context, handle_event):
+    """Triage a group of related events, returns the message ids whose task could not be completed."""
+    failed = []
+
+    # Unchanged updates and events a triage rule decides never reach the agent
+    pending = []
+    for item in items:
+        detail_type = item['payload'].get('detail-type')
+        event_context = event_context_of(item)
+        set_invocation_dimensions(detail_type=detail_type)
+        output = skip_unchanged_update(detail_type, event_context)
+        if not output:
+            output = apply_triage_rules(detail_type, event_context)
+            if output:
+                record_processed(detail_type, event_context, None)
+        if not output:
+            pending.append(item)
+        elif not send_response(item, build_response(output, str(uuid.uuid4()))):
+            failed.append(item['messageId'])
+
+    if len(pending) == 1:
+        if not handle_single(pending[0], context, handle_event):
+            failed.append(pending[0]['messageId'])
+    if len(pending) < 2:
+        return failed
+
+    # Events another invocation is handling wait for it (or are coalesced) on their own after the group. Each item leases
+    # with its own owner, so of two updates of the same event in the group only the first joins the run, the other is
+    # handled after it like any contended event
+    invocation_id = getattr(context, 'aws_request_id', None) or str(uuid.uuid4())
+    leases, contended = [], []
+    for item in pending:
+        owner = f"{invocation_id}:{item['messageId']}"
+        lease = try_event_lease(item['payload'].get('detail-type'), event_context_of(item), owner)
+        if lease:
+            leases.append(lease)
+        else:
+            contended.append(item)
+    pending = [item for item in pending if item not in contended]
+    try:
+        failed.extend(triage_leased_group(key, pending, context, handle_event))
+    finally:
+        for lease in leases:
+            release_event_lease(lease)
+
+    for item in contended:
+        if not handle_single(item, context, handle_event):
+            failed.append(item['messageId'])
+    return failed
+
+
+def triage_leased_group(key, pending, context, handle_event):
+    """Triage related events in one agent run (one alone as in direct invocation), returns the message ids whose task could not be completed."""
+    failed = []
+    pending = [item for item in pending if item['messageId'] in _waiting]
+    if len(pending) == 1:
+        if not handle_single(pending[0], context, handle_event):
+            failed.append(pending[0]['messageId'])
+    if len(pending) < 2:
+        return failed
+
+    if not has_time_for_run():
+        return defer(pending)
+    send_heartbeats()
+
+    session_id = str(uuid.uuid4())
+    with start_span("triage_batch", **{"ohero.batch_key": "/".join(key), "ohero.batch_size": len(pending), "ohero.session_id": session_id}) as span:
+        print(f"Triaging {len(pending)} related events ({', '.join(key)}) in one agent run")
+        try:
+            ops_agent = create_ops_agent(ContextVisualizationHook(), False, 'triage')
+            task = build_batch_prompt(pending)
+            tools.acknowledged_callback_tokens.clear()
+            result = ops_agent(task)
+        except Exception as e:
+            set_span_error(span, e)
+            print(f"✗ Batch agent run failed: {str(e)}")
+            for item in pending:
+                if not send_failure(item, str(e)):
+                    failed.append(item['messageId'])
+            return failed
+
+        persistence = [
+            persist_in_background("save_knowledge", save_knowledge, ops_agent, result, task, session_id),
+            persist_in_background("save_agent_memory", save_agent_memory, ops_agent, session_id)
+        ]
+        emit_agent_metrics(ops_agent, result, session_id)
+
+        total_tokens = 0
+        if hasattr(result, 'metrics') and hasattr(result.metrics, 'accumulated_usage'):
+            total_tokens = result.metrics.accumulated_usage.get('totalTokens', 0)
+        tokens_per_event = total_tokens // len(pending)
+
+        outputs = split_batch_output(str(result), pending)
+        leftovers = []
+        for item in pending:
+            event_context = event_context_of(item)
+            if event_context['callbackToken'] not in tools.acknowledged_callback_tokens:
+                leftovers.append(item)
+                continue
+            record_processed(item['payload'].get('detail-type'), event_context, None, total_tokens=tokens_per_event)
+            if not send_response(item, build_response(offload_text(outputs[item['messageId']], session_id), session_id)):
+                failed.append(item['messageId'])
+
+        # The waiting tasks are answered, the report and memory only have to be written before the container freezes
+        wait_for_persistence(persistence)
+
+    # Events the batch run left unacknowledged are triaged on their own
+    for item in leftovers:
+        print(f"ℹ Event {event_context_of(item).get('eventPk')} was not acknowledged in the batch run, triaging it on its own")
+        if not handle_single(item, context, handle_event):
+            failed.append(item['messageId'])
+
+    emit_batch_metrics(len(pending), len(leftovers), tokens_per_event)
+    return failed
+
+
+def handle_batch(event, context, handle_event):
+    """
+    Handle the SQS records of queued events. Every record carries the task token of the waiting state machine task
+    and the payload the state machine would otherwise invoke the function with. Returns the partial batch response,
+    records are only reported as failed when their task could not be completed or the time budget could not fit
+    their agent run (so SQS delivers them again).
+    """
+    items = []
+    for record in event["Records"]:
+        try:
+            message = json.loads(record['body'])
+            items.append({
+                'messageId': record['messageId'],
+                'receiptHandle': record.get('receiptHandle'),
+                'eventSourceARN': record.get('eventSourceARN'),
+                'taskToken': message['taskToken'],
+                'payload': message['payload']
+            })
+        except (KeyError, ValueError) as e:
+            # Without a task token nobody waits for the record, delivering it again would not help
+            print(f"✗ Dropping malformed batch message {record.get('messageId')}: {str(e)}")
+
+    groups = {}
+    for item in items:
+        groups.setdefault(group_key(item), []).append(item)
+    print(f"Batch of {len(items)} events in {len(groups)} groups")
+
+    _waiting.clear()
+    _waiting.update({item['messageId']: item for item in items})
+    failed = []
+    for number, (key, group) in enumerate(groups.items()):
+        # No new groups once the budget cannot fit another agent run, their events wait for the next invocation
+        if not has_time_for_run():
+            failed.extend(defer([item for later in list(groups.values())[number:] for item in later]))
+            break
+        if key[0] == 'single':
+            if not handle_single(group[0], context, handle_event):
+                failed.append(group[0]['messageId'])
+            continue
+        for start in range(0, len(group), batch_max_events):
+            failed.extend(triage_group(key, group[start:start + batch_max_events], context, handle_event))
+
+    return {"batchItemFailures": [{"itemIdentifier": message_id} for message_id in failed]}
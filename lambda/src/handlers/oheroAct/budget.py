@@ -0,0 +1,212 @@
+# ============================================================================
+# Invocation time budget and cycle limits of the agent loop
+# ============================================================================
+# The handler starts a budget from the Lambda context: the time left minus a tail reserved for saving the knowledge
+# report and agent memory and returning the response (BUDGET_RESERVE_MS). Each agent carries a BudgetHook that
+#   - counts model calls per invocation and stops at its maximum (AGENT_MAX_CYCLES, RESEARCH_AGENT_MAX_CYCLES)
+#   - once the cycles are used up or less than BUDGET_FINAL_ANSWER_MS is left, asks the model for a final answer
+#     from what it has, cancels tool calls from then on, and ends the turn if the model still does not answer
+#   - cancels tool calls when no time is left for them, and reports tools that ran past their timeout
+#   - cancels the agent (Agent.cancel) when the deadline passes while a model call or tool is still running
+# Tool timeouts are TOOL_TIMEOUT_MS, per tool in TOOL_TIMEOUTS_MS (JSON object of tool name to ms), capped by the
+# budget. The local tools (DynamoDB, S3, knowledge base) run bounded (bounded_tool): a call still running at its timeout
+# is answered with a timeout error and left to finish in the background, Python threads cannot be stopped. MCP tools
+# take their request timeout from the current budget (tool_timeout_seconds), ask_aws runs the research agent on a
+# child budget of its timeout.
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from strands.hooks import HookProvider, HookRegistry, BeforeInvocationEvent, AfterInvocationEvent, BeforeModelCallEvent, BeforeToolCallEvent, AfterToolCallEvent
+from metrics import emit_budget_metrics
+
+agent_max_cycles = int(os.environ.get('AGENT_MAX_CYCLES', '20'))
+research_agent_max_cycles = int(os.environ.get('RESEARCH_AGENT_MAX_CYCLES', '8'))
+reserve_ms = int(os.environ.get('BUDGET_RESERVE_MS', '10000'))
+final_answer_ms = int(os.environ.get('BUDGET_FINAL_ANSWER_MS', '20000'))
+default_tool_timeout_ms = int(os.environ.get('TOOL_TIMEOUT_MS', '30000'))
+tool_timeouts_ms = json.loads(os.environ.get('TOOL_TIMEOUTS_MS', '{"ask_aws": 120000}'))
+
+final_answer_prompt = ("The time budget of this task is used up ({}). Do not call any more tools. Give your final response now, "
+                       "based only on the information and actions so far, and state which steps could not be completed.")
+cancelled_tool_message = "Not executed: the time budget of this task is used up."
+
+# Budget of the current invocation, set by the handler
+_current = None
+
+
+class InvocationBudget:
+    """Wall clock deadline of an invocation, None for no deadline."""
+
+    def __init__(self, remaining_ms=None):
+        self.deadline = None if remaining_ms is None else time.monotonic() + remaining_ms / 1000
+
+    def remaining_ms(self):
+        if self.deadline is None:
+            return float('inf')
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+    def exhausted(self):
+        """Whether only the time for a final answer is left."""
+        return self.remaining_ms() < final_answer_ms
+
+    def tool_timeout_ms(self, tool_name):
+        """Timeout of a tool call started now, 0 when no time is left for tools."""
+        timeout = tool_timeouts_ms.get(tool_name, default_tool_timeout_ms)
+        return max(0, min(timeout, self.remaining_ms() - final_answer_ms))
+
+    def child(self, timeout_ms):
+        """Budget ending after timeout_ms, or at this budget's deadline when earlier."""
+        child = InvocationBudget(timeout_ms)
+        if self.deadline is not None:
+            child.deadline = min(child.deadline, self.deadline)
+        return child
+
+
+def start_budget(context):
+    """Start the budget of an invocation from the Lambda context and make it the current one."""
+    global _current
+
+    remaining = context.get_remaining_time_in_millis() if hasattr(context, 'get_remaining_time_in_millis') else None
+    _current = InvocationBudget(None if remaining is None else max(0, remaining - reserve_ms))
+    return _current
+
+
+def current_budget():
+    return _current or InvocationBudget()
+
+
+def tool_timeout_seconds(tool_name, limit_seconds):
+    """Timeout in seconds for a remote call of a tool, at most limit_seconds and at least one second."""
+    return max(1.0, min(limit_seconds, current_budget().tool_timeout_ms(tool_name) / 1000))
+
+
+def bounded_tool(function):
+    """
+    Run a tool function within its timeout. A call still running at its timeout returns a timeout error result of the
+    tool instead, errors of the call are raised as they are.
+    """
+    tool_name = function.__name__
+
+    @functools.wraps(function)
+    def run(*args, **kwargs):
+        timeout_ms = current_budget().tool_timeout_ms(tool_name)
+        outcome = {}
+        done = threading.Event()
+
+        def call():
+            try:
+                outcome['result'] = function(*args, **kwargs)
+            except Exception as e:
+                outcome['error'] = e
+            finally:
+                done.set()
+
+        # The context carries the current trace span over to the tool's thread
+        threading.Thread(target=contextvars.copy_context().run, args=(call,), name=f"tool-{tool_name}", daemon=True).start()
+        if not done.wait(timeout_ms / 1000):
+            print(f"✗ {tool_name} still running after its {timeout_ms}ms timeout, returning a timeout error")
+            return {
+                tool_name: {
+                    'TimeoutError': f"The tool did not complete within its {timeout_ms}ms timeout, its outcome is unknown."
+                }
+            }
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome['result']
+
+    return run
+
+
+def final_text(result):
+    """Text of an agent result, a note on the budget when the run stopped without any."""
+    text = str(result).strip()
+    if text:
+        return text
+    return "The time budget of this task ran out before a final response. Actions already taken (acknowledgements, tickets) stay in effect."
+
+
+class BudgetHook(HookProvider):
+    """Enforces the cycle limit and time budget (see the module comment) on the agent it is registered with."""
+
+    def __init__(self, max_cycles, budget=None):
+        self.max_cycles = max_cycles
+        self.budget = budget # None: the current invocation budget
+        self.cycles = 0
+        self.stop_reason = None # why the final answer was requested: max_cycles, deadline or cancelled
+        self._tool_started = {}
+        self._watchdog = None
+
+    def register_hooks(self, registry: HookRegistry) -> None:
+        registry.add_callback(BeforeInvocationEvent, self.on_before_invocation)
+        registry.add_callback(AfterInvocationEvent, self.on_after_invocation)
+        registry.add_callback(BeforeModelCallEvent, self.on_before_model_call)
+        registry.add_callback(BeforeToolCallEvent, self.on_before_tool_call)
+        registry.add_callback(AfterToolCallEvent, self.on_after_tool_call)
+
+    @property
+    def active_budget(self):
+        return self.budget or current_budget()
+
+    def on_before_invocation(self, event: BeforeInvocationEvent):
+        self.cycles = 0
+        self.stop_reason = None
+        remaining = self.active_budget.remaining_ms()
+        if remaining != float('inf'):
+            agent = event.agent
+            self._watchdog = threading.Timer(remaining / 1000, self.cancel, args=(agent,))
+            self._watchdog.daemon = True
+            self._watchdog.start()
+
+    def cancel(self, agent):
+        print(f"✗ {agent.name} still running at the deadline of its time budget, cancelling")
+        self.stop_reason = 'cancelled'
+        agent.cancel()
+
+    def on_after_invocation(self, event: AfterInvocationEvent):
+        if self._watchdog:
+            self._watchdog.cancel()
+            self._watchdog = None
+        if self.stop_reason:
+            print(f"ℹ {event.agent.name} stopped by its budget after {self.cycles} cycles: {self.stop_reason}")
+        emit_budget_metrics(event.agent.name, self.stop_reason or 'completed', self.cycles, self.active_budget.remaining_ms())
+
+    def on_before_model_call(self, event: BeforeModelCallEvent):
+        self.cycles += 1
+        if self.stop_reason:
+            # The final answer was already asked for and the model called tools instead: end the turn
+            event.cancel = "Stopped: the time budget of this task is used up."
+            return
+
+        reason = None
+        if self.cycles > self.max_cycles:
+            reason = 'max_cycles'
+        elif self.active_budget.exhausted():
+            reason = 'deadline'
+        if not reason:
+            return
+
+        self.stop_reason = reason
+        messages = event.agent.messages
+        if messages and messages[-1].get('role') == 'user':
+            messages[-1]['content'].append({'text': final_answer_prompt.format(reason.replace('_', ' '))})
+        print(f"ℹ {event.agent.name} budget used up ({reason}) at cycle {self.cycles}, asking for a final response")
+
+    def on_before_tool_call(self, event: BeforeToolCallEvent):
+        tool_name = event.tool_use['name']
+        if self.stop_reason or self.active_budget.tool_timeout_ms(tool_name) <= 0:
+            event.cancel_tool = cancelled_tool_message
+            return
+        self._tool_started[event.tool_use['toolUseId']] = time.monotonic()
+
+    def on_after_tool_call(self, event: AfterToolCallEvent):
+        started = self._tool_started.pop(event.tool_use['toolUseId'], None)
+        if started is None:
+            return
+        tool_name = event.tool_use['name']
+        elapsed_ms = (time.monotonic() - started) * 1000
+        timeout = tool_timeouts_ms.get(tool_name, default_tool_timeout_ms)
+        if elapsed_ms > timeout:
+            print(f"✗ {tool_name} ran {elapsed_ms:.0f}ms, past its {timeout}ms timeout")
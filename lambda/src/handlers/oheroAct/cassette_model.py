@@ -0,0 +1,174 @@
+# ============================================================================
+# Record/replay model provider for deterministic performance tests
+# ============================================================================
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from strands.models import Model
+
+# Enabled only when MODEL_CASSETTE points to a cassette file
+cassette_path = os.environ.get('MODEL_CASSETTE')
+cassette_mode = os.environ.get('MODEL_CASSETTE_MODE', 'replay') # record | replay
+latency_scale = float(os.environ.get('MODEL_CASSETTE_LATENCY_SCALE', '1.0')) # 0 replays without delay
+strict_replay = os.environ.get('MODEL_CASSETTE_STRICT', 'false').lower() == 'true'
+
+# Values that change on every run and must not change the request hash
+_volatile_patterns = [
+    (re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})?'), '<timestamp>'),
+    (re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'), '<uuid>'),
+]
+
+_cassettes = {}
+
+
+class PromptDriftError(Exception):
+    """Raised in strict replay when a request no longer matches any recorded request."""
+
+
+def canonical_request(model_id, messages, tool_specs=None, system_prompt=None):
+    """Serialize a model request with stable key order and volatile values masked."""
+    text = json.dumps({
+        'model_id': model_id,
+        'system_prompt': system_prompt or '',
+        'tool_specs': sorted(tool_specs or [], key=lambda spec: spec.get('name', '')),
+        'messages': messages,
+    }, sort_keys=True, default=str)
+    for pattern, replacement in _volatile_patterns:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def request_hash(model_id, messages, tool_specs=None, system_prompt=None):
+    return hashlib.sha256(canonical_request(model_id, messages, tool_specs, system_prompt).encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """Recorded model interactions keyed by canonical request hash, persisted as a JSON file."""
+
+    def __init__(self, path, mode):
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        self.interactions = []
+        self.by_hash = {}
+        self.replayed = {}
+        self.position = 0
+        self.drift = []
+
+        if mode == 'replay' or os.path.exists(path):
+            with open(path, 'r') as f:
+                self.interactions = json.load(f).get('interactions', [])
+        for interaction in self.interactions:
+            self.by_hash.setdefault(interaction['hash'], []).append(interaction)
+
+    def add(self, interaction):
+        with self.lock:
+            self.interactions.append(interaction)
+            self.by_hash.setdefault(interaction['hash'], []).append(interaction)
+            with open(self.path, 'w') as f:
+                json.dump({'interactions': self.interactions}, f, indent=1, default=str)
+
+    def find(self, hash_value, model_id, summary):
+        """Next recorded interaction for the hash, or the interaction at the same position when the prompt drifted."""
+        with self.lock:
+            position = self.position
+            self.position += 1
+            candidates = self.by_hash.get(hash_value)
+            if candidates:
+                index = self.replayed.get(hash_value, 0)
+                self.replayed[hash_value] = index + 1
+                return candidates[min(index, len(candidates) - 1)]
+
+            nearest = self.interactions[position] if position < len(self.interactions) else None
+            self.drift.append({
+                'position': position,
+                'model_id': model_id,
+                'hash': hash_value,
+                'recorded_hash': nearest['hash'] if nearest else None,
+                'request': summary,
+                'recorded_request': nearest['request'] if nearest else None,
+            })
+            print(f"[Cassette] ⚠ Prompt drift at request #{position + 1} ({model_id}): {hash_value[:12]} not recorded"
+                  + (f", recorded request was {nearest['hash'][:12]}" if nearest else ""))
+            if strict_replay or nearest is None:
+                raise PromptDriftError(f"No recorded interaction for request #{position + 1} with hash {hash_value}")
+            return nearest
+
+
+def get_cassette(path=None, mode=None):
+    path = path or cassette_path
+    if path not in _cassettes:
+        _cassettes[path] = Cassette(path, mode or cassette_mode)
+    return _cassettes[path]
+
+
+def request_summary(messages, tool_specs, system_prompt):
+    """Sizes of a request, kept in the cassette to explain drift without storing the prompt twice."""
+    last = messages[-1] if messages else {}
+    return {
+        'messages': len(messages),
+        'system_prompt_chars': len(system_prompt or ''),
+        'tools': sorted(spec.get('name', '') for spec in (tool_specs or [])),
+        'last_message': json.dumps(last.get('content', []), default=str)[:500],
+    }
+
+
+class CassetteModel(Model):
+    """
+    Wraps a model to record its request/response pairs into a cassette, or to replay them offline.
+    Replay waits for the recorded latency multiplied by MODEL_CASSETTE_LATENCY_SCALE.
+    """
+
+    def __init__(self, inner, cassette=None):
+        self.inner = inner
+        self.cassette = cassette or get_cassette()
+
+    @property
+    def config(self):
+        return self.inner.config
+
+    def update_config(self, **model_config):
+        self.inner.update_config(**model_config)
+
+    def get_config(self):
+        return self.inner.get_config()
+
+    def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        return self.inner.structured_output(output_model, prompt, system_prompt=system_prompt, **kwargs)
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        model_id = self.config.get('model_id', 'unknown')
+        hash_value = request_hash(model_id, messages, tool_specs, system_prompt)
+
+        if self.cassette.mode == 'record':
+            started = time.perf_counter()
+            events = []
+            async for event in self.inner.stream(messages, tool_specs, system_prompt, **kwargs):
+                events.append(event)
+                yield event
+            self.cassette.add({
+                'hash': hash_value,
+                'model_id': model_id,
+                'latencyMs': int((time.perf_counter() - started) * 1000),
+                'request': request_summary(messages, tool_specs, system_prompt),
+                'events': events,
+            })
+            return
+
+        interaction = self.cassette.find(hash_value, model_id, request_summary(messages, tool_specs, system_prompt))
+        if latency_scale > 0:
+            await asyncio.sleep(interaction['latencyMs'] * latency_scale / 1000.0)
+        for event in interaction['events']:
+            yield event
+
+
+def with_cassette(models):
+    """Wrap every supported model when a cassette is configured, otherwise return the models unchanged."""
+    if not cassette_path:
+        return models
+    print(f"[Cassette] {cassette_mode} mode using {cassette_path}")
+    return [CassetteModel(model) for model in models]
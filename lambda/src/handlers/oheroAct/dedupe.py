@@ -0,0 +1,126 @@
+# ============================================================================
+# Content-hash deduplication of Health event updates before invoking the agent
+# ============================================================================
+import hashlib
+import json
+import os
+from datetime import datetime
+from aws_clients import get_client
+from metrics import emit_dedupe_metrics
+
+event_table = os.environ.get('EVENT_TABLE')
+dedupe_enabled = os.environ.get('DEDUPE_ENABLED', 'true').lower() == 'true' and bool(event_table)
+
+# Health event fields that change the meaning of an event, lastUpdatedTime and communicationId change on every update.
+# Affected entities count with their statusCode (an entity moving from PENDING to RESOLVED is a material change),
+# not with their lastUpdatedTime.
+material_fields = [
+    'eventArn', 'service', 'eventTypeCode', 'eventTypeCategory', 'eventScopeCode', 'statusCode',
+    'startTime', 'endTime', 'affectedAccount', 'eventRegion', 'eventMetadata'
+]
+
+
+def health_fingerprint(detail):
+    """SHA-256 over the semantically relevant fields of a Health event detail."""
+    material = {field: detail.get(field) for field in material_fields}
+    material['eventDescription'] = sorted(
+        (description.get('language', ''), (description.get('latestDescription') or '').strip())
+        for description in detail.get('eventDescription', [])
+    )
+    material['affectedEntities'] = sorted(
+        (entity.get('entityValue', ''), entity.get('statusCode', ''), json.dumps(entity.get('tags', {}), sort_keys=True))
+        for entity in detail.get('affectedEntities', [])
+    )
+    return hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def get_processed_state(event_pk):
+    """Fingerprint and token usage of the last agent run for the event, None when it was never processed."""
+    response = get_client('dynamodb').get_item(
+        TableName=event_table,
+        Key={'PK': {'S': event_pk}},
+        ProjectionExpression='#afp, #atk',
+        ExpressionAttributeNames={'#afp': 'AgentFingerprint', '#atk': 'AgentTotalTokens'}
+    )
+    item = response.get('Item', {})
+    if 'AgentFingerprint' not in item:
+        return None
+    return {
+        'fingerprint': item['AgentFingerprint']['S'],
+        'total_tokens': int(item.get('AgentTotalTokens', {}).get('N', '0'))
+    }
+
+
+def skip_unchanged_update(detail_type, event_context):
+    """
+    Return the handler output for a Health.EventUpdated event with no material change since the last agent run,
+    or None when the agent has to process the event. The skipped update is acknowledged on the callback token.
+    """
+    if not dedupe_enabled or detail_type != 'Health.EventUpdated' or not event_context or not event_context.get('eventPk') or not event_context.get('eventDetail'):
+        return None
+
+    try:
+        fingerprint = health_fingerprint(event_context['eventDetail'])
+        processed = get_processed_state(event_context['eventPk'])
+        if processed is None or processed['fingerprint'] != fingerprint:
+            return None
+
+        if event_context.get('callbackToken'):
+            get_client('stepfunctions').send_task_success(
+                taskToken=event_context['callbackToken'],
+                output=json.dumps({
+                    'Payload': 'NO_MATERIAL_CHANGE'
+                })
+            )
+
+        get_client('dynamodb').update_item(
+            TableName=event_table,
+            Key={'PK': {'S': event_context['eventPk']}},
+            UpdateExpression='SET #ask = :ask ADD #asc :asc, #ast :ast',
+            ExpressionAttributeNames={'#ask': 'AgentSkippedAt', '#asc': 'AgentSkipCount', '#ast': 'AgentSavedTokens'},
+            ExpressionAttributeValues={
+                ':ask': {'S': datetime.now().isoformat()},
+                ':asc': {'N': '1'},
+                ':ast': {'N': str(processed['total_tokens'])}
+            }
+        )
+    except Exception as e:
+        print(f"✗ Dedupe check failed, processing the event with the agent: {str(e)}")
+        return None
+
+    print(f"ℹ No material change for {event_context['eventPk']} (fingerprint {fingerprint[:12]}), agent skipped")
+    emit_dedupe_metrics(skipped=True, saved_tokens=processed['total_tokens'])
+    return "No material change since the last processed update of this event (only timestamps changed), the update was acknowledged without running the agent."
+
+
+def record_processed(detail_type, event_context, result, total_tokens=None):
+    """
+    Store the fingerprint of a Health event the agent processed, later updates with the same content are skipped.
+    total_tokens overrides the usage of result, e.g. the share of one event in a batch run.
+    """
+    if not dedupe_enabled or not detail_type or not detail_type.startswith('Health.') or not event_context or not event_context.get('eventPk') or not event_context.get('eventDetail'):
+        return
+
+    if total_tokens is None:
+        total_tokens = 0
+        if hasattr(result, 'metrics') and hasattr(result.metrics, 'accumulated_usage'):
+            total_tokens = result.metrics.accumulated_usage.get('totalTokens', 0)
+
+    try:
+        get_client('dynamodb').update_item(
+            TableName=event_table,
+            Key={'PK': {'S': event_context['eventPk']}},
+            UpdateExpression='SET #afp = :afp, #apa = :apa, #atk = :atk',
+            ExpressionAttributeNames={'#afp': 'AgentFingerprint', '#apa': 'AgentProcessedAt', '#atk': 'AgentTotalTokens'},
+            ExpressionAttributeValues={
+                ':afp': {'S': health_fingerprint(event_context['eventDetail'])},
+                ':apa': {'S': datetime.now().isoformat()},
+                ':atk': {'N': str(total_tokens)}
+            }
+        )
+    except Exception as e:
+        print(f"✗ Failed to record the event fingerprint: {str(e)}")
+        return
+
+    if detail_type == 'Health.EventUpdated':
+        emit_dedupe_metrics(skipped=False, saved_tokens=0)
@@ -0,0 +1,234 @@
+# ============================================================================
+# Per-event leases against concurrent agent runs for the same event
+# ============================================================================
+# Health.EventAdded and Health.EventUpdated messages of the same event can reach parallel invocations, each of which
+# would search, research and create its own ticket. Before handling an event, the invocation takes a lease on the
+# event's item in EVENT_TABLE (PK = eventPk) with a conditional write. The lease expires at the invocation's deadline
+# plus LEASE_GRACE_SECONDS (AgentLeaseExpiresAt, epoch seconds), so the lease of a crashed invocation lapses on its own.
+# An arrival that finds the lease held:
+#   - registers as the pending update of the event, unless a later update (eventLastUpdatedTime) is already pending
+#   - waits for the lease, polling every LEASE_POLL_MS for at most LEASE_WAIT_MS (and half its time budget); once it
+#     gets the lease it runs after the holder, so dedupe skips it when the content did not change and the agent finds
+#     the holder's tickets
+#   - is coalesced when a later update takes over the pending slot: its callback token is acknowledged with
+#     'COALESCED' and the later update is handled with the latest payload instead
+#   - is deferred when the wait runs out: AiAgentError makes the state machine retry it later
+# Contention and coalescing are counted on the event item (AgentLeaseContention, AgentLeaseCoalesced) and in metrics.
+# Failing lease writes do not stop the event, it is then handled without a lease.
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+from budget import current_budget, reserve_ms
+from metrics import emit_lease_metrics
+
+event_table = os.environ.get('EVENT_TABLE')
+lease_enabled = os.environ.get('EVENT_LEASE_ENABLED', 'true').lower() == 'true' and bool(event_table)
+lease_wait_ms = int(os.environ.get('LEASE_WAIT_MS', '60000'))
+lease_poll_ms = int(os.environ.get('LEASE_POLL_MS', '2000'))
+lease_grace_seconds = int(os.environ.get('LEASE_GRACE_SECONDS', '60'))
+
+leased_detail_types = ('Health.EventAdded', 'Health.EventUpdated', 'SecHub.EventAdded')
+# Lease length without a time budget, the Lambda maximum timeout
+default_lease_seconds = 900
+
+coalesced_output = "A later update of this event arrived while an earlier one was being handled, the event is handled with the latest update instead."
+
+
+class AiAgentError(Exception):
+    """Error the state machines retry with backoff, raised to defer an event whose lease stays held."""
+
+
+class EventLease:
+    """Lease of an event held by this invocation, or the output of an arrival that was coalesced into a later one."""
+
+    def __init__(self, event_pk, owner, coalesced=None):
+        self.event_pk = event_pk
+        self.owner = owner
+        self.coalesced = coalesced
+
+
+def update_time(event_context):
+    """Epoch seconds of the event's eventLastUpdatedTime (RFC 2822 for Health, ISO 8601 for Security Hub), now without one."""
+    value = (event_context.get('eventLastUpdatedTime') or '').strip()
+    for parse in (parsedate_to_datetime, lambda text: datetime.fromisoformat(text.replace('Z', '+00:00'))):
+        try:
+            return parse(value).timestamp()
+        except (TypeError, ValueError, IndexError):
+            continue
+    return time.time()
+
+
+def is_conditional_failure(error):
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+def lease_expiry():
+    remaining_ms = current_budget().remaining_ms()
+    seconds = default_lease_seconds if remaining_ms == float('inf') else (remaining_ms + reserve_ms) / 1000
+    return int(time.time() + seconds + lease_grace_seconds)
+
+
+def try_acquire(event_pk, owner, pending=False):
+    """
+    Take the lease when it is free, expired or already ours, True on success. A pending arrival only takes it while it
+    still holds the pending slot, and clears the slot with it.
+    """
+    condition = '(attribute_not_exists(#lo) OR #lo = :lo OR #lx < :now)'
+    update = 'SET #lo = :lo, #lx = :lx'
+    names = {'#lo': 'AgentLeaseOwner', '#lx': 'AgentLeaseExpiresAt'}
+    if pending:
+        condition += ' AND #lpo = :lo'
+        update += ' REMOVE #lpo, #lpt'
+        names.update({'#lpo': 'AgentLeasePendingOwner', '#lpt': 'AgentLeasePendingTime'})
+    try:
+        get_client('dynamodb').update_item(
+            TableName=event_table,
+            Key={'PK': {'S': event_pk}},
+            UpdateExpression=update,
+            ConditionExpression=condition,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues={
+                ':lo': {'S': owner},
+                ':lx': {'N': str(lease_expiry())},
+                ':now': {'N': str(int(time.time()))}
+            }
+        )
+        return True
+    except ClientError as e:
+        if is_conditional_failure(e):
+            return False
+        raise
+
+
+def register_pending(event_pk, owner, pending_time):
+    """Take the pending slot of the event unless a later update holds it, True on success. Counts the contention."""
+    try:
+        get_client('dynamodb').update_item(
+            TableName=event_table,
+            Key={'PK': {'S': event_pk}},
+            UpdateExpression='SET #lpo = :lpo, #lpt = :lpt ADD #lc :one',
+            ConditionExpression='attribute_not_exists(#lpt) OR #lpt <= :lpt',
+            ExpressionAttributeNames={'#lpo': 'AgentLeasePendingOwner', '#lpt': 'AgentLeasePendingTime', '#lc': 'AgentLeaseContention'},
+            ExpressionAttributeValues={
+                ':lpo': {'S': owner},
+                ':lpt': {'N': str(pending_time)},
+                ':one': {'N': '1'}
+            }
+        )
+        return True
+    except ClientError as e:
+        if is_conditional_failure(e):
+            return False
+        raise
+
+
+def pending_owner(event_pk):
+    response = get_client('dynamodb').get_item(
+        TableName=event_table,
+        Key={'PK': {'S': event_pk}},
+        ProjectionExpression='#lpo',
+        ExpressionAttributeNames={'#lpo': 'AgentLeasePendingOwner'}
+    )
+    return response.get('Item', {}).get('AgentLeasePendingOwner', {}).get('S')
+
+
+def coalesce(event_pk, event_context):
+    """Acknowledge an arrival a later update of the event supersedes, returns its lease carrying the handler output."""
+    if event_context.get('callbackToken'):
+        get_client('stepfunctions').send_task_success(
+            taskToken=event_context['callbackToken'],
+            output=json.dumps({
+                'Payload': 'COALESCED'
+            })
+        )
+    get_client('dynamodb').update_item(
+        TableName=event_table,
+        Key={'PK': {'S': event_pk}},
+        UpdateExpression='ADD #lco :one',
+        ExpressionAttributeNames={'#lco': 'AgentLeaseCoalesced'},
+        ExpressionAttributeValues={':one': {'N': '1'}}
+    )
+    print(f"ℹ A later update of {event_pk} is pending, this one is coalesced into it")
+    return EventLease(event_pk, None, coalesced=coalesced_output)
+
+
+def acquire_event_lease(detail_type, event_context, owner=None):
+    """
+    Lease the event for this invocation, waiting while another invocation holds it. Returns None when the event needs
+    no lease, an EventLease whose coalesced output is the handler output when a later update supersedes this one, and
+    raises AiAgentError when the lease stays held.
+    """
+    if not lease_enabled or detail_type not in leased_detail_types or not event_context or not event_context.get('eventPk'):
+        return None
+
+    event_pk = event_context['eventPk']
+    owner = owner or str(uuid.uuid4())
+    started = time.monotonic()
+    try:
+        if try_acquire(event_pk, owner):
+            emit_lease_metrics('acquired', 0)
+            return EventLease(event_pk, owner)
+
+        print(f"ℹ {event_pk} is being handled by another invocation, waiting for its lease")
+        if not register_pending(event_pk, owner, update_time(event_context)):
+            lease = coalesce(event_pk, event_context)
+            emit_lease_metrics('coalesced', 0)
+            return lease
+
+        # A waiter that gets the lease still needs time for its own run
+        wait_ms = min(lease_wait_ms, current_budget().remaining_ms() / 2)
+        while (time.monotonic() - started) * 1000 + lease_poll_ms <= wait_ms:
+            time.sleep(lease_poll_ms / 1000)
+            if try_acquire(event_pk, owner, pending=True):
+                waited_ms = (time.monotonic() - started) * 1000
+                print(f"✓ Lease of {event_pk} acquired after waiting {waited_ms:.0f}ms")
+                emit_lease_metrics('waited', waited_ms)
+                return EventLease(event_pk, owner)
+            if pending_owner(event_pk) != owner:
+                lease = coalesce(event_pk, event_context)
+                emit_lease_metrics('coalesced', (time.monotonic() - started) * 1000)
+                return lease
+    except Exception as e:
+        print(f"✗ Event lease failed, handling the event without it: {str(e)}")
+        return None
+
+    emit_lease_metrics('deferred', (time.monotonic() - started) * 1000)
+    raise AiAgentError(f"Event {event_pk} is still being handled by another invocation, deferred for a retry")
+
+
+def try_event_lease(detail_type, event_context, owner):
+    """Lease the event without waiting, None when another invocation holds it. Events that need no lease get a lease without owner."""
+    if not lease_enabled or detail_type not in leased_detail_types or not event_context or not event_context.get('eventPk'):
+        return EventLease(None, None)
+    try:
+        if not try_acquire(event_context['eventPk'], owner):
+            return None
+    except Exception as e:
+        print(f"✗ Event lease failed, handling the event without it: {str(e)}")
+        return EventLease(None, None)
+    emit_lease_metrics('acquired', 0)
+    return EventLease(event_context['eventPk'], owner)
+
+
+def release_event_lease(lease):
+    """Release a lease this invocation holds, the pending update of the event can then take it."""
+    if not lease or not lease.owner:
+        return
+    try:
+        get_client('dynamodb').update_item(
+            TableName=event_table,
+            Key={'PK': {'S': lease.event_pk}},
+            UpdateExpression='REMOVE #lo, #lx',
+            ConditionExpression='#lo = :lo',
+            ExpressionAttributeNames={'#lo': 'AgentLeaseOwner', '#lx': 'AgentLeaseExpiresAt'},
+            ExpressionAttributeValues={':lo': {'S': lease.owner}}
+        )
+    except Exception as e:
+        # Another invocation took over an expired lease, or the write failed and the lease expires on its own
+        if not is_conditional_failure(e):
+            print(f"✗ Failed to release the lease of {lease.event_pk}: {str(e)}")
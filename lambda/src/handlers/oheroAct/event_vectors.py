@@ -0,0 +1,293 @@
+# ============================================================================
+# Embedded vector index of ops events, fast path and fallback of search_ops_events
+# ============================================================================
+# The indexer (lambda_handler below, fed by the S3 "Object Created" events of the ops event lake) embeds every Health
+# event archived by the event lake Firehose with the knowledge base embedding model and keeps one row per event
+# (EventArn~account~region, a newer update replaces the row). The index lives in the transient payloads bucket:
+#   ops-event-vectors/vectors.f32     float32 matrix of normalized embeddings, one row per event
+#   ops-event-vectors/metadata.json   model, dimensions, row count and per row the event text and metadata
+# Lake objects expire after 2 days, the index is therefore only ever updated, never rebuilt from the lake.
+# oheroAct syncs both files to /tmp when the metadata ETag changed (checked at most every
+# OPS_EVENT_VECTORS_REFRESH_SECONDS) and memory-maps the matrix, a query is one embedding call and a matrix product.
+import json
+import os
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import numpy as np
+from aws_clients import get_client
+from botocore.exceptions import ClientError
+
+event_vectors_bucket = os.environ.get('OPS_EVENT_VECTORS_BUCKET', os.environ.get('MEM_BUCKET'))
+event_vectors_prefix = 'ops-event-vectors'
+event_vectors_dir = os.environ.get('OPS_EVENT_VECTORS_DIR', '/tmp/ops-event-vectors')
+event_vectors_refresh_seconds = int(os.environ.get('OPS_EVENT_VECTORS_REFRESH_SECONDS', '600'))
+# Same model as the ops health knowledge base, dimensions only apply when a new index is created
+embedding_model_id = os.environ.get('EMBEDDING_MODEL_ID', 'amazon.titan-embed-text-v2:0')
+embedding_dimensions = int(os.environ.get('EMBEDDING_DIMENSIONS', '512'))
+embedding_max_chars = 20000
+
+event_lake_bucket = os.environ.get('EVENT_LAKE_BUCKET')
+event_lake_prefix = 'ops-events/'
+vectors_key = f"{event_vectors_prefix}/vectors.f32"
+metadata_key = f"{event_vectors_prefix}/metadata.json"
+
+# Event detail fields kept as result metadata, normalized as the knowledge base metadata sidecars (see ingestOpsKb)
+metadata_fields = ('eventArn', 'service', 'eventTypeCode', 'eventRegion', 'affectedAccount', 'statusCode')
+time_fields = ('startTime', 'endTime', 'lastUpdatedTime')
+
+# Synced on first search
+_event_vector_index_cache = None
+
+
+def embed_text(text, dimensions):
+    """Normalized embedding of a text as a float32 vector."""
+    response = get_client('bedrock-runtime').invoke_model(
+        modelId=embedding_model_id,
+        body=json.dumps({'inputText': text[:embedding_max_chars], 'dimensions': dimensions, 'normalize': True}),
+        contentType='application/json',
+        accept='application/json'
+    )
+    return np.asarray(json.loads(response['body'].read())['embedding'], dtype='<f4')
+
+
+def event_key(detail):
+    return f"{detail['eventArn']}~{detail.get('affectedAccount', '')}~{detail.get('eventRegion', '')}"
+
+
+def parse_time(value):
+    """Epoch seconds of a Health event time (RFC 1123 or ISO 8601), None when it cannot be parsed."""
+    try:
+        moment = parsedate_to_datetime(value) if ',' in value else datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def event_metadata(detail):
+    """Metadata attributes of a Health event: service upper case, status lower case, times in epoch seconds."""
+    metadata = {field: str(detail.get(field) or '') for field in metadata_fields}
+    metadata['service'] = metadata['service'].upper()
+    metadata['statusCode'] = metadata['statusCode'].lower()
+    for field in time_fields:
+        seconds = parse_time(detail.get(field))
+        if seconds is not None:
+            metadata[field] = seconds
+    return {key: value for key, value in metadata.items() if value != ''}
+
+
+def matches_filter(metadata, retrieval_filter):
+    """Evaluate a knowledge base metadata filter (equals, range operators, andAll) against document metadata."""
+    for operator, operand in retrieval_filter.items():
+        if operator == 'andAll':
+            if not all(matches_filter(metadata, condition) for condition in operand):
+                return False
+            continue
+        value = metadata.get(operand['key'])
+        if operator == 'equals':
+            matched = value == operand['value']
+        elif value is None or isinstance(value, str):
+            matched = False
+        elif operator == 'greaterThanOrEquals':
+            matched = value >= operand['value']
+        elif operator == 'lessThanOrEquals':
+            matched = value <= operand['value']
+        else:
+            raise ValueError(f"Unsupported filter operator {operator}")
+        if not matched:
+            return False
+    return True
+
+
+def read_lake_object(key):
+    """Events of an event lake object, Firehose writes them as concatenated JSON without delimiters."""
+    body = get_client('s3').get_object(Bucket=event_lake_bucket, Key=key)['Body'].read().decode('utf-8')
+    decoder = json.JSONDecoder()
+    events = []
+    position = 0
+    while position < len(body):
+        if body[position].isspace():
+            position += 1
+            continue
+        event, position = decoder.raw_decode(body, position)
+        events.append(event)
+    return events
+
+
+class EventVectorIndex:
+    """Embedding matrix with the event documents of its rows."""
+
+    def __init__(self, documents, vectors, dimensions, etag=None):
+        self.documents = documents
+        self.vectors = vectors
+        self.dimensions = dimensions
+        self.etag = etag
+
+    def search(self, query_vector, limit=25, retrieval_filter=None):
+        """(cosine similarity, document) of the best matching rows, only rows matching the metadata filter when given."""
+        rows = np.arange(len(self.documents))
+        if retrieval_filter:
+            rows = np.asarray([row for row, document in enumerate(self.documents) if matches_filter(document['metadata'], retrieval_filter)], dtype=np.int64)
+            if not len(rows):
+                return []
+        scores = (self.vectors if len(rows) == len(self.documents) else self.vectors[rows]) @ query_vector
+        if len(scores) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[position]), self.documents[rows[position]]) for position in top]
+
+
+# ----------------------------------------------------------------------------
+# Indexer
+# ----------------------------------------------------------------------------
+
+def load_metadata(if_none_match=None):
+    """(metadata, etag) of the stored index, (None, etag) when unchanged since if_none_match, empty metadata when there is none."""
+    s3_client = get_client('s3')
+    request = {'Bucket': event_vectors_bucket, 'Key': metadata_key}
+    if if_none_match:
+        request['IfNoneMatch'] = if_none_match
+    try:
+        response = s3_client.get_object(**request)
+    except s3_client.exceptions.NoSuchKey:
+        return {'model': embedding_model_id, 'dimensions': embedding_dimensions, 'count': 0, 'documents': []}, None
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == '304':
+            return None, if_none_match
+        raise
+    return json.loads(response['Body'].read().decode('utf-8')), response.get('ETag')
+
+
+def index_lake_objects(lake_keys):
+    """
+    Embed the Health events of the given event lake objects into the stored index, returns the number of rows
+    added or replaced. The matrix is written before the metadata, readers only map the rows the metadata lists.
+    """
+    s3_client = get_client('s3')
+    metadata, _ = load_metadata()
+    documents = metadata['documents']
+    dimensions = metadata['dimensions']
+    vectors = np.zeros((0, dimensions), dtype='<f4')
+    if documents:
+        body = s3_client.get_object(Bucket=event_vectors_bucket, Key=vectors_key)['Body'].read()
+        vectors = np.frombuffer(body, dtype='<f4').reshape(-1, dimensions)[:len(documents)].copy()
+    rows = {document['key']: row for row, document in enumerate(documents)}
+
+    replaced = {}
+    added = []
+    for lake_key in dict.fromkeys(lake_keys):
+        try:
+            events = read_lake_object(lake_key)
+        except (ClientError, ValueError) as e:
+            print(f"✗ Skipping event lake object {lake_key}: {str(e)}")
+            continue
+        for event in events:
+            detail = event.get('detail') or {}
+            if not isinstance(detail, dict) or 'eventArn' not in detail:
+                continue
+            key = event_key(detail)
+            row = rows.get(key)
+            if row is not None and documents[row]['metadata'].get('lastUpdatedTime') == parse_time(detail.get('lastUpdatedTime')):
+                continue
+            text = json.dumps(detail)
+            document = {'key': key, 'text': text, 'metadata': event_metadata(detail)}
+            vector = embed_text(text, dimensions)
+            if row is None:
+                rows[key] = len(documents)
+                documents.append(document)
+                added.append(vector)
+            elif row < len(vectors):
+                documents[row] = document
+                replaced[row] = vector
+            else:
+                # Added earlier in this run
+                documents[row] = document
+                added[row - len(vectors)] = vector
+
+    if not added and not replaced:
+        return 0
+    for row, vector in replaced.items():
+        vectors[row] = vector
+    if added:
+        vectors = np.vstack([vectors, np.stack(added)])
+
+    s3_client.put_object(Bucket=event_vectors_bucket, Key=vectors_key, Body=vectors.astype('<f4').tobytes(), ContentType='application/octet-stream')
+    metadata['count'] = len(documents)
+    s3_client.put_object(Bucket=event_vectors_bucket, Key=metadata_key, Body=json.dumps(metadata).encode('utf-8'), ContentType='application/json')
+    print(f"✓ Ops event vectors: {len(added)} added, {len(replaced)} replaced, {len(documents)} events indexed")
+    return len(added) + len(replaced)
+
+
+def lambda_handler(event, context):
+    """Index the event lake objects of the SQS records of S3 "Object Created" events."""
+    lake_keys = []
+    for record in event.get('Records', []):
+        detail = json.loads(record['body']).get('detail', {})
+        key = detail.get('object', {}).get('key', '')
+        if key.startswith(event_lake_prefix):
+            lake_keys.append(key)
+    # The function runs with reserved concurrency 1, a failed batch is delivered again as a whole
+    return {'indexed': index_lake_objects(lake_keys)}
+
+
+# ----------------------------------------------------------------------------
+# Search
+# ----------------------------------------------------------------------------
+
+def sync_index(cache):
+    """Download the index to local storage when it changed, returns the memory-mapped index or None without one."""
+    metadata, etag = load_metadata(cache.etag if cache is not None else None)
+    if metadata is None:
+        return cache
+    if not metadata['count']:
+        return None
+
+    os.makedirs(event_vectors_dir, exist_ok=True)
+    path = os.path.join(event_vectors_dir, 'vectors.f32')
+    response = get_client('s3').get_object(Bucket=event_vectors_bucket, Key=vectors_key)
+    # Replaced atomically, a previous memory map keeps the old file until it is released
+    with open(f"{path}.download", 'wb') as f:
+        for chunk in iter(lambda: response['Body'].read(1024 * 1024), b''):
+            f.write(chunk)
+    os.replace(f"{path}.download", path)
+
+    dimensions = metadata['dimensions']
+    vectors = np.memmap(path, dtype='<f4', mode='r', shape=(metadata['count'], dimensions))
+    return EventVectorIndex(metadata['documents'][:metadata['count']], vectors, dimensions, etag)
+
+
+def get_event_vector_index():
+    """The synced index, None when there is no index yet."""
+    global _event_vector_index_cache
+
+    cache = _event_vector_index_cache
+    if cache is not None and time.monotonic() - cache.loaded_at < event_vectors_refresh_seconds:
+        return cache
+
+    started = time.perf_counter()
+    index = sync_index(cache)
+    if index is not None:
+        if index is not cache:
+            print(f"Ops event vector index synced with {len(index.documents)} events in {(time.perf_counter() - started) * 1000:.0f}ms")
+        index.loaded_at = time.monotonic()
+    _event_vector_index_cache = index
+    return index
+
+
+def search_event_vectors(query, limit=25, retrieval_filter=None):
+    """Knowledge base shaped results for a query from the local index, None when there is no index."""
+    index = get_event_vector_index()
+    if index is None:
+        return None
+    matches = index.search(embed_text(query, index.dimensions), limit, retrieval_filter)
+    return [
+        {
+            "content": document['text'],
+            "content_metadata": dict(document['metadata'], score=round(score, 4))
+        }
+        for score, document in matches
+    ]
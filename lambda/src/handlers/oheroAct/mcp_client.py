@@ -3,6 +3,8 @@ import json
 import inspect
 from strands import tool
 from typing import List, Dict, Any, Callable, Optional
+from tracing import start_span, set_span_error
+from budget import tool_timeout_seconds
 
 
 class RemoteMCPClient:
@@ -17,7 +19,7 @@ class RemoteMCPClient:
             "method": "tools/list"
         }
 
-        response = requests.post(url, json=payload, timeout=30)
+        response = requests.post(url, json=payload, timeout=tool_timeout_seconds('tools/list', 30))
         response.raise_for_status()
         return response.json()
 
@@ -33,7 +35,8 @@ class RemoteMCPClient:
             }
         }
 
-        response = requests.post(url, json=payload, timeout=30)
+        # Capped by the time budget of the invocation (budget.py)
+        response = requests.post(url, json=payload, timeout=tool_timeout_seconds(tool_name, 30))
         response.raise_for_status()
         return response.json()
 
@@ -44,6 +47,7 @@ class MCPToolAdaptor:
     """
 
     def __init__(self, base_url: str):
+        self.base_url = base_url
         self.client = RemoteMCPClient(base_url)
 
     def list_tools_sync(self) -> List[Callable]:
@@ -51,7 +55,8 @@ class MCPToolAdaptor:
         List all available tools from the MCP server.
         """
 
-        response = self.client.list_tools()
+        with start_span("mcp tools/list", **{"rpc.system": "jsonrpc", "server.address": self.base_url}):
+            response = self.client.list_tools()
 
         if "result" not in response or "tools" not in response["result"]:
             raise ValueError(f"Invalid response from MCP server: {response}")
@@ -125,7 +130,10 @@ class MCPToolAdaptor:
 
                 # Call the MCP server
                 try:
-                    response = self.client.call_tool(name, validated_params)
+                    with start_span(f"mcp tools/call {name}", **{"rpc.system": "jsonrpc", "server.address": self.base_url}) as span:
+                        response = self.client.call_tool(name, validated_params)
+                        if "error" in response:
+                            set_span_error(span, str(response["error"]))
 
                     if "result" in response:
                         result = response["result"]
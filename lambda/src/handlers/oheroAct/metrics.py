@@ -0,0 +1,241 @@
+# ============================================================================
+# Per-invocation agent metrics in CloudWatch Embedded Metric Format (EMF)
+# ============================================================================
+import json
+import os
+import time
+
+metrics_namespace = os.environ.get('METRICS_NAMESPACE', 'Ohero')
+metrics_enabled = os.environ.get('EMIT_METRICS', 'true').lower() == 'true'
+
+# Dimensions shared by every metric of the current invocation, set by the handler
+_invocation_dimensions = {'DetailType': 'unknown'}
+
+
+def set_invocation_dimensions(detail_type=None):
+    _invocation_dimensions['DetailType'] = detail_type or 'unknown'
+
+
+def emf_line(dimensions, metrics, units, properties=None):
+    """Build one EMF log line, metric values may be lists to publish a distribution."""
+    record = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [
+                {
+                    'Namespace': metrics_namespace,
+                    'Dimensions': [list(dimensions.keys())],
+                    'Metrics': [{'Name': name, 'Unit': units.get(name, 'None')} for name in metrics]
+                }
+            ]
+        }
+    }
+    record.update(dimensions)
+    record.update(metrics)
+    record.update(properties or {})
+    return json.dumps(record, default=str)
+
+
+def _tool_durations(traces):
+    """Tool call durations in ms, in call order, from the event loop traces."""
+    durations = {}
+    for cycle_trace in traces:
+        for child_trace in getattr(cycle_trace, 'children', []):
+            metadata = getattr(child_trace, 'metadata', None)
+            if isinstance(metadata, dict) and metadata.get('tool_name'):
+                duration = child_trace.duration() if hasattr(child_trace, 'duration') else None
+                if duration is not None:
+                    durations.setdefault(metadata['tool_name'], []).append(round(duration * 1000, 1))
+    return durations
+
+
+def emit_agent_metrics(agent, result, session_id=None):
+    """Print EMF lines for the agent run that produced result, returns the emitted lines."""
+    if not metrics_enabled or not hasattr(result, 'metrics'):
+        return []
+
+    metrics = result.metrics
+    # Cached agents (e.g. the research agent) accumulate metrics across calls, only the delta since the last emit is reported
+    previous = getattr(agent, '_emitted_metrics_state', None) or {'cycles': 0, 'durations': 0, 'traces': 0, 'usage': {}, 'tools': {}, 'retries': 0, 'fallbacks': 0}
+
+    usage = dict(getattr(metrics, 'accumulated_usage', {}) or {})
+    cycle_durations = list(getattr(metrics, 'cycle_durations', []) or [])
+    traces = list(getattr(metrics, 'traces', []) or [])
+    tool_metrics = getattr(metrics, 'tool_metrics', {}) or {}
+    retries = getattr(agent, 'retry_count', 0)
+    fallbacks = getattr(agent, 'fallback_count', 0)
+
+    model_id = 'unknown'
+    if hasattr(agent, 'model') and hasattr(agent.model, 'config'):
+        model_id = agent.model.config.get('model_id', 'unknown')
+
+    dimensions = {
+        'Agent': getattr(agent, 'name', 'unknown_agent'),
+        'ModelId': model_id,
+        'DetailType': _invocation_dimensions['DetailType'],
+    }
+
+    tools_delta = {}
+    for tool_name, tool_data in tool_metrics.items():
+        calls, successes, errors = previous['tools'].get(tool_name, (0, 0, 0))
+        delta = (tool_data.call_count - calls, tool_data.success_count - successes, tool_data.error_count - errors)
+        if delta[0] > 0:
+            tools_delta[tool_name] = delta
+    tool_calls = sum(delta[0] for delta in tools_delta.values())
+    tool_successes = sum(delta[1] for delta in tools_delta.values())
+
+    event_metrics = {
+        'Cycles': getattr(metrics, 'cycle_count', 0) - previous['cycles'],
+        'Duration': int(sum(cycle_durations[previous['durations']:]) * 1000),
+        'ToolCalls': tool_calls,
+        'ToolSuccessRate': round(tool_successes / tool_calls * 100, 1) if tool_calls else 100.0,
+        'ModelRetries': retries - previous['retries'],
+        'ModelFallbacks': fallbacks - previous['fallbacks'],
+    }
+    for key in ('inputTokens', 'outputTokens', 'totalTokens', 'cacheReadInputTokens', 'cacheWriteInputTokens'):
+        name = key[0].upper() + key[1:]
+        event_metrics[name] = usage.get(key, 0) - previous['usage'].get(key, 0)
+
+    units = {'Duration': 'Milliseconds', 'ToolSuccessRate': 'Percent', 'ToolLatency': 'Milliseconds'}
+    units.update({name: 'Count' for name in event_metrics if name not in units})
+    properties = {'SessionId': session_id} if session_id else {}
+    lines = [emf_line(dimensions, event_metrics, units, properties)]
+
+    durations = _tool_durations(traces[previous['traces']:])
+    for tool_name, (calls, successes, errors) in tools_delta.items():
+        tool_dimensions = {'Agent': dimensions['Agent'], 'ToolName': tool_name}
+        tool_values = {
+            'ToolCalls': calls,
+            'ToolErrors': errors,
+            'ToolLatency': durations.get(tool_name, []),
+        }
+        lines.append(emf_line(tool_dimensions, tool_values, {'ToolCalls': 'Count', 'ToolErrors': 'Count', 'ToolLatency': 'Milliseconds'}, properties))
+
+    agent._emitted_metrics_state = {
+        'cycles': getattr(metrics, 'cycle_count', 0),
+        'durations': len(cycle_durations),
+        'traces': len(traces),
+        'usage': usage,
+        'tools': {name: (data.call_count, data.success_count, data.error_count) for name, data in tool_metrics.items()},
+        'retries': retries,
+        'fallbacks': fallbacks,
+    }
+
+    for line in lines:
+        print(line)
+    return lines
+
+
+def emit_dedupe_metrics(skipped, saved_tokens=0):
+    """Print the EMF line for a Health update that was skipped as unchanged or processed by the agent."""
+    if not metrics_enabled:
+        return None
+
+    values = {
+        'UpdatesSkipped': 1 if skipped else 0,
+        'UpdatesProcessed': 0 if skipped else 1,
+        'SavedTokens': saved_tokens,
+    }
+    line = emf_line({'DetailType': _invocation_dimensions['DetailType']}, values, {name: 'Count' for name in values})
+    print(line)
+    return line
+
+
+def emit_rule_metrics(rule_name, action):
+    """Print the EMF line for an event handled by a triage rule instead of the agent."""
+    if not metrics_enabled:
+        return None
+
+    line = emf_line({'Rule': rule_name, 'DetailType': _invocation_dimensions['DetailType']}, {'RuleMatched': 1}, {'RuleMatched': 'Count'}, {'Action': action})
+    print(line)
+    return line
+
+
+def emit_batch_metrics(batch_size, fallback_count, tokens_per_event):
+    """Print the EMF line for a group of related events triaged in one agent run."""
+    if not metrics_enabled:
+        return None
+
+    values = {
+        'BatchSize': batch_size,
+        'BatchFallbacks': fallback_count,
+        'TokensPerEvent': tokens_per_event,
+    }
+    line = emf_line({'DetailType': _invocation_dimensions['DetailType']}, values, {name: 'Count' for name in values})
+    print(line)
+    return line
+
+
+def emit_persistence_metrics(stage, duration_ms, failed=False):
+    """Print the EMF line for a background write of a knowledge report or agent memory."""
+    if not metrics_enabled:
+        return None
+
+    values = {'PersistenceMs': round(duration_ms, 1), 'PersistenceFailures': 1 if failed else 0}
+    line = emf_line({'Stage': stage, 'DetailType': _invocation_dimensions['DetailType']}, values, {'PersistenceMs': 'Milliseconds', 'PersistenceFailures': 'Count'})
+    print(line)
+    return line
+
+
+def emit_retrieval_metrics(tool_name, stop_reason, depth, results, tokens, calls, duration_ms):
+    """Print the EMF line for a knowledge base search of adaptive depth (see adaptive_retrieval.py)."""
+    if not metrics_enabled:
+        return None
+
+    values = {
+        'RetrievalDepth': depth,
+        'RetrievalResults': results,
+        'RetrievalTokens': tokens,
+        'RetrievalCalls': calls,
+        'RetrievalMs': round(duration_ms, 1),
+    }
+    units = {name: 'Count' for name in values}
+    units['RetrievalMs'] = 'Milliseconds'
+    line = emf_line({'Tool': tool_name, 'StopReason': stop_reason}, values, units, {'DetailType': _invocation_dimensions['DetailType']})
+    print(line)
+    return line
+
+
+def emit_routing_metrics(route, tier, escalation=None):
+    """Print the EMF line for the starting model the model router chose (see model_router.py)."""
+    if not metrics_enabled:
+        return None
+
+    values = {'ModelRouted': 1, 'ModelEscalations': 1 if escalation else 0}
+    line = emf_line({'Route': route, 'DetailType': _invocation_dimensions['DetailType']}, values, {name: 'Count' for name in values},
+                    {'Tier': tier, 'EscalationReason': escalation})
+    print(line)
+    return line
+
+
+def emit_budget_metrics(agent_name, stop_reason, cycles, remaining_ms):
+    """Print the EMF line for how an agent run ended against its cycle limit and time budget (see budget.py)."""
+    if not metrics_enabled:
+        return None
+
+    values = {'BudgetCycles': cycles, 'BudgetStops': 0 if stop_reason == 'completed' else 1}
+    units = {name: 'Count' for name in values}
+    if remaining_ms != float('inf'):
+        values['BudgetRemaining'] = remaining_ms
+        units['BudgetRemaining'] = 'Milliseconds'
+    line = emf_line({'Agent': agent_name, 'StopReason': stop_reason}, values, units)
+    print(line)
+    return line
+
+
+def emit_lease_metrics(outcome, waited_ms):
+    """Print the EMF line for how an event lease was obtained: acquired, waited, coalesced or deferred (see event_lease.py)."""
+    if not metrics_enabled:
+        return None
+
+    values = {
+        'LeaseContention': 0 if outcome == 'acquired' else 1,
+        'LeaseCoalesced': 1 if outcome == 'coalesced' else 0,
+        'LeaseDeferred': 1 if outcome == 'deferred' else 0,
+        'LeaseWaitMs': round(waited_ms, 1),
+    }
+    units = {name: 'Count' for name in values}
+    units['LeaseWaitMs'] = 'Milliseconds'
+    line = emf_line({'Outcome': outcome, 'DetailType': _invocation_dimensions['DetailType']}, values, units)
+    print(line)
+    return line
@@ -0,0 +1,199 @@
+# ============================================================================
+# Task-complexity router choosing the starting model of the ops agent
+# ============================================================================
+# Routes are loaded from ops_agent/model_routes.json and compiled once per container with the triage rule conditions
+# (see rules.py). The first enabled route whose conditions all match the task picks its tier, a named index into
+# ResilientAgent.supported_models. Fields refer to event.* (event detail), finding.* (first Security Hub finding) and
+# task.* (chars, historyMessages, followUp). Tasks no route matches start on the preferred model (OPS_AGENT_MODEL_IDX),
+# or, with MODEL_ROUTER_MODE=model, on the tier a small classifier model (ROUTER_MODEL_ID) answers.
+# A run on a lighter tier is escalated to the preferred model when its output has low confidence (no acknowledgement
+# of an event waiting for one, an empty or hedging answer) and it did not change any state yet; the run is then
+# repeated from the same conversation. MODEL_ROUTER_MODE=off always starts on the preferred model.
+import json
+import os
+import re
+from aws_clients import get_client
+from rules import compile_condition
+from metrics import emit_routing_metrics
+from budget import current_budget
+
+routes_path = os.environ.get('MODEL_ROUTES_PATH', os.path.join(os.path.dirname(__file__), "ops_agent", "model_routes.json"))
+router_mode = os.environ.get('MODEL_ROUTER_MODE', 'rules').lower() # rules | model | off
+router_model_id = os.environ.get('ROUTER_MODEL_ID', 'us.amazon.nova-micro-v1:0')
+preferred_model_idx = int(os.environ.get('OPS_AGENT_MODEL_IDX', '2'))
+# Chat messages up to this size that continue a restored thread count as follow-ups
+follow_up_max_chars = int(os.environ.get('ROUTER_FOLLOW_UP_MAX_CHARS', '600'))
+
+preferred_tier = 'preferred'
+# Tools whose calls change state, a run that made one is never repeated on another model
+state_changing_tools = ('acknowledge_event', 'create_ticket', 'update_ticket')
+
+_hedging_pattern = re.compile(r"\b(not sure|unsure|unable to (determine|decide)|cannot (determine|decide)|insufficient information|I don't know)\b", re.IGNORECASE)
+
+classifier_prompt = """Classify how much reasoning an operations agent needs for the task below.
+Answer "simple" when it only has to acknowledge an event or answer a short question, "complex" when it has to research, assess impact or create tickets.
+Answer with one word.
+
+<task>{}</task>"""
+
+# Compiled on first routing
+_routes_cache = None
+
+
+class ModelRoute:
+    """A compiled route: detail types it applies to, conditions that must all match, and the tier to start on."""
+
+    def __init__(self, spec, tiers):
+        self.name = spec['name']
+        self.tier = spec['tier']
+        self.detail_types = frozenset(spec.get('detailTypes', []))
+        self.conditions = [compile_condition(condition) for condition in spec.get('all', [])]
+
+        if self.tier not in tiers:
+            raise ValueError(f"Route '{self.name}' has unknown tier '{self.tier}'")
+        if not self.conditions:
+            raise ValueError(f"Route '{self.name}' has no conditions")
+        self.model_idx = tiers[self.tier]
+
+    def matches(self, detail_type, facts):
+        if self.detail_types and detail_type not in self.detail_types:
+            return False
+        for condition in self.conditions:
+            if not condition(facts):
+                return False
+        return True
+
+
+class RoutingDecision:
+    """Starting model of a task: tier name, model index and the route (or classifier) that chose it."""
+
+    def __init__(self, tier, model_idx, route):
+        self.tier = tier
+        self.model_idx = model_idx
+        self.route = route
+        self.escalation = None # reason the run was repeated on the preferred model
+
+    @property
+    def escalates(self):
+        return self.model_idx != preferred_model_idx
+
+
+def compile_routes(document):
+    """(tiers, compiled enabled routes) of a routes document, in file order."""
+    tiers = dict(document.get('tiers', {}), **{preferred_tier: preferred_model_idx})
+    return tiers, [ModelRoute(spec, tiers) for spec in document.get('routes', []) if spec.get('enabled', True)]
+
+
+def get_routes():
+    global _routes_cache
+
+    if _routes_cache is None:
+        try:
+            with open(routes_path, 'r') as f:
+                _routes_cache = compile_routes(json.load(f))
+            print(f"Model routes compiled: {len(_routes_cache[1])} enabled routes from {routes_path}")
+        except Exception as e:
+            # An invalid routes file must not stop triage, every task then starts on the preferred model
+            print(f"✗ Failed to compile model routes, all tasks start on the preferred model: {str(e)}")
+            _routes_cache = ({preferred_tier: preferred_model_idx}, [])
+
+    return _routes_cache
+
+
+def build_facts(detail_type, event_context, task, history_messages):
+    """Values route fields refer to: event.* (event detail), finding.* (first Security Hub finding), task.*"""
+    detail = (event_context or {}).get('eventDetail') or {}
+    findings = detail.get('findings') or [None]
+    return {
+        'event': detail,
+        'finding': findings[0],
+        'task': {
+            'chars': len(task),
+            'historyMessages': history_messages,
+            'followUp': detail_type == 'Chat.SlackMessageReceived' and history_messages > 0 and len(task) <= follow_up_max_chars,
+        }
+    }
+
+
+def classify_with_model(task):
+    """Tier the classifier model answers for a task, None when it fails or answers something else."""
+    try:
+        response = get_client('bedrock-runtime').converse(
+            modelId=router_model_id,
+            messages=[{'role': 'user', 'content': [{'text': classifier_prompt.format(task[:4000])}]}],
+            inferenceConfig={'maxTokens': 5, 'temperature': 0.0}
+        )
+        answer = response['output']['message']['content'][0]['text'].strip().lower()
+    except Exception as e:
+        print(f"✗ Model router classifier failed: {str(e)}")
+        return None
+    if answer.startswith('simple'):
+        return 'light'
+    if answer.startswith('complex'):
+        return preferred_tier
+    return None
+
+
+def route_task(detail_type, event_context, task, history_messages=0, mode=None):
+    """Starting model of the ops agent for a task."""
+    mode = mode or router_mode
+    if mode == 'off':
+        return RoutingDecision(preferred_tier, preferred_model_idx, 'off')
+
+    tiers, routes = get_routes()
+    facts = build_facts(detail_type, event_context, task, history_messages)
+    for route in routes:
+        if route.matches(detail_type, facts):
+            return RoutingDecision(route.tier, route.model_idx, route.name)
+
+    if mode == 'model':
+        tier = classify_with_model(task)
+        if tier in tiers:
+            return RoutingDecision(tier, tiers[tier], 'classifier')
+    return RoutingDecision(preferred_tier, preferred_model_idx, 'default')
+
+
+def low_confidence(output_text, tools_called, awaiting_acknowledgement=False):
+    """Why a run's output has low confidence and can be repeated on the preferred model, None when it is kept."""
+    # Repeating a run that already acknowledged the event or wrote tickets would act twice
+    if any(name in state_changing_tools for name in tools_called):
+        return None
+    if awaiting_acknowledgement:
+        return 'not_acknowledged'
+    if not output_text.strip():
+        return 'empty_output'
+    if _hedging_pattern.search(output_text):
+        return 'uncertain_output'
+    return None
+
+
+def tools_called_since(messages, start):
+    """Names of the tools the agent called in the messages after position start."""
+    return [
+        block['toolUse']['name']
+        for message in messages[start:] if message.get('role') == 'assistant'
+        for block in message.get('content', []) if isinstance(block, dict) and 'toolUse' in block
+    ]
+
+
+def run_routed(agent, task, decision, awaiting_acknowledgement=False):
+    """
+    Run the agent on the routed model, repeating the run from the same conversation on the preferred model when the
+    output of a lighter model has low confidence. Returns the result of the run that is kept.
+    """
+    agent.model_idx = decision.model_idx
+    messages_before = list(agent.messages)
+    result = agent(task)
+
+    # A repeated run needs the time of a whole run, near the deadline the lighter model's output is kept
+    if decision.escalates and not current_budget().exhausted():
+        tools_called = tools_called_since(agent.messages, len(messages_before))
+        decision.escalation = low_confidence(str(result), tools_called, awaiting_acknowledgement)
+        if decision.escalation:
+            print(f"ℹ Escalating from {decision.tier} to the preferred model: {decision.escalation}")
+            agent.messages = messages_before
+            agent.model_idx = preferred_model_idx
+            result = agent(task)
+
+    emit_routing_metrics(decision.route, decision.tier, decision.escalation)
+    return result
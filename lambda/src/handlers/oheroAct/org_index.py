@@ -0,0 +1,96 @@
+# ============================================================================
+# In-memory index over organization accounts for the lookup_accounts tool
+# ============================================================================
+import json
+import os
+from aws_clients import get_client
+
+# Optional S3 location of the saveAccountInfo snapshot, falls back to the file packaged with the function. No stack
+# deploys saveAccountInfo, so live data needs ORG_DATA_BUCKET set by hand (and s3:GetObject on it for the function)
+org_data_bucket = os.environ.get('ORG_DATA_BUCKET')
+org_data_key = os.environ.get('ORG_DATA_KEY', 'account-info/accounts.json')
+org_data_path = os.path.join(os.path.dirname(__file__), "ops_agent", "organization_accounts.json")
+
+# Loaded once per container on first lookup
+_org_index_cache = None
+
+
+class OrganizationIndex:
+    """Compact lookup tables over the saveAccountInfo output, keyed by account ID, name, tag, OU and owning team."""
+
+    def __init__(self, accounts):
+        self.accounts = []
+        self.by_id = {}
+        self.by_name = {}
+        self.by_tag = {}
+        self.by_ou = {}
+        self.by_team = {}
+
+        for account in accounts:
+            record = {
+                'id': account['id'],
+                'name': account.get('name', ''),
+                'status': account.get('status', ''),
+                'tags': account.get('tags', {}),
+                'ou_names': account.get('ou_names', [])
+            }
+            position = len(self.accounts)
+            self.accounts.append(record)
+            self.by_id[record['id']] = position
+            self.by_name.setdefault(record['name'].lower(), set()).add(position)
+            for key, value in record['tags'].items():
+                self.by_tag.setdefault(f"{key}={value}".lower(), set()).add(position)
+                self.by_tag.setdefault(key.lower(), set()).add(position)
+            for ou_name in record['ou_names']:
+                self.by_ou.setdefault(ou_name.lower(), set()).add(position)
+            team = record['tags'].get('team')
+            if team:
+                self.by_team.setdefault(team.lower(), set()).add(position)
+
+    def lookup(self, account_id='', name='', tag='', ou='', team=''):
+        """Return accounts matching ALL given criteria, an empty result means the account is unknown."""
+        candidates = None
+
+        def narrow(positions):
+            nonlocal candidates
+            candidates = set(positions) if candidates is None else candidates & positions
+
+        if account_id:
+            position = self.by_id.get(str(account_id).strip())
+            narrow({position} if position is not None else set())
+        if name:
+            narrow(self.by_name.get(name.strip().lower(), set()))
+        if tag:
+            narrow(self.by_tag.get(tag.replace(' ', '').lower(), set()))
+        if ou:
+            narrow(self.by_ou.get(ou.strip().lower(), set()))
+        if team:
+            narrow(self.by_team.get(team.strip().lower(), set()))
+
+        if candidates is None:
+            return []
+        return [self.accounts[position] for position in sorted(candidates)]
+
+
+def load_organization_data():
+    """Load the saveAccountInfo output, from S3 when configured, otherwise from the packaged file."""
+    if org_data_bucket:
+        try:
+            response = get_client('s3').get_object(Bucket=org_data_bucket, Key=org_data_key)
+            print(f"✓ Organization data loaded from S3: s3://{org_data_bucket}/{org_data_key}")
+            return json.loads(response['Body'].read().decode('utf-8'))
+        except Exception as e:
+            print(f"✗ Failed to load organization data from S3, using packaged data: {str(e)}")
+
+    with open(org_data_path, 'r') as f:
+        return json.load(f)
+
+
+def get_organization_index() -> OrganizationIndex:
+    global _org_index_cache
+
+    if _org_index_cache is None:
+        _org_index_cache = OrganizationIndex(load_organization_data().get('accounts', []))
+        print(f"Organization index built with {len(_org_index_cache.accounts)} accounts")
+
+    return _org_index_cache
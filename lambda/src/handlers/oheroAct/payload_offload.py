@@ -0,0 +1,58 @@
+# ============================================================================
+# Large payload offload to the transient payloads bucket
+# ============================================================================
+# Step Functions states and EventBridge entries are limited to 256 KB. Inputs larger than that are stored by the
+# chat handlers (handleSlackComm, handleWebChatComm) and passed as payloadS3Key, outputs above the threshold are
+# stored gzip compressed here and replaced by a short preview followed by a reference:
+#   ohero-payload+s3://<bucket>/<key>
+# Consumers (slackMe, webChatMe) replace a text carrying a reference with the stored payload, only for references to
+# their PAYLOAD_BUCKET under offload_prefix. Objects live under the ops-event-payloads/ prefix, which the bucket
+# lifecycle rule expires.
+import gzip
+import os
+import uuid
+from aws_clients import get_client
+
+transient_payload_bucket = os.environ['MEM_BUCKET']
+offload_threshold_bytes = int(os.environ.get('PAYLOAD_OFFLOAD_THRESHOLD_BYTES', '32768'))
+offload_preview_chars = int(os.environ.get('PAYLOAD_OFFLOAD_PREVIEW_CHARS', '1000'))
+offload_prefix = 'ops-event-payloads/agent-outputs'
+
+reference_scheme = 'ohero-payload+s3://'
+
+
+def load_payload(key):
+    """Text of a stored payload, decompressed when it was stored gzip encoded."""
+    response = get_client('s3').get_object(Bucket=transient_payload_bucket, Key=key)
+    body = response['Body'].read()
+    if response.get('ContentEncoding') == 'gzip' or key.endswith('.gz'):
+        body = gzip.decompress(body)
+    return body.decode('utf-8')
+
+
+def offload_text(text, name):
+    """
+    Return text unchanged when it is below the offload threshold, otherwise store it compressed and return
+    a preview with the reference to the stored payload. The text is returned unchanged when storing fails.
+    """
+    encoded = text.encode('utf-8')
+    if len(encoded) <= offload_threshold_bytes:
+        return text
+
+    key = f"{offload_prefix}/{name}-{uuid.uuid4().hex[:8]}.txt.gz"
+    compressed = gzip.compress(encoded)
+    try:
+        get_client('s3').put_object(
+            Bucket=transient_payload_bucket,
+            Key=key,
+            Body=compressed,
+            ContentType='text/plain; charset=utf-8',
+            ContentEncoding='gzip'
+        )
+    except Exception as e:
+        print(f"✗ Failed to offload large payload, returning it inline: {str(e)}")
+        return text
+
+    print(f"✓ Payload of {len(encoded)} bytes offloaded ({len(compressed)} bytes compressed): s3://{transient_payload_bucket}/{key}")
+    preview = text[:offload_preview_chars].rsplit(' ', 1)[0] if len(text) > offload_preview_chars else text
+    return f"{preview}...\n\n{reference_scheme}{transient_payload_bucket}/{key}"
@@ -0,0 +1,92 @@
+# ============================================================================
+# Background persistence of knowledge reports and agent memory
+# ============================================================================
+# The knowledge report and the agent memory are written concurrently on a small executor as soon as the agent result
+# exists, while the handler prepares its response. The handler then waits for them within the time the invocation has
+# left: its budget plus the reserve kept for saving, less PERSISTENCE_RETURN_MARGIN_MS to return the response. Lambda
+# may reclaim a container frozen with writes still running, so a write still running when the handler returns is
+# counted as failed (PersistenceFailures) and logged as an error rather than left for the next invocation; that
+# invocation still waits for it before loading any memory. Failed writes are counted the same way, the knowledge report
+# itself is always printed to the log before it is written.
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from budget import current_budget, reserve_ms
+from metrics import emit_persistence_metrics
+from tracing import start_span
+
+persistence_return_margin_ms = int(os.environ.get('PERSISTENCE_RETURN_MARGIN_MS', '1000'))
+# Writes left over from a previous invocation must finish before the next one reads the memory
+persistence_drain_timeout_ms = int(os.environ.get('PERSISTENCE_DRAIN_TIMEOUT_MS', '30000'))
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='persistence')
+# Running writes: future -> {'stage', 'started', 'reported'}
+_pending = {}
+_report_lock = threading.Lock()
+
+
+def _report(write, saved):
+    """Count the outcome of a write once, at its completion or when the invocation returns without it."""
+    with _report_lock:
+        if write['reported']:
+            return False
+        write['reported'] = True
+    emit_persistence_metrics(write['stage'], (time.perf_counter() - write['started']) * 1000, failed=not saved)
+    return True
+
+
+def _run(write, function, args):
+    stage = write['stage']
+    try:
+        with start_span(stage):
+            # The save functions log their own errors and return None instead of the S3 key
+            saved = function(*args) is not None
+    except Exception as e:
+        print(f"✗ {stage} failed: {str(e)}")
+        saved = False
+    if not saved:
+        print(f"✗ {stage} did not persist (session data of this invocation is missing in S3)")
+    if not _report(write, saved):
+        print(f"ℹ {stage} {'completed' if saved else 'failed'} after the invocation that started it returned")
+    return saved
+
+
+def persist_in_background(stage, function, *args):
+    """Run a save function on the persistence executor, in the tracing context of the caller."""
+    write = {'stage': stage, 'started': time.perf_counter(), 'reported': False}
+    future = _executor.submit(contextvars.copy_context().run, _run, write, function, args)
+    _pending[future] = write
+    future.add_done_callback(lambda done: _pending.pop(done, None))
+    return future
+
+
+def invocation_time_left_ms():
+    """Time the handler can wait for writes before it has to return."""
+    remaining = current_budget().remaining_ms()
+    if remaining == float('inf'):
+        return persistence_drain_timeout_ms
+    return max(0, remaining + reserve_ms - persistence_return_margin_ms)
+
+
+def wait_for_persistence(futures, deadline_ms=None):
+    """
+    Wait for the given writes, by default for as long as the invocation has left. Returns True when all of them
+    completed, writes still running are counted as failed.
+    """
+    deadline_ms = invocation_time_left_ms() if deadline_ms is None else deadline_ms
+    _, not_done = wait(futures, timeout=deadline_ms / 1000)
+    for future in not_done:
+        write = _pending.get(future)
+        if write and _report(write, False):
+            print(f"✗ {write['stage']} still running after {deadline_ms}ms at the end of the invocation, counted as failed: "
+                  "its data is lost if the container is reclaimed before its next invocation")
+    return not not_done
+
+
+def drain_persistence():
+    """Wait for writes left over from a previous invocation of this container."""
+    if _pending:
+        print(f"ℹ Waiting for {len(_pending)} persistence writes of a previous invocation")
+        wait_for_persistence(list(_pending), persistence_drain_timeout_ms)
@@ -0,0 +1,176 @@
+# ============================================================================
+# Prompt cache checkpoints of the agents' Bedrock requests
+# ============================================================================
+# Bedrock caches the request prefix up to each cache point, in the order tool definitions, system prompt, messages.
+# Which checkpoints a request carries depends on the model family (PROMPT_CACHE_POINTS, JSON object of family to
+# checkpoint list, overrides the defaults below):
+#   tools   - after the tool definitions (cache_tools of the Bedrock model)
+#   system  - after the system prompt (cache_prompt of the Bedrock model)
+#   history - at the end of the last user message before the current task, i.e. of the history restored from memory,
+#             so a follow-up chat turn reads the prior conversation from the cache instead of sending it uncached
+#   turn    - at the end of the last user message (task or tool results), the next cycle of the turn reads up to it
+# Message checkpoints are only placed on user messages, which every caching model family accepts.
+# Bedrock allows 4 cache points per request. Families without an entry (or with an empty list) get no cache points.
+# A model that rejects a request with cache points is used without them for the rest of the container's life.
+# Message checkpoints are added to a copy of the request messages, the agent's conversation (and its saved memory)
+# never holds cache points.
+import json
+import os
+from strands.models import Model
+
+default_cache_points = {
+    'anthropic': ['tools', 'system', 'history', 'turn'],
+    'nova': ['system', 'history', 'turn'],
+}
+supported_cache_points = ('tools', 'system', 'history', 'turn')
+max_cache_points = 4
+
+
+def load_cache_points():
+    """Checkpoints per model family, the defaults when PROMPT_CACHE_POINTS is unset or invalid."""
+    configured = os.environ.get('PROMPT_CACHE_POINTS')
+    if not configured:
+        return default_cache_points
+    try:
+        families = json.loads(configured)
+        for family, points in families.items():
+            unknown = [point for point in points if point not in supported_cache_points]
+            if unknown or len(points) > max_cache_points:
+                raise ValueError(f"invalid cache points for {family}: {points}")
+        return families
+    except Exception as e:
+        print(f"✗ Invalid PROMPT_CACHE_POINTS, using the defaults: {str(e)}")
+        return default_cache_points
+
+
+cache_points_by_family = load_cache_points()
+
+
+def model_family(model_id):
+    model_id = model_id.lower()
+    if 'anthropic' in model_id or 'claude' in model_id:
+        return 'anthropic'
+    if 'nova' in model_id:
+        return 'nova'
+    return model_id.split('.')[-2] if '.' in model_id else model_id
+
+
+def cache_points(model_id):
+    return cache_points_by_family.get(model_family(model_id), [])
+
+
+def cache_config(model_id, enable_cache_prompt, enable_cache_tools):
+    """cache_prompt and cache_tools arguments of a Bedrock model for the checkpoints of its family."""
+    points = cache_points(model_id)
+    return {
+        'cache_prompt': "default" if enable_cache_prompt and 'system' in points else None,
+        'cache_tools': "default" if enable_cache_tools and 'tools' in points else None,
+    }
+
+
+def last_user_message(messages, before, with_text=False):
+    """Position of the last user message before a position (with text: a task, not tool results), None without one."""
+    for position in range(before - 1, -1, -1):
+        message = messages[position]
+        if message.get('role') != 'user':
+            continue
+        if not with_text or any('text' in block for block in message.get('content', [])):
+            return position
+    return None
+
+
+def with_message_cache_points(messages, points):
+    """Copy of the messages with the history and turn checkpoints the points ask for, placed on user messages."""
+    positions = set()
+    if 'history' in points:
+        task = last_user_message(messages, len(messages), with_text=True)
+        history = last_user_message(messages, task) if task else None
+        if history is not None:
+            positions.add(history)
+    if 'turn' in points:
+        turn = last_user_message(messages, len(messages))
+        if turn is not None:
+            positions.add(turn)
+
+    marked = list(messages)
+    for position in positions:
+        content = marked[position].get('content', [])
+        if content and not any('cachePoint' in block for block in content):
+            marked[position] = dict(marked[position], content=content + [{'cachePoint': {'type': 'default'}}])
+    return marked
+
+
+def is_cache_rejection(error):
+    """Whether a model error is the request being rejected for its cache points."""
+    message = str(error)
+    return 'ValidationException' in message and 'cach' in message.lower()
+
+
+class CacheCheckpointModel(Model):
+    """Wraps a model to add the message checkpoints of its family to each request and log the cache use of each call."""
+
+    def __init__(self, inner, points):
+        self.inner = inner
+        self.points = points
+        self.enabled = True
+
+    @property
+    def config(self):
+        return self.inner.config
+
+    @property
+    def client(self):
+        return getattr(self.inner, 'client', None)
+
+    def update_config(self, **model_config):
+        self.inner.update_config(**model_config)
+
+    def get_config(self):
+        return self.inner.get_config()
+
+    def structured_output(self, output_model, prompt, system_prompt=None, **kwargs):
+        return self.inner.structured_output(output_model, prompt, system_prompt=system_prompt, **kwargs)
+
+    def disable(self, error):
+        """Send requests of this model without cache points from now on."""
+        print(f"✗ {self.config.get('model_id', 'unknown')} rejected prompt cache points, caching disabled: {str(error)}")
+        self.enabled = False
+        self.inner.update_config(cache_prompt=None, cache_tools=None)
+
+    async def stream(self, messages, tool_specs=None, system_prompt=None, **kwargs):
+        request_messages = with_message_cache_points(messages, self.points) if self.enabled else messages
+        streamed = False
+        try:
+            async for event in self.inner.stream(request_messages, tool_specs, system_prompt, **kwargs):
+                streamed = True
+                if 'metadata' in event:
+                    self.log_usage(event['metadata'].get('usage', {}))
+                yield event
+        except Exception as e:
+            if streamed or not self.enabled or not is_cache_rejection(e):
+                raise
+            self.disable(e)
+            async for event in self.inner.stream(messages, tool_specs, system_prompt, **kwargs):
+                yield event
+
+    def log_usage(self, usage):
+        read, write = usage.get('cacheReadInputTokens', 0), usage.get('cacheWriteInputTokens', 0)
+        if read or write:
+            print(f"ℹ Prompt cache {self.config.get('model_id', 'unknown')}: read {read}, write {write}, uncached {usage.get('inputTokens', 0)} input tokens")
+
+
+def with_cache_checkpoints(models, enabled):
+    """Wrap the models whose family has message checkpoints, otherwise return them unchanged."""
+    if not enabled:
+        return models
+    wrapped = []
+    for model in models:
+        points = [point for point in cache_points(model.config.get('model_id', '')) if point in ('history', 'turn')]
+        wrapped.append(CacheCheckpointModel(model, points) if points else model)
+    return wrapped
+
+
+def turn_cache_usage(result):
+    """(cache read, cache write, uncached input) tokens of an agent run."""
+    usage = getattr(getattr(result, 'metrics', None), 'accumulated_usage', None) or {}
+    return usage.get('cacheReadInputTokens', 0), usage.get('cacheWriteInputTokens', 0), usage.get('inputTokens', 0)
@@ -0,0 +1,187 @@
+# ============================================================================
+# Mode-specific system prompts and tools of the ops agent
+# ============================================================================
+# The manifest (ops_agent/prompt_manifest.json) declares per mode (acknowledge, triage, consult, chat) the stage and
+# data components system.md imports and the tools the agent gets. Imports of components a mode leaves out are replaced
+# with the manifest's short "omitted" note, so an event run does not carry the Consult stage and a question does not
+# carry the Triage playbook. Each mode's prompt is compiled once per container, only the current date and the user
+# interaction setting are filled in per call. Selection rules use the triage rule conditions (see rules.py) on event.*,
+# finding.* and task.* (text, chars, continuesSession), the first enabled matching rule picks the mode, else defaultMode.
+# An invalid manifest falls back to the full prompt and all tools (mode 'chat').
+import json
+import os
+import re
+from datetime import datetime
+from rules import compile_condition
+from tools import (
+    search_ops_events,
+    search_sec_findings,
+    acknowledge_event,
+    create_ticket,
+    update_ticket,
+    search_tickets_by_event_key,
+    lookup_accounts,
+    search_past_resolutions,
+    ask_aws
+)
+
+prompts_dir = os.path.join(os.path.dirname(__file__), "ops_agent")
+manifest_path = os.environ.get('PROMPT_MANIFEST_PATH', os.path.join(prompts_dir, "prompt_manifest.json"))
+
+ops_agent_tools = {
+    tool.tool_name: tool for tool in (
+        search_ops_events,
+        search_sec_findings,
+        acknowledge_event,
+        create_ticket,
+        update_ticket,
+        search_tickets_by_event_key,
+        lookup_accounts,
+        search_past_resolutions,
+        ask_aws
+    )
+}
+default_components = ("acknowledge.md", "consult.md", "triage.md", "organization_data.md", "references.md")
+fallback_mode = 'chat'
+
+_import_pattern = re.compile(r'\{\{import:([A-Za-z0-9_.\-]+)\}\}')
+
+# Compiled on first use
+_manifest_cache = None
+
+
+class PromptMode:
+    """A compiled mode: system prompt template with its imports resolved, and the tools of the mode."""
+
+    def __init__(self, name, template, tool_names):
+        unknown = [tool_name for tool_name in tool_names if tool_name not in ops_agent_tools]
+        if unknown:
+            raise ValueError(f"Mode '{name}' has unknown tools: {', '.join(unknown)}")
+        self.name = name
+        self.template = template
+        self.tool_names = list(tool_names)
+
+    @property
+    def tools(self):
+        return [ops_agent_tools[tool_name] for tool_name in self.tool_names]
+
+    def system_prompt(self, conversational):
+        """System prompt of the mode for the current call."""
+        # The hour keeps the prompt identical across the turns of a chat thread, so they can read it from the prompt cache
+        current_hour = datetime.now().replace(minute=0, second=0, microsecond=0)
+        return (self.template
+                .replace("{{currentDateTime}}", current_hour.isoformat())
+                .replace("{{USER_INTERACTION_ALLOWED_SETTING}}", str(conversational)))
+
+
+class ModeSelection:
+    """A compiled selection rule: detail types it applies to, conditions that must all match, and the mode to use."""
+
+    def __init__(self, spec, modes):
+        self.name = spec['name']
+        self.mode = spec['mode']
+        self.detail_types = frozenset(spec.get('detailTypes', []))
+        self.conditions = [compile_condition(condition) for condition in spec.get('all', [])]
+
+        if self.mode not in modes:
+            raise ValueError(f"Selection '{self.name}' has unknown mode '{self.mode}'")
+        if not self.detail_types and not self.conditions:
+            raise ValueError(f"Selection '{self.name}' has neither detail types nor conditions")
+
+    def matches(self, detail_type, facts):
+        if self.detail_types and detail_type not in self.detail_types:
+            return False
+        for condition in self.conditions:
+            if not condition(facts):
+                return False
+        return True
+
+
+def read_component(filename):
+    with open(os.path.join(prompts_dir, filename), 'r') as f:
+        return f.read()
+
+
+def compile_template(base, components, omitted):
+    """Base prompt with the imports of the components replaced by their content, other imports by their omitted note."""
+    def resolve(match):
+        filename = match.group(1)
+        if filename in components:
+            return components[filename]
+        return omitted.get(filename, "Not used for this task.")
+    return _import_pattern.sub(resolve, base)
+
+
+def compile_manifest(document):
+    """(modes by name, compiled enabled selection rules, default mode name) of a manifest document."""
+    base = read_component(document.get('base', 'system.md'))
+    omitted = document.get('omitted', {})
+    contents = {}
+    modes = {}
+    for name, spec in document['modes'].items():
+        for filename in spec['components']:
+            if filename not in contents:
+                contents[filename] = read_component(filename)
+        template = compile_template(base, {filename: contents[filename] for filename in spec['components']}, omitted)
+        modes[name] = PromptMode(name, template, spec['tools'])
+
+    default_mode = document.get('defaultMode', fallback_mode)
+    if default_mode not in modes:
+        raise ValueError(f"Unknown default mode '{default_mode}'")
+    selections = [ModeSelection(spec, modes) for spec in document.get('selection', []) if spec.get('enabled', True)]
+    return modes, selections, default_mode
+
+
+def fallback_manifest():
+    """Full prompt and all tools, as before prompt modes."""
+    components = {}
+    for filename in default_components:
+        try:
+            components[filename] = read_component(filename)
+        except Exception as e:
+            print(f"Error loading {filename}: {str(e)}")
+            components[filename] = f"[ERROR: Could not load {filename}]"
+    template = compile_template(read_component('system.md'), components, {})
+    return {fallback_mode: PromptMode(fallback_mode, template, list(ops_agent_tools))}, [], fallback_mode
+
+
+def get_manifest():
+    global _manifest_cache
+
+    if _manifest_cache is None:
+        try:
+            with open(manifest_path, 'r') as f:
+                _manifest_cache = compile_manifest(json.load(f))
+            modes = _manifest_cache[0]
+            print(f"Prompt modes compiled: {', '.join(f'{name} (~{len(mode.template) // 4} tokens)' for name, mode in modes.items())}")
+        except Exception as e:
+            # An invalid manifest must not stop the agent, every task then gets the full prompt
+            print(f"✗ Failed to compile prompt manifest, using the full prompt: {str(e)}")
+            _manifest_cache = fallback_manifest()
+
+    return _manifest_cache
+
+
+def get_mode(name=None):
+    """Compiled mode by name, the default mode when it is not given or unknown."""
+    modes, _, default_mode = get_manifest()
+    return modes.get(name) or modes[default_mode]
+
+
+def select_mode(detail_type, event_context, task, continues_session=False):
+    """Name of the mode the first matching selection rule picks for a task, else the default mode."""
+    _, selections, default_mode = get_manifest()
+    detail = (event_context or {}).get('eventDetail') or {}
+    facts = {
+        'event': detail,
+        'finding': (detail.get('findings') or [None])[0],
+        'task': {
+            'text': task,
+            'chars': len(task),
+            'continuesSession': continues_session,
+        }
+    }
+    for selection in selections:
+        if selection.matches(detail_type, facts):
+            return selection.mode
+    return default_mode
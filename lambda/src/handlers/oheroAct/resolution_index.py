@@ -0,0 +1,308 @@
+# ============================================================================
+# BM25 index over past OHERO knowledge reports for the search_past_resolutions tool
+# ============================================================================
+# Every agent run leaves an ohero-knowledge/{session_id}.md report in the knowledge bucket (see save_knowledge).
+# The indexer (lambda_handler below, fed by the S3 "Object Created" events of these reports) parses each report into
+# a document of its task, tool list and final output, with the event keys (EventPk) of the task as metadata, and adds
+# it to an inverted index stored as gzip compressed JSON shards in the transient payloads bucket:
+#   ohero-knowledge-index/manifest.json        shard list and the shard holding each report
+#   ohero-knowledge-index/shard-00001.json.gz  {"docs": [...], "postings": {term: [doc, tf, doc, tf, ...]}}
+# Only the last shard is rewritten while it has room, a report saved again (chat sessions) replaces its document.
+# The index is kept out of the knowledge bucket so it is not ingested into the knowledge base.
+# The tool loads the shards lazily once per container and merges them into one in-memory index, the manifest is
+# revalidated with a conditional GET at most every RESOLUTION_INDEX_REFRESH_SECONDS.
+import gzip
+import heapq
+import json
+import math
+import os
+import re
+import time
+from aws_clients import get_client
+from botocore.exceptions import ClientError
+
+resolution_index_bucket = os.environ.get('RESOLUTION_INDEX_BUCKET', os.environ.get('MEM_BUCKET'))
+resolution_index_prefix = 'ohero-knowledge-index'
+resolution_index_refresh_seconds = int(os.environ.get('RESOLUTION_INDEX_REFRESH_SECONDS', '600'))
+shard_max_docs = int(os.environ.get('RESOLUTION_INDEX_SHARD_MAX_DOCS', '1000'))
+# Characters of the final output kept with each document, returned to the agent as the past resolution
+output_excerpt_chars = int(os.environ.get('RESOLUTION_INDEX_OUTPUT_CHARS', '1500'))
+
+knowledge_bucket = os.environ.get('KNOWLEDGE_BUCKET')
+report_prefix = 'ohero-knowledge/'
+manifest_key = f"{resolution_index_prefix}/manifest.json"
+
+# BM25 parameters
+bm25_k1 = 1.2
+bm25_b = 0.75
+
+stop_words = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have', 'if', 'in', 'into', 'is', 'it',
+    'its', 'no', 'not', 'of', 'on', 'or', 'our', 'so', 'such', 'that', 'the', 'their', 'then', 'there', 'these',
+    'this', 'to', 'was', 'we', 'were', 'will', 'with', 'you', 'your'
+))
+
+_token_pattern = re.compile(r'[a-z0-9]+')
+# Task tokens that would only add noise to the index
+_callback_token_pattern = re.compile(r'<callbackToken>.*?</callbackToken>', re.DOTALL)
+_event_pk_pattern = re.compile(r'<eventPk>(.*?)</eventPk>')
+_timestamp_pattern = re.compile(r'^\*\*Timestamp:\*\* (.+)$', re.MULTILINE)
+_task_pattern = re.compile(r'## Original Task\n\n```\n(.*?)\n```\n', re.DOTALL)
+_tool_pattern = re.compile(r'^\d+\. \*\*([^*]+)\*\*', re.MULTILINE)
+_output_pattern = re.compile(r'\*\*Output:\*\*\n\n(.*)', re.DOTALL)
+
+# Loaded on first search
+_resolution_index_cache = None
+
+
+def tokenize(text):
+    return [token for token in _token_pattern.findall(text.lower()) if 1 < len(token) <= 40 and token not in stop_words]
+
+
+def parse_report(report_key, markdown):
+    """Document of a knowledge report and the text it is indexed by, None when the report has no task."""
+    task_match = _task_pattern.search(markdown)
+    if not task_match:
+        return None, ''
+    task = _callback_token_pattern.sub('', task_match.group(1))
+    output_match = _output_pattern.search(markdown)
+    output = output_match.group(1).strip() if output_match else ''
+    timestamp_match = _timestamp_pattern.search(markdown)
+    tools = list(dict.fromkeys(_tool_pattern.findall(markdown)))
+
+    doc = {
+        'id': report_key[len(report_prefix):].rsplit('.', 1)[0],
+        'key': report_key,
+        'timestamp': timestamp_match.group(1).strip() if timestamp_match else '',
+        'eventPks': list(dict.fromkeys(_event_pk_pattern.findall(task))),
+        'tools': tools,
+        'task': _event_pk_pattern.sub('', task)[:300].strip(),
+        'output': output[:output_excerpt_chars]
+    }
+    return doc, "\n".join([task, " ".join(tools), output])
+
+
+class IndexShard:
+    """A self-contained part of the inverted index: documents and the postings of their terms."""
+
+    def __init__(self, key, data=None):
+        self.key = key
+        self.docs = data['docs'] if data else []
+        self.postings = data['postings'] if data else {}
+
+    def add(self, doc, text):
+        terms = {}
+        for token in tokenize(text):
+            terms[token] = terms.get(token, 0) + 1
+        position = len(self.docs)
+        self.docs.append(dict(doc, length=sum(terms.values())))
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, []).extend((position, frequency))
+
+    def remove(self, report_key):
+        """Drop the document of a report, the positions of the documents after it shift down by one."""
+        positions = [position for position, doc in enumerate(self.docs) if doc['key'] == report_key]
+        if not positions:
+            return
+        removed = positions[0]
+        del self.docs[removed]
+        postings = {}
+        for term, entries in self.postings.items():
+            kept = []
+            for position, frequency in zip(entries[::2], entries[1::2]):
+                if position != removed:
+                    kept.extend((position - 1 if position > removed else position, frequency))
+            if kept:
+                postings[term] = kept
+        self.postings = postings
+
+    def to_bytes(self):
+        return gzip.compress(json.dumps({'docs': self.docs, 'postings': self.postings}, separators=(',', ':')).encode('utf-8'))
+
+    @classmethod
+    def from_bytes(cls, key, body):
+        return cls(key, json.loads(gzip.decompress(body)))
+
+
+class ResolutionIndex:
+    """The shards merged into one BM25 index."""
+
+    def __init__(self, shards, etag=None):
+        self.etag = etag
+        self.docs = []
+        self.postings = {}
+        for shard in shards:
+            offset = len(self.docs)
+            self.docs.extend(shard.docs)
+            for term, entries in shard.postings.items():
+                merged = self.postings.setdefault(term, [])
+                for position, frequency in zip(entries[::2], entries[1::2]):
+                    merged.append((position + offset, frequency))
+        self.average_length = sum(doc['length'] for doc in self.docs) / len(self.docs) if self.docs else 0
+
+    def search(self, query, event_pk='', limit=5):
+        """Best matching (score, document) pairs, restricted to the documents of an event when event_pk is given."""
+        scores = {}
+        total_docs = len(self.docs)
+        for term in set(tokenize(query)):
+            entries = self.postings.get(term)
+            if not entries:
+                continue
+            idf = math.log(1 + (total_docs - len(entries) + 0.5) / (len(entries) + 0.5))
+            for position, frequency in entries:
+                norm = bm25_k1 * (1 - bm25_b + bm25_b * self.docs[position]['length'] / self.average_length)
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (bm25_k1 + 1) / (frequency + norm)
+
+        if event_pk:
+            matching = [position for position, doc in enumerate(self.docs) if event_pk in doc['eventPks']]
+            # Without query terms the most recent runs on the event come first
+            scores = {position: scores.get(position, 0.0) for position in matching}
+            ranked = heapq.nlargest(limit, scores, key=lambda position: (scores[position], self.docs[position]['timestamp']))
+        else:
+            ranked = heapq.nlargest(limit, scores, key=scores.get)
+        return [(round(scores[position], 3), self.docs[position]) for position in ranked]
+
+
+# ----------------------------------------------------------------------------
+# Indexer
+# ----------------------------------------------------------------------------
+
+def load_manifest(if_none_match=None):
+    """(manifest, etag) of the stored index, (None, etag) when unchanged since if_none_match, an empty manifest when there is none."""
+    s3_client = get_client('s3')
+    request = {'Bucket': resolution_index_bucket, 'Key': manifest_key}
+    if if_none_match:
+        request['IfNoneMatch'] = if_none_match
+    try:
+        response = s3_client.get_object(**request)
+    except s3_client.exceptions.NoSuchKey:
+        return {'version': 1, 'shards': [], 'reports': {}}, None
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') == '304':
+            return None, if_none_match
+        raise
+    return json.loads(response['Body'].read().decode('utf-8')), response.get('ETag')
+
+
+def load_shard(key):
+    response = get_client('s3').get_object(Bucket=resolution_index_bucket, Key=key)
+    return IndexShard.from_bytes(key, response['Body'].read())
+
+
+def save_shard(shard):
+    get_client('s3').put_object(
+        Bucket=resolution_index_bucket,
+        Key=shard.key,
+        Body=shard.to_bytes(),
+        ContentType='application/json',
+        ContentEncoding='gzip'
+    )
+
+
+def index_reports(report_keys):
+    """
+    Add the given knowledge reports to the stored index, replacing their earlier documents.
+    Shards are written before the manifest, so searches never see a manifest referring to a missing shard.
+    Returns the number of indexed reports.
+    """
+    s3_client = get_client('s3')
+    manifest, _ = load_manifest()
+    reports = manifest['reports']
+    shards = {}
+
+    def shard_for(key):
+        if key not in shards:
+            shards[key] = load_shard(key)
+        return shards[key]
+
+    indexed = 0
+    for report_key in dict.fromkeys(report_keys):
+        try:
+            markdown = s3_client.get_object(Bucket=knowledge_bucket, Key=report_key)['Body'].read().decode('utf-8')
+        except ClientError as e:
+            print(f"✗ Skipping knowledge report {report_key}: {str(e)}")
+            continue
+        doc, text = parse_report(report_key, markdown)
+        if doc is None:
+            print(f"ℹ Knowledge report {report_key} has no task, not indexed")
+            continue
+
+        if report_key in reports:
+            shard_for(reports[report_key]).remove(report_key)
+        tail = manifest['shards'][-1] if manifest['shards'] else None
+        if tail is None or len(shard_for(tail['key']).docs) >= shard_max_docs:
+            tail = {'key': f"{resolution_index_prefix}/shard-{len(manifest['shards']) + 1:05d}.json.gz"}
+            manifest['shards'].append(tail)
+            shards[tail['key']] = IndexShard(tail['key'])
+        shard_for(tail['key']).add(doc, text)
+        reports[report_key] = tail['key']
+        indexed += 1
+
+    if not indexed:
+        return 0
+    for entry in manifest['shards']:
+        if entry['key'] in shards:
+            entry['docs'] = len(shards[entry['key']].docs)
+            save_shard(shards[entry['key']])
+    s3_client.put_object(
+        Bucket=resolution_index_bucket,
+        Key=manifest_key,
+        Body=json.dumps(manifest).encode('utf-8'),
+        ContentType='application/json'
+    )
+    print(f"✓ Indexed {indexed} knowledge reports, {len(reports)} reports in {len(manifest['shards'])} shards")
+    return indexed
+
+
+def unindexed_report_keys():
+    """Keys of all knowledge reports the stored index does not contain yet."""
+    manifest, _ = load_manifest()
+    keys = []
+    paginator = get_client('s3').get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=knowledge_bucket, Prefix=report_prefix):
+        for item in page.get('Contents', []):
+            if item['Key'].endswith('.md') and item['Key'] not in manifest['reports']:
+                keys.append(item['Key'])
+    return keys
+
+
+def lambda_handler(event, context):
+    """
+    Index new knowledge reports. Invoked with the SQS records of S3 "Object Created" events, or directly with
+    {"backfill": true} to index every report the index does not contain yet.
+    """
+    if event.get('backfill'):
+        return {'indexed': index_reports(unindexed_report_keys())}
+
+    report_keys = []
+    for record in event.get('Records', []):
+        detail = json.loads(record['body']).get('detail', {})
+        key = detail.get('object', {}).get('key', '')
+        if key.startswith(report_prefix) and key.endswith('.md'):
+            report_keys.append(key)
+    # The function runs with reserved concurrency 1, a failed batch is delivered again as a whole
+    return {'indexed': index_reports(report_keys)}
+
+
+# ----------------------------------------------------------------------------
+# Search
+# ----------------------------------------------------------------------------
+
+def get_resolution_index() -> ResolutionIndex:
+    global _resolution_index_cache
+
+    cache = _resolution_index_cache
+    if cache is not None and time.monotonic() - cache.loaded_at < resolution_index_refresh_seconds:
+        return cache
+
+    started = time.perf_counter()
+    manifest, etag = load_manifest(cache.etag if cache is not None else None)
+    if manifest is None:
+        # Unchanged since the last load
+        cache.loaded_at = time.monotonic()
+        return cache
+
+    _resolution_index_cache = ResolutionIndex([load_shard(entry['key']) for entry in manifest['shards']], etag)
+    _resolution_index_cache.loaded_at = time.monotonic()
+    print(f"Resolution index loaded with {len(_resolution_index_cache.docs)} reports from {len(manifest['shards'])} shards in {(time.perf_counter() - started) * 1000:.0f}ms")
+    return _resolution_index_cache
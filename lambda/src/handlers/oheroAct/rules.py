@@ -0,0 +1,223 @@
+# ============================================================================
+# Declarative triage rules evaluated before the agent
+# ============================================================================
+# Rules are loaded from ops_agent/triage_rules.json and compiled once per container. The first enabled rule whose
+# conditions all match the event (and the account it affects, from the organization index) decides the outcome:
+#   accept  - acknowledge the event as accepted
+#   reject  - acknowledge the event as discharged with the rule's reason
+#   ticket  - accept the event and create a ticket from the rule's template
+# Events no rule matches are handled by the agent.
+# Conditions name a field (event.*, finding.* or account.* dotted path, list items by index) and one operator:
+# equals, not_equals, in, not_in, contains, prefix, matches (regex) or exists. Ticket templates use {field} placeholders.
+import json
+import os
+import re
+from org_index import get_organization_index
+from metrics import emit_rule_metrics
+
+rules_path = os.environ.get('TRIAGE_RULES_PATH', os.path.join(os.path.dirname(__file__), "ops_agent", "triage_rules.json"))
+rules_enabled = os.environ.get('TRIAGE_RULES_ENABLED', 'true').lower() == 'true'
+
+supported_actions = ('accept', 'reject', 'ticket')
+ticket_fields = ('ticket_title', 'ticket_detail', 'recommended_action', 'severity', 'assignee', 'progress')
+
+# Compiled on first evaluation
+_rules_cache = None
+
+_placeholder_pattern = re.compile(r'\{([A-Za-z0-9_.\-]+)\}')
+
+
+def compile_path(path):
+    """Getter for a dotted path into the facts, numeric parts index lists, missing values resolve to None."""
+    parts = [int(part) if part.isdigit() else part for part in path.split('.')]
+
+    def get(facts):
+        value = facts
+        for part in parts:
+            if isinstance(part, int):
+                if not isinstance(value, list) or part >= len(value):
+                    return None
+                value = value[part]
+            else:
+                if not isinstance(value, dict):
+                    return None
+                value = value.get(part)
+        return value
+    return get
+
+
+def compile_condition(spec):
+    """Compile one condition, e.g. {"field": "event.statusCode", "in": ["open", "upcoming"]}, into a predicate."""
+    get = compile_path(spec['field'])
+
+    if 'equals' in spec:
+        expected = spec['equals']
+        return lambda facts: get(facts) == expected
+    if 'not_equals' in spec:
+        expected = spec['not_equals']
+        return lambda facts: get(facts) != expected
+    if 'in' in spec:
+        allowed = frozenset(spec['in'])
+        return lambda facts: _hashable(get(facts)) in allowed
+    if 'not_in' in spec:
+        denied = frozenset(spec['not_in'])
+        return lambda facts: _hashable(get(facts)) not in denied
+    if 'contains' in spec:
+        expected = spec['contains']
+        return lambda facts: _contains(get(facts), expected)
+    if 'prefix' in spec:
+        prefix = spec['prefix']
+        return lambda facts: _starts_with(get(facts), prefix)
+    if 'matches' in spec:
+        pattern = re.compile(spec['matches'])
+        return lambda facts: _search(get(facts), pattern)
+    if 'exists' in spec:
+        expected = bool(spec['exists'])
+        return lambda facts: (get(facts) is not None) == expected
+    raise ValueError(f"Unsupported condition {json.dumps(spec)}")
+
+
+def _hashable(value):
+    return value if isinstance(value, (str, int, float, bool, type(None))) else json.dumps(value, sort_keys=True)
+
+
+def _contains(value, expected):
+    return isinstance(value, (list, str)) and expected in value
+
+
+def _starts_with(value, prefix):
+    return isinstance(value, str) and value.startswith(prefix)
+
+
+def _search(value, pattern):
+    return isinstance(value, str) and pattern.search(value) is not None
+
+
+class TriageRule:
+    """A compiled rule: detail types it applies to, conditions that must all match, and the action to take."""
+
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.action = spec['action']
+        self.reason = spec.get('reason', f"Matched triage rule '{self.name}'")
+        self.ticket = spec.get('ticket', {})
+        self.detail_types = frozenset(spec.get('detailTypes', []))
+        self.conditions = [compile_condition(condition) for condition in spec.get('all', [])]
+        self.needs_account = any(condition['field'].startswith('account.') for condition in spec.get('all', [])) \
+            or any('{account.' in str(value) for value in self.ticket.values())
+
+        if self.action not in supported_actions:
+            raise ValueError(f"Rule '{self.name}' has unsupported action '{self.action}'")
+        if self.action == 'ticket' and not self.ticket.get('ticket_title'):
+            raise ValueError(f"Rule '{self.name}' needs a ticket template with at least a ticket_title")
+        if not self.conditions:
+            raise ValueError(f"Rule '{self.name}' has no conditions")
+
+    def matches(self, detail_type, facts):
+        if self.detail_types and detail_type not in self.detail_types:
+            return False
+        for condition in self.conditions:
+            if not condition(facts):
+                return False
+        return True
+
+
+def compile_rules(document):
+    """Compile the enabled rules of a rules document, in file order."""
+    return [TriageRule(spec) for spec in document.get('rules', []) if spec.get('enabled', True)]
+
+
+def get_rules():
+    global _rules_cache
+
+    if _rules_cache is None:
+        try:
+            with open(rules_path, 'r') as f:
+                _rules_cache = compile_rules(json.load(f))
+            print(f"Triage rules compiled: {len(_rules_cache)} enabled rules from {rules_path}")
+        except Exception as e:
+            # An invalid rules file must not stop triage, every event then goes to the agent
+            print(f"✗ Failed to compile triage rules, all events go to the agent: {str(e)}")
+            _rules_cache = []
+
+    return _rules_cache
+
+
+def event_account_id(detail):
+    if detail.get('affectedAccount'):
+        return detail['affectedAccount']
+    findings = detail.get('findings') or [{}]
+    return findings[0].get('AwsAccountId')
+
+
+def build_facts(detail, needs_account):
+    """Values rule fields refer to: event.* (event detail), finding.* (first Security Hub finding), account.*"""
+    findings = detail.get('findings') or [None]
+    facts = {'event': detail, 'finding': findings[0], 'account': None}
+    if needs_account:
+        account_id = event_account_id(detail)
+        accounts = get_organization_index().lookup(account_id=account_id) if account_id else []
+        facts['account'] = accounts[0] if accounts else {'id': account_id, 'status': 'UNKNOWN', 'tags': {}, 'ou_names': []}
+    return facts
+
+
+def match_rule(detail_type, detail, rules=None):
+    """First rule matching the event, with the facts it was evaluated against, or (None, None)."""
+    rules = get_rules() if rules is None else rules
+    facts = None
+    for rule in rules:
+        if rule.detail_types and detail_type not in rule.detail_types:
+            continue
+        if facts is None or (rule.needs_account and facts['account'] is None):
+            facts = build_facts(detail, rule.needs_account)
+        if rule.matches(detail_type, facts):
+            return rule, facts
+    return None, None
+
+
+def render_template(template, facts):
+    return _placeholder_pattern.sub(lambda match: str(compile_path(match.group(1))(facts) or ''), template)
+
+
+def apply_triage_rules(detail_type, event_context):
+    """
+    Handle the event with the first matching rule and return the handler output text,
+    or None when no rule matches (or the rule action failed) and the agent has to handle the event.
+    """
+    if not rules_enabled or not event_context or not event_context.get('eventDetail') or not event_context.get('callbackToken'):
+        return None
+
+    rule, facts = match_rule(detail_type, event_context['eventDetail'])
+    if rule is None:
+        return None
+
+    # Imported here so the tools module is only loaded with the agent dependencies when rules act
+    from tools import acknowledge_event, create_ticket
+
+    print(f"Triage rule '{rule.name}' matched, action: {rule.action}")
+    acknowledgement = acknowledge_event(
+        callback_token=event_context['callbackToken'],
+        action_taken='reject' if rule.action == 'reject' else 'accept',
+        reason_for_action=rule.reason if rule.action == 'reject' else None
+    )
+    if not isinstance(acknowledgement.get('acknowledge_event'), str):
+        print(f"✗ Triage rule '{rule.name}' could not acknowledge the event, handing it to the agent")
+        return None
+
+    lines = [f"[RULE: {rule.name}] {rule.reason}", f"- {acknowledgement['acknowledge_event']}"]
+
+    if rule.action == 'ticket':
+        ticket = {field: render_template(str(rule.ticket[field]), facts) for field in ticket_fields if field in rule.ticket}
+        ticket.setdefault('progress', 'New')
+        response = create_ticket(
+            event_pk=event_context.get('eventPk', ''),
+            event_last_updated_time=event_context.get('eventLastUpdatedTime', ''),
+            **ticket
+        )
+        if 'ExecutionError' in json.dumps(response.get('create_ticket', {})):
+            lines.append(f"- Ticket creation failed: {response['create_ticket']}")
+        else:
+            lines.append(f"- Ticket {response['create_ticket']['ticketId']} created: {ticket['ticket_title']} (assignee: {ticket.get('assignee', 'unassigned')}, severity: {ticket.get('severity', 'n/a')})")
+
+    emit_rule_metrics(rule.name, rule.action)
+    return "\n".join(lines)
@@ -0,0 +1,66 @@
+# ============================================================================
+# Warm in-process cache of agent memory, keyed by the session memory object
+# ============================================================================
+# Follow-up messages of an active chat thread often land on the same warm container. The serialized messages of the
+# last turn are kept here together with the ETag of the S3 object they were saved to or loaded from, so the next turn
+# only sends a conditional GET: S3 answers 304 Not Modified when no other container saved the session in between,
+# otherwise the newer memory is downloaded as before. The cache is bounded by entry count and content size. Memory is
+# saved from the background persistence thread while the handler thread reads, so every access holds the cache's lock.
+import os
+import threading
+from collections import OrderedDict
+
+session_cache_enabled = os.environ.get('SESSION_CACHE_ENABLED', 'true').lower() == 'true'
+session_cache_max_entries = int(os.environ.get('SESSION_CACHE_MAX_ENTRIES', '32'))
+session_cache_max_bytes = int(os.environ.get('SESSION_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+
+
+class SessionCache:
+    """Least recently used map of memory object key to (ETag, serialized messages), safe to share between threads."""
+
+    def __init__(self, max_entries, max_bytes):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """(etag, content) of a cached session, None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, etag, content):
+        with self._lock:
+            self._discard(key)
+            if not etag or len(content) > self.max_bytes:
+                return
+            self._entries[key] = (etag, content)
+            self.total_bytes += len(content)
+            while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+
+    def discard(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= len(entry[1])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+session_cache = SessionCache(session_cache_max_entries, session_cache_max_bytes) if session_cache_enabled else SessionCache(0, 0)
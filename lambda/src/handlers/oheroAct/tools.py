@@ -2,11 +2,19 @@
 # Tools for OpsAgent
 # ============================================================================
 from strands import tool
-import boto3
 import json
 import os
+import re
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
+from org_index import get_organization_index
+from resolution_index import get_resolution_index
+from adaptive_retrieval import retrieve_adaptive
+from metrics import emit_agent_metrics
+from budget import bounded_tool, current_budget, final_text
+from tracing import start_span
+from aws_clients import get_client
+from botocore.config import Config
 
 # Setting up tool and utility environment
 team_table = os.environ.get('TEAM_TABLE')
@@ -16,70 +24,72 @@ sechub_knowledge_base_id = os.environ['SECHUB_KNOWLEDGE_BASE_ID']
 ticket_table = os.environ.get('TICKET_TABLE')
 message_event_bus_name = os.environ.get('EVENT_BUS_NAME')
 message_event_source_name = os.environ.get('EVENT_SOURCE_NAME')
-
-bedrock_agent_runtime = bedrock_agent_runtime = boto3.client(
-    service_name='bedrock-agent-runtime',
-    region_name=region,
+# Local ops event vector index (event_vectors.py): 'fallback' when the knowledge base fails, 'fast' to query it first, or 'off'
+ops_event_vector_mode = os.environ.get('OPS_EVENT_VECTOR_MODE', 'fallback').lower()
+# Most results per search, searches start smaller and only widen when the results are ambiguous (adaptive_retrieval.py)
+ops_event_results = int(os.environ.get('OPS_EVENT_RESULTS', '10'))
+sec_finding_results = int(os.environ.get('SEC_FINDING_RESULTS', '25'))
+
+# A slow or throttled knowledge base fails fast so the local index can answer
+retrieve_config = Config(
+    read_timeout=int(os.environ.get('KB_RETRIEVE_TIMEOUT_SECONDS', '10')),
+    retries={
+        'max_attempts': 2,
+        'mode': 'standard'
+    }
 )
 
-dynamodb = dynamodb = boto3.client(
-    service_name='dynamodb',
-    region_name=region
-)
-
-sfn = boto3.client(
-    service_name='stepfunctions',
-    region_name=region
-)
-
-events = boto3.client(
-    service_name='events',
-    region_name=region
-)
+# Callback tokens acknowledged since the last reset, a batch run checks that every event of the batch was acknowledged
+acknowledged_callback_tokens = set()
 
 @tool
-def search_ops_events(query):
+@bounded_tool
+def search_ops_events(query, event_arn='', service='', region='', status='', updated_after='', updated_before='', started_after='', started_before=''):
     """Search operational health event knowledge base for past operational events using natural language.
+    Narrow the search with the optional filters whenever the event, service, region or time frame is known.
 
     Args:
         query: Search query in natural language (e.g., 'Any known issues with the network that require immediate attention?')
+        event_arn: Only events of this Health event ARN (all accounts and regions it affects)
+        service: Only events of this AWS service code (e.g., 'EKS', 'LAMBDA')
+        region: Only events in this AWS region (e.g., 'ap-southeast-2')
+        status: Only events with this status: 'open', 'upcoming' or 'closed'
+        updated_after: Only events last updated on or after this ISO 8601 date/time (e.g., '2025-01-31')
+        updated_before: Only events last updated on or before this ISO 8601 date/time
+        started_after: Only events starting on or after this ISO 8601 date/time
+        started_before: Only events starting on or before this ISO 8601 date/time
 
     Returns:
         Dict with search results from the operational events database
     """
     try:
-        response = bedrock_agent_runtime.retrieve(
-            knowledgeBaseId=ops_knowledge_base_id,
-            retrievalQuery={
-                'text': query
-            },
-            retrievalConfiguration={
-                'vectorSearchConfiguration': {
-                    'numberOfResults': 25,
-                    'overrideSearchType': "SEMANTIC",
-                    # ---- the below config improves relevance of retrieved but requires botocore>=1.34.71 ----
-                    # 'implicitFilterConfiguration': {
-                    #     'metadataAttributes': [
-                    #         {
-                    #             'key': 'eventArn',
-                    #             'type': 'STRING',
-                    #             'description': 'The unique identifier of a thread of events.',
-                    #         },
-                    #         {
-                    #             'key': 'startTime',
-                    #             'type': 'STRING', #"BOOLEAN";"NUMBER";"STRING";"STRING_LIST
-                    #             'description': 'The date and time when the event impact starts.',
-                    #         },
-                    #         {
-                    #             'key': 'lastUpdatedTime',
-                    #             'type': 'STRING',
-                    #             'description': 'The date and time when the event received an update.',
-                    #         },
-                    #     ],
-                    #     'modelArn': f'arn:aws:bedrock:{region}::foundation-model/anthropic.claude-3-haiku-20240307-v1:0'
-                    # },
-                }
+        retrieval_filter = ops_event_filter(event_arn, service, region, status, updated_after, updated_before, started_after, started_before)
+    except ValueError as e:
+        return {
+            "search_ops_events": {
+                'InputValueError': f'Dates must be ISO 8601, e.g. 2025-01-31 or 2025-01-31T08:00:00Z: {str(e)}'
             }
+        }
+
+    if ops_event_vector_mode == 'fast':
+        results = search_local_ops_events(query, retrieval_filter)
+        if results:
+            return {"search_ops_events": results}
+    try:
+        vector_search_configuration = {
+            'overrideSearchType': "SEMANTIC",
+        }
+        if retrieval_filter:
+            vector_search_configuration['filter'] = retrieval_filter
+        chunks = retrieve_adaptive(
+            get_client('bedrock-agent-runtime', retrieve_config, 'retrieve'),
+            'search_ops_events',
+            ops_knowledge_base_id,
+            query,
+            vector_search_configuration,
+            ops_event_results,
+            # Distinct events, or distinct accounts and regions of the one event searched for
+            key_fields=('affectedAccount', 'eventRegion') if event_arn.strip() else ('eventArn',)
         )
         result = {
             "search_ops_events": [
@@ -87,16 +97,78 @@ def search_ops_events(query):
                     "content": chunk['content']['text'],
                     "content_metadata": chunk['metadata']
                 }
-                for chunk in response['retrievalResults']
+                for chunk in chunks
             ]
         }
         # print("Ops Knowledge response: ", json.dumps(result, indent=2))
         return result
     except Exception as e:
         print(f"An error occurred: {str(e)}")
+        if ops_event_vector_mode == 'fallback':
+            results = search_local_ops_events(query, retrieval_filter)
+            if results:
+                print(f"ℹ Knowledge base unavailable, {len(results)} ops events served from the local vector index")
+                return {"search_ops_events": results}
         return { "search_ops_events": [] }
 
+def epoch_seconds(value):
+    """Epoch seconds of an ISO 8601 date or date/time, UTC when it has no offset."""
+    moment = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+def ops_event_filter(event_arn='', service='', region='', status='', updated_after='', updated_before='', started_after='', started_before=''):
+    """
+    Knowledge base metadata filter of the search_ops_events filters, None without any. Attributes are written by
+    the IngestOpsKbFunction as document metadata sidecars: service upper case, status lower case, times in epoch seconds.
+    """
+    conditions = []
+    for key, value in (('eventArn', event_arn.strip()), ('service', service.strip().upper()), ('eventRegion', region.strip()), ('statusCode', status.strip().lower())):
+        if value:
+            conditions.append({'equals': {'key': key, 'value': value}})
+    for key, operator, value in (
+        ('lastUpdatedTime', 'greaterThanOrEquals', updated_after),
+        ('lastUpdatedTime', 'lessThanOrEquals', updated_before),
+        ('startTime', 'greaterThanOrEquals', started_after),
+        ('startTime', 'lessThanOrEquals', started_before)
+    ):
+        if value:
+            conditions.append({operator: {'key': key, 'value': epoch_seconds(value)}})
+
+    if not conditions:
+        return None
+    # andAll takes 2 to 5 filters, longer lists are nested
+    while len(conditions) > 5:
+        conditions = conditions[:4] + [{'andAll': conditions[4:]}]
+    return conditions[0] if len(conditions) == 1 else {'andAll': conditions}
+
+def search_local_ops_events(query, retrieval_filter=None):
+    """Ops events from the local vector index, None when it is not available."""
+    try:
+        # Imported here so NumPy is only loaded when the local index is used
+        from event_vectors import search_event_vectors
+
+        with start_span("search_event_vectors"):
+            return search_event_vectors(query, ops_event_results, retrieval_filter)
+    except Exception as e:
+        print(f"✗ Local ops event vector index unavailable: {str(e)}")
+        return None
+
+# Finding Ids in Security Hub export chunks: the leading Id column of the CSV rows (e.g. '.../S3.8/finding/<uuid>',
+# 'arn:aws:inspector2:...:finding/<id>') or the "Id" field of the JSONL records
+finding_id_pattern = re.compile(r'"Id": "([^"]+)"|(arn:aws[\w-]*:[^,\s"]*[:/]finding/[^,\s"]+)')
+
+def sec_finding_key(result):
+    """
+    Findings of a Security Hub search result. The full export is a single CSV document, so its chunks only differ by
+    the findings they hold, and keying them by source document would make every wider search look redundant.
+    """
+    finding_ids = frozenset(json_id or csv_id for json_id, csv_id in finding_id_pattern.findall(result['content']['text']))
+    return finding_ids or result['content']['text']
+
 @tool
+@bounded_tool
 def search_sec_findings(query):
     """Search Security Hub Findings knowledge base for past Security Hub Findings using natural language.
 
@@ -107,16 +179,14 @@ def search_sec_findings(query):
         Dict with search results from Security Hub findings database
     """
     try:
-        response = bedrock_agent_runtime.retrieve(
-            knowledgeBaseId=sechub_knowledge_base_id,
-            retrievalQuery={
-                'text': query
-            },
-            retrievalConfiguration={
-                'vectorSearchConfiguration': {
-                    'numberOfResults': 25
-                }
-            }
+        chunks = retrieve_adaptive(
+            get_client('bedrock-agent-runtime'),
+            'search_sec_findings',
+            sechub_knowledge_base_id,
+            query,
+            {},
+            sec_finding_results,
+            key=sec_finding_key
         )
         result = {
             "search_sec_findings": [
@@ -124,7 +194,7 @@ def search_sec_findings(query):
                     "content": chunk['content']['text'],
                     "content_metadata": chunk['metadata']
                 }
-                for chunk in response['retrievalResults']
+                for chunk in chunks
             ]
         }
         # print("SecHub Knowledge response: ", json.dumps(result, indent=2))
@@ -134,6 +204,7 @@ def search_sec_findings(query):
         return { "search_sec_findings": [] }
 
 @tool
+@bounded_tool
 def acknowledge_event(callback_token, action_taken, reason_for_action=None):
     """Acknowledge an operational event and specify the action to take (accept or reject).
 
@@ -173,7 +244,7 @@ def acknowledge_event(callback_token, action_taken, reason_for_action=None):
 
         if action_taken == 'accept':
             # Send task success
-            response = sfn.send_task_success(
+            response = get_client('stepfunctions').send_task_success(
                 taskToken=callback_token,
                 output=json.dumps({
                     'Payload': 'SUCCESS'
@@ -183,13 +254,14 @@ def acknowledge_event(callback_token, action_taken, reason_for_action=None):
             body = 'Acknowledged as accepted'
         else:
             # Send task failure
-            response = sfn.send_task_failure(
+            response = get_client('stepfunctions').send_task_failure(
                 taskToken=callback_token,
                 error='RejectedByOperator Error',
                 cause='Discharged by operator' if not reason_for_action else reason_for_action
             )
             print('Discharged by operator')
             body = 'Acknowledged as discharged'
+        acknowledged_callback_tokens.add(callback_token)
 
         return {
             'acknowledge_event': body
@@ -204,6 +276,7 @@ def acknowledge_event(callback_token, action_taken, reason_for_action=None):
         }
 
 @tool
+@bounded_tool
 def create_ticket(event_pk, ticket_title, ticket_detail='', recommended_action='', event_last_updated_time='', severity='', assignee='', progress='' ):
     """Create a ticket in the system based on an event or a situation description.
 
@@ -226,7 +299,7 @@ def create_ticket(event_pk, ticket_title, ticket_detail='', recommended_action='
 
         # look up the team management table to find the SlackChannelId by assignee
         try:
-            team_response = dynamodb.get_item(
+            team_response = get_client('dynamodb').get_item(
                 TableName=team_table,
                 Key={
                     'PK': {'S': assignee}
@@ -260,14 +333,14 @@ def create_ticket(event_pk, ticket_title, ticket_detail='', recommended_action='
         }
 
         # Execute PutItem operation
-        response = dynamodb.put_item(**create_ticket_params)
+        response = get_client('dynamodb').put_item(**create_ticket_params)
         body = json.dumps(response)
 
         # Send event to EventBridge to send Slack message to any team's channel
         if team_slack_channel_id:
             try:
                 message_body = f"You have just been assigned or copied for a new Ticket.\n TicketID: {ticket_id}\n Ticket Title:: {ticket_title}\n Assigned to: {assignee}\n Ticket Details: {ticket_detail}\n Severity: {severity}\n Recommendations: {recommended_action}\n EventPk: {event_pk}"
-                event_response = events.put_events(
+                event_response = get_client('events').put_events(
                     Entries=[
                         {
                             'Source': message_event_source_name, # The event source the ChatIntegration service listens to
@@ -307,6 +380,7 @@ def create_ticket(event_pk, ticket_title, ticket_detail='', recommended_action='
         }
 
 @tool
+@bounded_tool
 def update_ticket(ticket_id, ticket_title='', ticket_detail='', recommended_action='', event_last_updated_time='', severity='', assignee='', progress=''):
     """Update an existing ticket in the system with new information.
 
@@ -391,7 +465,7 @@ def update_ticket(ticket_id, ticket_title='', ticket_detail='', recommended_acti
         }
 
         # Execute UpdateItem operation
-        response = dynamodb.update_item(**update_ticket_params)
+        response = get_client('dynamodb').update_item(**update_ticket_params)
 
         # Return JSON string of the response
         body = json.dumps(response, default=str)  # default=str handles datetime serialization
@@ -411,6 +485,7 @@ def update_ticket(ticket_id, ticket_title='', ticket_detail='', recommended_acti
         }
 
 @tool
+@bounded_tool
 def search_tickets_by_event_key(event_pk):
     """Search for tickets associated with a specific event key (eventPk).
 
@@ -432,7 +507,7 @@ def search_tickets_by_event_key(event_pk):
         }
 
         # Execute scan operation
-        response = dynamodb.scan(**scan_params)
+        response = get_client('dynamodb').scan(**scan_params)
 
         # Return JSON string of the response, similar to the TypeScript implementation
         body = json.dumps(response, default=str)  # default=str handles datetime serialization
@@ -448,6 +523,79 @@ def search_tickets_by_event_key(event_pk):
             }
         }
 
+@tool
+@bounded_tool
+def lookup_accounts(account_id='', name='', tag='', ou='', team=''):
+    """Look up Organization Account Attributes of AWS accounts, all given criteria must match.
+
+    Args:
+        account_id: The 12 digit AWS account ID (e.g., '111111111111')
+        name: The exact account name (e.g., 'core-infrastructure')
+        tag: An account tag as 'key=value' (e.g., 'environment=production') or just a tag key
+        ou: The name of the organizational unit the account belongs to
+        team: The team id owning the account (e.g., 'inf01')
+
+    Returns:
+        Dict with the list of matching accounts, an empty list means the account is unknown
+    """
+    try:
+        if not any([account_id, name, tag, ou, team]):
+            return {
+                'lookup_accounts': {
+                    'InputValueError': 'Provide at least one of: account_id, name, tag, ou, team.'
+                }
+            }
+
+        return {
+            'lookup_accounts': get_organization_index().lookup(account_id=account_id, name=name, tag=tag, ou=ou, team=team)
+        }
+    except Exception as e:
+        print(f"Error looking up accounts: {str(e)}")
+        return {
+            'lookup_accounts': {
+                'ExecutionError': json.dumps({'error': str(e)})
+            }
+        }
+
+@tool
+@bounded_tool
+def search_past_resolutions(query: str, event_pk: str = '') -> dict:
+    """Search the reports of previous OHERO runs for how similar events were already analyzed and resolved.
+
+    Use this tool BEFORE ask_aws: when a past resolution covers the same service, event type or issue,
+    reuse its analysis and guidance instead of researching it again.
+
+    Args:
+        query: Key terms of the event, e.g. service, event type code and issue (e.g., 'EKS AWS_EKS_PLANNED_LIFECYCLE_EVENT Kubernetes 1.27 end of standard support')
+        event_pk: Optional EventPk to only return the past runs on that event
+
+    Returns:
+        Dict with the best matching past runs: session id, time, event keys, tools used and the final output
+    """
+    try:
+        with start_span("search_past_resolutions"):
+            matches = get_resolution_index().search(query, event_pk=event_pk.strip())
+        return {
+            'search_past_resolutions': [
+                {
+                    'sessionId': doc['id'],
+                    'timestamp': doc['timestamp'],
+                    'eventPks': doc['eventPks'],
+                    'toolsUsed': doc['tools'],
+                    'resolution': doc['output'],
+                    'score': score
+                }
+                for score, doc in matches
+            ]
+        }
+    except Exception as e:
+        print(f"Error searching past resolutions: {str(e)}")
+        return {
+            'search_past_resolutions': {
+                'ExecutionError': json.dumps({'error': str(e)})
+            }
+        }
+
 # Cache for the research agent instance (lazy initialization for performance)
 _research_agent_cache = None
 
@@ -481,24 +629,32 @@ def ask_aws(question: str) -> str:
 
             print("[ask_aws tool] Initializing research agent...")
 
-            mcp_client = create_knowledge_mcp_client()
+            with start_span("create_research_agent"):
+                mcp_client = create_knowledge_mcp_client()
 
-            research_hook = ContextVisualizationHook()
+                research_hook = ContextVisualizationHook()
 
-            _research_agent_cache = create_research_agent(hook=research_hook, mcp_client=mcp_client)
+                _research_agent_cache = create_research_agent(hook=research_hook, mcp_client=mcp_client)
 
             print("[ask_aws tool] Research agent initialized successfully")
 
+        # The research agent runs on a child budget of the tool's timeout, it is cancelled when the timeout passes
+        budget = current_budget()
+        timeout_ms = budget.tool_timeout_ms('ask_aws')
+        if timeout_ms <= 0:
+            return "AwsTAM was not consulted: no time is left in the budget of this task."
+        _research_agent_cache.budget_hook.budget = budget.child(timeout_ms)
         result = _research_agent_cache(question)
+        emit_agent_metrics(_research_agent_cache, result)
 
         if hasattr(result, 'content') and len(result.content) > 0:
             response_text = ""
             for content_block in result.content:
                 if hasattr(content_block, 'text'):
                     response_text += content_block.text
-            return response_text if response_text else str(result)
+            return response_text if response_text else final_text(result)
         else:
-            return str(result)
+            return final_text(result)
 
     except Exception as e:
         import traceback
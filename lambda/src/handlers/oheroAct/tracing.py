@@ -0,0 +1,186 @@
+# ============================================================================
+# Span tracing across the handler, agents, tools, AWS calls and MCP calls
+# ============================================================================
+# Uses the OpenTelemetry SDK that ships with strands-agents. Once a tracer provider is set, the agent, event loop
+# cycle, model and tool spans created by Strands nest under the spans started here, and a research agent run
+# becomes a child of the ask_aws tool span that started it (context is copied into the tool threads).
+import json
+import os
+import threading
+from contextlib import contextmanager
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.trace import Status, StatusCode
+
+# none | file | stdout, file appends one OTLP/JSON ExportTraceServiceRequest per invocation to trace_file
+trace_export = os.environ.get('TRACE_EXPORT', 'none').lower()
+trace_file = os.environ.get('TRACE_FILE', '/tmp/ohero-traces.jsonl')
+# Strands records prompts and responses as span attributes, cap them to keep trace lines small
+trace_max_attribute_chars = int(os.environ.get('TRACE_MAX_ATTRIBUTE_CHARS', '2000'))
+
+tracing_enabled = trace_export in ('file', 'stdout')
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, (list, tuple)):
+        return {'arrayValue': {'values': [_otlp_value(item) for item in value]}}
+    text = str(value)
+    if len(text) > trace_max_attribute_chars:
+        text = text[:trace_max_attribute_chars] + f"... (truncated, total length: {len(text)} chars)"
+    return {'stringValue': text}
+
+
+def _otlp_attributes(attributes):
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in (attributes or {}).items()]
+
+
+def span_to_otlp(span):
+    """Convert a finished SDK span to its OTLP/JSON representation."""
+    record = {
+        'traceId': format(span.context.trace_id, '032x'),
+        'spanId': format(span.context.span_id, '016x'),
+        'name': span.name,
+        'kind': span.kind.value + 1, # OTLP enum starts at SPAN_KIND_UNSPECIFIED=0
+        'startTimeUnixNano': str(span.start_time),
+        'endTimeUnixNano': str(span.end_time),
+        'attributes': _otlp_attributes(span.attributes),
+        'status': {'code': span.status.status_code.value},
+    }
+    if span.parent is not None:
+        record['parentSpanId'] = format(span.parent.span_id, '016x')
+    if span.status.description:
+        record['status']['message'] = span.status.description
+    if span.events:
+        record['events'] = [
+            {'timeUnixNano': str(event.timestamp), 'name': event.name, 'attributes': _otlp_attributes(event.attributes)}
+            for event in span.events
+        ]
+    return record
+
+
+class OTLPJsonExporter(SpanExporter):
+    """Buffers finished spans in memory, flush() writes them as one OTLP/JSON line to a file or stdout."""
+
+    def __init__(self, destination, path=None):
+        self.destination = destination
+        self.path = path
+        self.lock = threading.Lock()
+        self.spans = []
+
+    def export(self, spans):
+        with self.lock:
+            self.spans.extend(spans)
+        return SpanExportResult.SUCCESS
+
+    def flush(self):
+        with self.lock:
+            spans, self.spans = self.spans, []
+        if not spans:
+            return None
+
+        scopes = {}
+        for span in spans:
+            scope_name = span.instrumentation_scope.name if span.instrumentation_scope else 'unknown'
+            scopes.setdefault(scope_name, []).append(span_to_otlp(span))
+        request = {
+            'resourceSpans': [{
+                'resource': {'attributes': _otlp_attributes(spans[0].resource.attributes)},
+                'scopeSpans': [{'scope': {'name': name}, 'spans': records} for name, records in scopes.items()]
+            }]
+        }
+
+        line = json.dumps(request, default=str)
+        if self.destination == 'file':
+            with open(self.path, 'a') as f:
+                f.write(line + "\n")
+            print(f"Trace with {len(spans)} spans written to {self.path}")
+        else:
+            print(line)
+        return request
+
+    def shutdown(self):
+        self.flush()
+
+
+_exporter = None
+
+if tracing_enabled:
+    _exporter = OTLPJsonExporter(trace_export, trace_file)
+    _provider = TracerProvider(resource=Resource.create({
+        'service.name': os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'oheroAct')
+    }))
+    _provider.add_span_processor(SimpleSpanProcessor(_exporter))
+    trace.set_tracer_provider(_provider)
+
+tracer = trace.get_tracer('ohero')
+
+
+@contextmanager
+def start_span(name, **attributes):
+    """Start a span as child of the current one, exceptions are recorded on the span and re-raised."""
+    with tracer.start_as_current_span(name, record_exception=True, set_status_on_exception=True) as span:
+        for key, value in attributes.items():
+            if value is not None:
+                span.set_attribute(key, value)
+        yield span
+
+
+def set_span_error(span, message):
+    """Mark a span as failed when the error is handled and no exception propagates."""
+    span.set_status(Status(StatusCode.ERROR, message))
+
+
+def instrument_client(client):
+    """Record a span for every API call made through a boto3 client."""
+    if not tracing_enabled or not hasattr(client, 'meta'):
+        return client
+
+    service_name = client.meta.service_model.service_name
+
+    def before_call(model, params, context, **kwargs):
+        span = tracer.start_span(f"{service_name}.{model.name}", attributes={
+            'rpc.system': 'aws-api',
+            'rpc.service': service_name,
+            'rpc.method': model.name,
+        })
+        context['ohero_span'] = span
+
+    def after_call(http_response, parsed, model, context, **kwargs):
+        span = context.pop('ohero_span', None)
+        if span is None:
+            return
+        status_code = parsed.get('ResponseMetadata', {}).get('HTTPStatusCode') if isinstance(parsed, dict) else None
+        if status_code is not None:
+            span.set_attribute('http.status_code', status_code)
+        if isinstance(parsed, dict) and 'Error' in parsed:
+            set_span_error(span, parsed['Error'].get('Code', 'Error'))
+        span.end()
+
+    def after_call_error(exception, context, **kwargs):
+        span = context.pop('ohero_span', None)
+        if span is None:
+            return
+        span.record_exception(exception)
+        set_span_error(span, type(exception).__name__)
+        span.end()
+
+    service_id = client.meta.service_model.service_id.hyphenize()
+    client.meta.events.register(f"before-call.{service_id}", before_call)
+    client.meta.events.register(f"after-call.{service_id}", after_call)
+    client.meta.events.register(f"after-call-error.{service_id}", after_call_error)
+    return client
+
+
+def flush_traces():
+    """Export the spans of the current invocation, call once at the end of the handler."""
+    if _exporter is not None:
+        return _exporter.flush()
+    return None
@@ -1,57 +1,155 @@
-import json
+import json, os, time
 import boto3
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+
+bucket = os.environ.get('S3_NAME') # optional, keeps the last snapshot for incremental refreshes
+snapshot_key = os.environ.get('SNAPSHOT_KEY', 'account-info/accounts.json')
+max_workers = int(os.environ.get('MAX_WORKERS', '8'))
+# Tag changes alone do not show up in list_accounts, so tags read longer ago than this are read again. 0 re-reads them every run
+tags_max_age_seconds = float(os.environ.get('TAGS_MAX_AGE_HOURS', '24')) * 3600
+
+# adaptive retry mode backs off client side on TooManyRequestsException instead of failing the call
+org_config = Config(
+    retries={
+        'max_attempts': 10,
+        'mode': 'adaptive'
+    }
+)
+
+def crawl_ou_tree(org_client):
+    """
+    Walk the organization from its root, returns {account_id: [ou_name, ...]}.
+    Each OU is listed and named once, instead of list_parents/describe_organizational_unit per account.
+    """
+    account_ous = {}
+    ou_paginator = org_client.get_paginator('list_organizational_units_for_parent')
+    account_paginator = org_client.get_paginator('list_accounts_for_parent')
+
+    roots = org_client.list_roots()['Roots']
+    pending = [(root['Id'], None) for root in roots]
+    while pending:
+        parent_id, ou_name = pending.pop()
+        for page in account_paginator.paginate(ParentId=parent_id):
+            for account in page['Accounts']:
+                account_ous[account['Id']] = [ou_name] if ou_name else []
+        for page in ou_paginator.paginate(ParentId=parent_id):
+            for ou in page['OrganizationalUnits']:
+                pending.append((ou['Id'], ou['Name']))
+    return account_ous
+
+def get_account_tags(org_client, account_id):
+    tags = {}
+    paginator = org_client.get_paginator('list_tags_for_resource')
+    for page in paginator.paginate(ResourceId=account_id):
+        tags.update({tag['Key']: tag['Value'] for tag in page['Tags']})
+    return tags
+
+def load_snapshot(s3_client):
+    """Accounts of the last snapshot by ID, and when each account's tags were read (epoch seconds)."""
+    if not bucket:
+        return {}, {}
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=snapshot_key)
+        snapshot = json.loads(response['Body'].read().decode('utf-8'))
+    except s3_client.exceptions.NoSuchKey:
+        return {}, {}
+    # A snapshot without read times predates them, its tags count as expired
+    return {account['id']: account for account in snapshot['accounts']}, snapshot.get('tagsRefreshedAt', {})
+
+def save_snapshot(s3_client, result):
+    if not bucket:
+        return
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=snapshot_key,
+        Body=json.dumps(result, indent=2).encode('utf-8'),
+        ContentType='application/json'
+    )
+    print(f'Account snapshot saved to s3://{bucket}/{snapshot_key}')
+
+def changed_account_ids(event):
+    """Accounts flagged as changed by the caller, or by an Organizations CloudTrail event (e.g. TagResource)."""
+    changed = set((event or {}).get('changedAccountIds', []))
+    resource_id = (event or {}).get('detail', {}).get('requestParameters', {}).get('resourceId')
+    if resource_id:
+        changed.add(resource_id)
+    return changed
+
+def needs_refresh(account, previous, changed, refreshed_at, now):
+    """
+    Tags are only re-read for new accounts, accounts flagged as changed, accounts whose listing changed, or accounts
+    whose tags were read more than TAGS_MAX_AGE_HOURS ago.
+    """
+    if previous is None or account['Id'] in changed:
+        return True
+    # Tags without a read time (e.g. from a snapshot that predates them) count as expired, whatever the maximum age
+    tags_read_at = refreshed_at.get(account['Id'])
+    if tags_read_at is None or now - tags_read_at >= tags_max_age_seconds:
+        return True
+    return previous.get('name') != account['Name'] or previous.get('status') != account['Status']
 
 def lambda_handler(event, context):
     try:
-        org_client = boto3.client('organizations')
-        
-        accounts_data = []
-        
-        # Get all accounts
+        org_client = boto3.client('organizations', config=org_config)
+        s3_client = boto3.client('s3')
+
+        full_refresh = bool((event or {}).get('fullRefresh'))
+        snapshot, refreshed_at = ({}, {}) if full_refresh else load_snapshot(s3_client)
+        now = time.time()
+        changed = changed_account_ids(event)
+
+        account_ous = crawl_ou_tree(org_client)
+
+        accounts = []
         paginator = org_client.get_paginator('list_accounts')
         for page in paginator.paginate():
-            for account in page['Accounts']:
-                account_info = {
-                    'id': account['Id'],
-                    'name': account['Name'],
-                    'email': account['Email'],
-                    'status': account['Status']
-                }
-                
-                # Get account tags
-                try:
-                    tags_response = org_client.list_tags_for_resource(ResourceId=account['Id'])
-                    account_info['tags'] = {tag['Key']: tag['Value'] for tag in tags_response['Tags']}
-                except:
-                    account_info['tags'] = {}
-                
-                # Get OU information
-                try:
-                    parents = org_client.list_parents(ChildId=account['Id'])['Parents']
-                    ou_names = []
-                    for parent in parents:
-                        if parent['Type'] == 'ORGANIZATIONAL_UNIT':
-                            ou = org_client.describe_organizational_unit(OrganizationalUnitId=parent['Id'])
-                            ou_names.append(ou['OrganizationalUnit']['Name'])
-                    account_info['ou_names'] = ou_names
-                except:
-                    account_info['ou_names'] = []
-                
+            accounts.extend(page['Accounts'])
+
+        def fetch(account):
+            previous = snapshot.get(account['Id'])
+            account_info = {
+                'id': account['Id'],
+                'name': account['Name'],
+                'email': account['Email'],
+                'status': account['Status']
+            }
+            if needs_refresh(account, previous, changed, refreshed_at, now):
+                account_info['tags'] = get_account_tags(org_client, account['Id'])
+                tags_read_at = now
+            else:
+                account_info['tags'] = previous.get('tags', {})
+                tags_read_at = refreshed_at.get(account['Id'])
+            account_info['ou_names'] = account_ous.get(account['Id'], [])
+            return account_info, tags_read_at
+
+        accounts_data = []
+        tags_refreshed_at = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for account_info, tags_read_at in executor.map(fetch, accounts):
                 accounts_data.append(account_info)
-        
-        result = {'accounts': accounts_data}
+                tags_refreshed_at[account_info['id']] = tags_read_at
+        refreshed_count = sum(1 for tags_read_at in tags_refreshed_at.values() if tags_read_at == now)
+        print(f'Accounts: {len(accounts_data)} total, {refreshed_count} tags refreshed, {len(accounts_data) - refreshed_count} from snapshot')
+
+        result = {'accounts': accounts_data, 'tagsRefreshedAt': tags_refreshed_at}
+        save_snapshot(s3_client, result)
         response = {
             'statusCode': 200,
             'body': json.dumps(result)
         }
-        
+
         if response['statusCode'] == 200:
             print(json.dumps(result, indent=2))
         else:
             print({})
-            
+
         return response
-        
+
     except Exception as e:
-        print({})
-        return {}
\ No newline at end of file
+        # Throttling that outlasts the retries fails the whole crawl rather than returning accounts with empty tags
+        print(f'Failed to collect account info: {type(e).__name__}: {str(e)}')
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': str(e)})
+        }
@@ -1,91 +1,420 @@
-import boto3, json, os
+import boto3, csv, hashlib, io, json, os, threading, time
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 region = os.environ['AWS_REGION']
 bucket = os.environ['S3_NAME']
+export_mode = os.environ.get('EXPORT_MODE', 'full') # full | incremental
+# Comma separated regions to collect from, e.g. 'ap-southeast-2,us-east-1'. Findings of member accounts are returned
+# to the Security Hub administrator account, so one function covers the organization per region.
+# An empty list (e.g. "" or ",") falls back to the function's own region.
+sechub_regions = [r.strip() for r in os.environ.get('SECHUB_REGIONS', '').split(',') if r.strip()] or [region]
+max_workers = max(1, int(os.environ.get('MAX_WORKERS', '4')))
+
+# adaptive retry mode backs off client side on ThrottlingException/TooManyRequestsException
+securityhub_config = Config(
+    retries={
+        'max_attempts': 10,
+        'mode': 'adaptive'
+    }
+)
 
-csv = ','
 filename = 'securityhub_latest.csv'
-fullpath = '/tmp/' + filename
+regional_prefix = 'securityhub_latest/' # full mode output when collecting from more than one region
+max_page_size = 100 # maximum allowed by securityhub:GetFindings
+part_size = int(os.environ.get('UPLOAD_PART_SIZE_MB', '8')) * 1024 * 1024 # S3 requires >= 5MB for all but the last part
+
+# Incremental mode settings, findings are written as JSONL partitions so a run only rewrites partitions holding changes
+findings_prefix = 'findings/'
+# Watermarks live in SSM Parameter Store, an object in the bucket would be ingested by the knowledge base data source
+# and every save would start another ingestion job
+watermark_parameter = os.environ.get('WATERMARK_PARAMETER', '/ohero/securityhub/export-watermarks')
+legacy_watermark_key = '.state/securityhub_watermark.json' # earlier location in the bucket, migrated on the next save
+partitions_per_region = int(os.environ.get('FINDINGS_PARTITIONS', '16'))
+# Changes held before the largest partition's are merged into S3, bounds the memory of the bootstrap run
+partition_buffer_bytes = int(os.environ.get('PARTITION_BUFFER_MB', '16')) * 1024 * 1024
+
+csv_header = [
+    'Id', 'ProductArn', 'ProductName', 'CompanyName', 'GeneratorId', 'SecurityControlId', 'CreatedAt', 'UpdatedAt',
+    'Confidence', 'Remediation', 'Remediation_URL', 'SourceUrl', 'Compliance', 'WorkflowStatus', 'RecordState',
+    'ProcessedAt', 'Title', 'severity', 'Region', 'Account_id', 'Description', 'Resource_type', 'Resource_id',
+    'Resource_tags'
+]
+
+class S3MultipartWriter:
+    """
+    File-like text sink that streams into an S3 multipart upload, holding at most one part in memory.
+    """
+
+    def __init__(self, s3_client, bucket_name, key, extra_args=None):
+        self.s3 = s3_client
+        self.bucket_name = bucket_name
+        self.key = key
+        self.extra_args = extra_args or {}
+        self.buffer = io.BytesIO()
+        self.parts = []
+        self.upload_id = None
+        self.bytes_written = 0
+
+    def write(self, text):
+        data = text.encode('utf-8')
+        self.buffer.write(data)
+        self.bytes_written += len(data)
+        if self.buffer.tell() >= part_size:
+            self._flush_part()
+        return len(text)
+
+    def _flush_part(self):
+        if self.upload_id is None:
+            response = self.s3.create_multipart_upload(Bucket=self.bucket_name, Key=self.key, **self.extra_args)
+            self.upload_id = response['UploadId']
+        part_number = len(self.parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket_name,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=self.buffer.getvalue()
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        self.buffer = io.BytesIO()
 
-def get_securityhub_findings(region):
+    def close(self):
+        if self.upload_id is None:
+            # Small reports fit in a single part, a plain put is one round trip instead of three
+            self.s3.put_object(Bucket=self.bucket_name, Key=self.key, Body=self.buffer.getvalue(), **self.extra_args)
+        else:
+            if self.buffer.tell() > 0:
+                self._flush_part()
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                UploadId=self.upload_id,
+                MultipartUpload={'Parts': self.parts}
+            )
+        self.buffer = io.BytesIO()
+
+    def abort(self):
+        if self.upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket_name, Key=self.key, UploadId=self.upload_id)
+            self.upload_id = None
+        self.buffer = io.BytesIO()
+
+active_filters = {
+    'WorkflowStatus': [
+        {
+            'Comparison':'EQUALS',
+            'Value': 'NEW' # NEW | RESOLVED
+        }
+    ],
+    'RecordState': [
+        {
+            'Comparison':'EQUALS',
+            'Value': 'ACTIVE'
+        }
+    ]
+}
+
+def get_securityhub_findings(region, filters=active_filters):
     print('get_securityhub_findings STARTED')
-    client = boto3.client('securityhub', region_name=region)
+    client = boto3.client('securityhub', region_name=region, config=securityhub_config)
     paginator = client.get_paginator('get_findings')
-    findings=[]
     page_iterator = paginator.paginate(
-    Filters={
-        'WorkflowStatus': [
-            {
-                'Comparison':'EQUALS',
-                'Value': 'NEW' # NEW | RESOLVED
-            }
-        ],
-        'RecordState': [
-            {
-                'Comparison':'EQUALS',
-                'Value': 'ACTIVE'
-            }
-        ]
-    },
+    Filters=filters,
     SortCriteria=[
             {
                 'Field': 'Id',
                 'SortOrder': 'asc'
             },
         ],
-    MaxResults=10
+    PaginationConfig={
+        'PageSize': max_page_size
+    }
     )
     return page_iterator
 
-def get_securityhub_findings2csv(region):
-    findings_pages = get_securityhub_findings(region)
-    findings_csv = ''
+def finding_to_row(finding):
+    remediation = finding.get('Remediation',{}).get('Recommendation',{})
+    resource = (finding.get('Resources') or [{}])[0]
+    return [
+        finding.get('Id',''),
+        finding.get('ProductArn',''),
+        finding.get('ProductName',''),
+        finding.get('CompanyName',''),
+        finding.get('GeneratorId',''),
+        finding.get('Compliance',{}).get('SecurityControlId',''),
+        finding.get('CreatedAt',''),
+        finding.get('UpdatedAt',''),
+        finding.get('Confidence',''),
+        remediation.get('Text',''),
+        remediation.get('Url',''),
+        finding.get('SourceUrl',''),
+        finding.get('Compliance',{}).get('Status',''),
+        finding.get('Workflow',{}).get('Status',''),
+        finding.get('RecordState',''),
+        finding.get('ProcessedAt',''),
+        finding.get('Title',''),
+        finding.get('Severity',{}).get('Label',''),
+        finding.get('Region',''),
+        finding.get('AwsAccountId',''),
+        ' '.join(finding.get('Description','').splitlines()), # keep one finding per line for KB chunking
+        resource.get('Type',''),
+        resource.get('Id',''),
+        str(resource.get('Tags','')),
+    ]
+
+def write_findings_csv(findings_pages, out):
+    """Write findings pages as CSV rows into a file-like object, returns the number of findings written."""
+    writer = csv.writer(out, lineterminator=os.linesep)
+    writer.writerow(csv_header)
     lines = 0
-    #print('get_securityhub_findings2csv STARTED')
-    #Adds Findings Title
-    findings_csv = f'Id{csv}ProductArn{csv}ProductName{csv}CompanyName{csv}GeneratorId{csv}SecurityControlId{csv}CreatedAt{csv}UpdatedAt{csv}Confidence{csv}Remediation{csv}Remediation_URL{csv}SourceUrl{csv}Compliance{csv}WorkflowStatus{csv}RecordState{csv}ProcessedAt{csv}Title{csv}severity{csv}Region{csv}Account_id{csv}Description{csv}Resource_type{csv}Resource_id{csv}Resource_tags' + os.linesep
-    #Adds Findings Details
     for page in findings_pages:
-        for finding in page['Findings']:
-            finding_id = finding.get('Id','')
-            finding_ProductArn = finding.get('ProductArn','')
-            finding_ProductName = finding.get('ProductName','')
-            finding_CompanyName = finding.get('CompanyName','')
-            finding_GeneratorId = finding.get('GeneratorId','')
-            finding_SecurityControlId = finding.get('Compliance',{}).get('SecurityControlId','')
-            finding_CreatedAt = finding.get('CreatedAt','')
-            finding_UpdatedAt = finding.get('UpdatedAt','')
-            finding_Confidence = finding.get('Confidence','')
-            finding_RemText = '"' + finding.get('Remediation',{}).get('Recommendation',{}).get('Text','') + '"'
-            finding_RemUrl =  finding.get('Remediation',{}).get('Recommendation',{}).get('Url','')
-            finding_SourceUrl = finding.get('SourceUrl','')
-            finding_Compliance = finding.get('Compliance',{}).get('Status','')
-            finding_WorkflowStatus = finding.get('Workflow',{}).get('Status','')
-            finding_RecordState = finding.get('RecordState','')
-            finding_Processed_at = finding.get('ProcessedAt','')
-            finding_title = finding.get('Title','')
-            finding_severity = finding.get('Severity',{}).get('Label','')
-            finding_region = finding.get('Region','')
-            finding_account_id = finding.get('AwsAccountId','')
-            finding_description = finding.get('Description','').replace(';','.')
-            finding_description = ''.join(finding_description.splitlines())
-            finding_resource_type = finding.get('Resources',{})[0].get('Type','')
-            finding_resource_id = finding.get('Resources',{})[0].get('Id','')
-            finding_resource_tags = '"' + str(finding.get('Resources',{})[0].get('Tags','')) + '"'
-            finding_csv = f'{finding_id}{csv}{finding_ProductArn}{csv}{finding_ProductName}{csv}{finding_CompanyName}{csv}{finding_GeneratorId}{csv}{finding_SecurityControlId}{csv}{finding_CreatedAt}{csv}{finding_UpdatedAt}{csv}{finding_Confidence}{csv}{finding_RemText}{csv}{finding_RemUrl}{csv}{finding_SourceUrl}{csv}{finding_Compliance}{csv}{finding_WorkflowStatus}{csv}{finding_RecordState}{csv}{finding_Processed_at}{csv}{finding_title}{csv}{finding_severity}{csv}{finding_region}{csv}{finding_account_id}{csv}{finding_description}{csv}{finding_resource_type}{csv}{finding_resource_id}{csv}{finding_resource_tags}'+ os.linesep
-            findings_csv += finding_csv
-            lines = lines + 1
+        writer.writerows(finding_to_row(finding) for finding in page['Findings'])
+        lines += len(page['Findings'])
     print('lines:' + str(lines))
-    return findings_csv
+    return lines
+
+def export_findings_to_s3(region, bucket_name, key):
+    s3 = boto3.client('s3', region_name=region)
+    out = S3MultipartWriter(s3, bucket_name, key, extra_args={'ServerSideEncryption':'AES256'})
+    try:
+        lines = write_findings_csv(get_securityhub_findings(region), out)
+        out.close()
+    except Exception:
+        out.abort()
+        raise
+    print(f'Exported {lines} findings ({out.bytes_written} bytes, {max(len(out.parts), 1)} parts) to s3://{bucket_name}/{key}')
+    return lines
+
+def run_per_region(regions, collect):
+    """
+    Run collect(region) for every region on a bounded worker pool.
+    Returns the collected results and a per-region report of counts, timings and errors.
+    """
+    def timed(collect_region):
+        started = time.perf_counter()
+        try:
+            result, count = collect(collect_region)
+            error = None
+        except Exception as e:
+            result, count, error = None, 0, f'{type(e).__name__}: {str(e)}'
+        return collect_region, result, {
+            'findings': count,
+            'durationMs': int((time.perf_counter() - started) * 1000),
+            'error': error
+        }
+
+    results = {}
+    report = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(regions)))) as executor:
+        for collect_region, result, region_report in executor.map(timed, regions):
+            report[collect_region] = region_report
+            if region_report['error']:
+                print(f'[{collect_region}] collection failed: {region_report["error"]}')
+            else:
+                results[collect_region] = result
+                print(f'[{collect_region}] {region_report["findings"]} findings in {region_report["durationMs"]}ms')
+    return results, report
+
+def export_regions_to_s3(regions, bucket_name):
+    """Full export, single region keeps the historical report key, multiple regions stream one CSV partition each."""
+    if len(regions) == 1:
+        key_for = lambda collect_region: filename
+    else:
+        key_for = lambda collect_region: f'{regional_prefix}{collect_region}.csv'
+
+    def collect(collect_region):
+        lines = export_findings_to_s3(collect_region, bucket_name, key_for(collect_region))
+        return key_for(collect_region), lines
+
+    _, report = run_per_region(regions, collect)
+    return report
+
+def is_active_finding(finding):
+    return finding.get('RecordState') == 'ACTIVE' and finding.get('Workflow',{}).get('Status') == 'NEW'
 
-def copy_file_to_s3(region, bucket_name, filename):
+def finding_to_record(finding):
+    return dict(zip(csv_header, finding_to_row(finding)))
+
+def partition_key(finding):
+    """Stable JSONL partition for a finding, so updates to the same finding always land in the same object."""
+    digest = hashlib.sha1(finding['Id'].encode('utf-8')).hexdigest()
+    shard = int(digest, 16) % partitions_per_region
+    # JSONL content under a .txt extension, which the knowledge base S3 data source parser accepts
+    return f"{findings_prefix}{finding.get('AwsAccountId','unknown')}/{finding.get('Region','unknown')}/part-{shard:03d}.jsonl.txt"
+
+def load_legacy_watermarks(s3, bucket_name):
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=legacy_watermark_key)
+        return json.loads(response['Body'].read().decode('utf-8'))
+    except s3.exceptions.NoSuchKey:
+        return {}
+
+def load_watermarks(ssm, s3, bucket_name):
+    """Per-region UpdatedAt watermarks, a legacy single watermark applies to the function's own region."""
+    try:
+        state = json.loads(ssm.get_parameter(Name=watermark_parameter)['Parameter']['Value'])
+    except ssm.exceptions.ParameterNotFound:
+        # Not saved to Parameter Store yet, carry on from the watermark an earlier version kept in the bucket
+        state = load_legacy_watermarks(s3, bucket_name)
+    watermarks = state.get('Regions', {})
+    if state.get('UpdatedAt') and region not in watermarks:
+        watermarks[region] = state['UpdatedAt']
+    return watermarks
+
+def save_watermarks(ssm, s3, bucket_name, watermarks):
+    ssm.put_parameter(
+        Name=watermark_parameter,
+        Value=json.dumps({'Regions': watermarks}),
+        Type='String',
+        Overwrite=True
+    )
+    # Deleting does not fire the Object Created rule, the knowledge base drops the legacy object on its next sync
+    s3.delete_object(Bucket=bucket_name, Key=legacy_watermark_key)
+
+def changed_findings_filters(watermark):
+    if not watermark:
+        # First run bootstraps from the currently active findings only, there is nothing to tombstone yet
+        return active_filters
+    return {
+        'UpdatedAt': [
+            {
+                'Start': watermark,
+                'End': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+            }
+        ]
+    }
+
+def read_partition(s3, bucket_name, key):
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=key)
+    except s3.exceptions.NoSuchKey:
+        return {}
+    records = {}
+    for line in response['Body'].read().decode('utf-8').splitlines():
+        if line:
+            record = json.loads(line)
+            records[record['Id']] = record
+    return records
+
+def write_partition(s3, bucket_name, key, records, previous):
+    """Write a partition only if its content changed, deleting it once its last finding is tombstoned."""
+    if records == previous:
+        return 'unchanged'
+    if not records:
+        s3.delete_object(Bucket=bucket_name, Key=key)
+        return 'deleted'
+    body = ''.join(json.dumps(records[finding_id], sort_keys=True) + '\n' for finding_id in sorted(records))
+    s3.put_object(Bucket=bucket_name, Key=key, Body=body.encode('utf-8'), ContentType='text/plain', ServerSideEncryption='AES256')
+    return 'written'
+
+def updated_at_time(finding):
+    """UpdatedAt of a finding as a datetime, None without one. Timestamps differ in their fraction digits, so strings do not sort."""
+    try:
+        return datetime.fromisoformat(finding.get('UpdatedAt', '').replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+class PartitionChanges:
+    """
+    Finding changes per partition, None marks a tombstone for a resolved finding. Once they take more than max_bytes, the
+    changes of the largest partition are merged into its object, so even the bootstrap run, which loads every active
+    finding, holds a bounded amount of them. Regions collected in parallel share one instance.
+    """
+
+    def __init__(self, s3, bucket_name, max_bytes):
+        self.s3 = s3
+        self.bucket_name = bucket_name
+        self.max_bytes = max_bytes
+        self.pending = {}
+        self.pending_bytes = {}
+        self.total_bytes = 0
+        self.stats = {'upserted': 0, 'tombstoned': 0, 'written': 0, 'deleted': 0, 'unchanged': 0}
+        self.lock = threading.Lock()
+
+    def add(self, finding):
+        record = finding_to_record(finding) if is_active_finding(finding) else None
+        key = partition_key(finding)
+        size = len(json.dumps(record)) if record else len(finding['Id'])
+        with self.lock:
+            self.pending.setdefault(key, {})[finding['Id']] = record
+            self.pending_bytes[key] = self.pending_bytes.get(key, 0) + size
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                self._merge(max(self.pending_bytes, key=self.pending_bytes.get))
+
+    def flush(self):
+        """Merge all remaining changes, returns the counts of the run."""
+        with self.lock:
+            for key in list(self.pending):
+                self._merge(key)
+        return self.stats
+
+    def _merge(self, key):
+        """Merge the changes of a partition into its object, upserting active findings and tombstoning resolved ones."""
+        changes = self.pending.pop(key)
+        self.total_bytes -= self.pending_bytes.pop(key)
+        previous = read_partition(self.s3, self.bucket_name, key)
+        records = dict(previous)
+        for finding_id, record in changes.items():
+            if record is not None:
+                records[finding_id] = record
+                self.stats['upserted'] += 1
+            elif records.pop(finding_id, None) is not None:
+                self.stats['tombstoned'] += 1
+        self.stats[write_partition(self.s3, self.bucket_name, key, records, previous)] += 1
+
+def collect_finding_changes(findings_pages, changes):
+    """Add changed findings to the partition changes, returns the latest UpdatedAt and the number of findings."""
+    max_updated_at = None
+    latest = None
+    count = 0
+    for page in findings_pages:
+        for finding in page['Findings']:
+            changes.add(finding)
+            updated_at = updated_at_time(finding)
+            if updated_at and (latest is None or updated_at > latest):
+                latest, max_updated_at = updated_at, finding['UpdatedAt']
+            count += 1
+    return max_updated_at, count
+
+def remove_full_export(s3, bucket_name):
+    """Delete the CSVs of a full export, the knowledge base would otherwise keep serving them next to the partitions."""
+    # One listing covers the single region report (securityhub_latest.csv) and the regional ones (securityhub_latest/)
+    paginator = s3.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=filename.rsplit('.', 1)[0]):
+        for item in page.get('Contents', []):
+            if item['Key'] == filename or item['Key'].startswith(regional_prefix):
+                s3.delete_object(Bucket=bucket_name, Key=item['Key'])
+                print(f'Removed full export {item["Key"]}, findings are now kept under {findings_prefix}')
+
+def export_changed_findings_to_s3(regions, bucket_name):
     s3 = boto3.client('s3', region_name=region)
-    tc = boto3.s3.transfer.S3Transfer(client=s3)
-    tc.upload_file(fullpath, bucket_name, filename,extra_args={'ServerSideEncryption':'AES256'})
-    os.remove(fullpath)
+    ssm = boto3.client('ssm', region_name=region)
+    watermarks = load_watermarks(ssm, s3, bucket_name)
+    print(f'Incremental export since watermarks: {json.dumps(watermarks)}')
+    remove_full_export(s3, bucket_name)
+    changes = PartitionChanges(s3, bucket_name, partition_buffer_bytes)
 
-def collection_to_csv(col, filename):
-    with open(filename, 'w') as f:
-        f.write(col)
+    def collect(collect_region):
+        findings_pages = get_securityhub_findings(collect_region, changed_findings_filters(watermarks.get(collect_region)))
+        return collect_finding_changes(findings_pages, changes)
+
+    results, report = run_per_region(regions, collect)
+    stats = changes.flush()
+    stats['changed'] = sum(region_report['findings'] for region_report in report.values())
+    # Watermarks only advance after every partition is persisted and only for regions that were fully collected,
+    # a failed region is simply replayed next time, including the changes of it that were already merged
+    new_watermarks = dict(watermarks)
+    for collect_region, max_updated_at in results.items():
+        if max_updated_at:
+            new_watermarks[collect_region] = max_updated_at
+    if new_watermarks != watermarks:
+        save_watermarks(ssm, s3, bucket_name, new_watermarks)
+    stats['watermarks'] = new_watermarks
+    stats['regions'] = report
+    print('Incremental export: ' + json.dumps(stats))
+    return stats
 
 def create_s3_preauth_url(region, bucket_name, file_name):
     s3 = boto3.client('s3', region_name=region)
@@ -99,13 +428,31 @@ def send_sns(url):
     sns_client = boto3.client('sns')
     response = sns_client.publish(TopicArn=snsTopicArn, Message=snsBody)
 
+def raise_on_failed_regions(report):
+    failed = [collect_region for collect_region, region_report in report.items() if region_report['error']]
+    if failed:
+        # Fail the invocation so the scheduled rule retries, completed regions are idempotent to re-export
+        raise Exception(f'Security Hub collection failed for regions: {", ".join(failed)}')
+
 def lambda_handler(event, context):
-    csv = get_securityhub_findings2csv (region)
-    collection_to_csv(csv,fullpath)
-    copy_file_to_s3 (region,bucket,filename)
+    if export_mode == 'incremental':
+        stats = export_changed_findings_to_s3(sechub_regions, bucket)
+        raise_on_failed_regions(stats['regions'])
+        return {
+            'statusCode': 200,
+            'body': json.dumps(stats)
+        }
+
+    report = export_regions_to_s3(sechub_regions, bucket)
+    print('Full export: ' + json.dumps(report))
+    raise_on_failed_regions(report)
     # url=create_s3_preauth_url(region, bucket, filename)
     # send_sns(url)
     return {
         'statusCode': 200,
+        'body': json.dumps({
+            'findings': sum(region_report['findings'] for region_report in report.values()),
+            'regions': report
+        })
         # 'body': json.dumps('Report: ' + url)
-    }
\ No newline at end of file
+    }
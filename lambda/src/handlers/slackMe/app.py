@@ -1,23 +1,31 @@
-import os, json
+import os, json, gzip, re
+import boto3
 from slack_sdk import WebClient
 
 slack_access_token = os.environ["SLACK_ACCESS_TOKEN"]
 admin_slack_channel_id = os.environ['SLACK_CHANNEL_ID']
 slack_client = WebClient(token=slack_access_token)
+s3_client = None
+
+# Reference to a large agent response offloaded by oheroAct (see oheroAct/payload_offload.py)
+payload_reference_pattern = re.compile(r'ohero-payload\+s3://([^/\s]+)/(\S+)')
+# References are resolved only under the prefix oheroAct offloads agent outputs to, in the transient payloads bucket
+payload_bucket = os.environ.get('PAYLOAD_BUCKET')
+payload_reference_prefix = 'ops-event-payloads/agent-outputs/'
 
 def lambda_handler(event, context):
     context.log("Incoming Event : " + json.dumps(event) + "\n")
 
     channel = event.get('channel', admin_slack_channel_id)
     blocks = event.get('blocks')
-    text = truncate(event.get('text', ''), 4000) # Slack max allow per message is 4000
+    text = truncate(resolve_payload_reference(event.get('text', '')), 4000) # Slack max allow per message is 4000
     thread_ts = event.get('threadTs')
 
     if blocks:
         for block in blocks:
             if block.get('text'):
                 if block.get('text').get('text'):
-                    block['text']['text'] = truncate(block['text']['text'], 2950) # Slack max allow per block is 3000
+                    block['text']['text'] = truncate(resolve_payload_reference(block['text']['text']), 2950) # Slack max allow per block is 3000
         kwargs = {
             'channel': channel,
             'blocks': blocks,
@@ -60,3 +68,28 @@ def truncate(s, limit):
         truncated += "..."
 
     return truncated
+
+def resolve_payload_reference(text):
+    """
+    Replace a text carrying an offloaded payload reference with the stored payload, fetched only when referenced.
+    Only agent outputs in the transient payloads bucket are resolved, any other reference is sent as it is.
+    """
+    global s3_client
+    match = payload_reference_pattern.search(text or '')
+    if not match:
+        return text
+    if not payload_bucket or match.group(1) != payload_bucket or not match.group(2).startswith(payload_reference_prefix):
+        print(f"Ignoring payload reference outside s3://{payload_bucket}/{payload_reference_prefix}: {match.group(0)}")
+        return text
+    try:
+        if s3_client is None:
+            s3_client = boto3.client('s3')
+        response = s3_client.get_object(Bucket=match.group(1), Key=match.group(2))
+        body = response['Body'].read()
+        if response.get('ContentEncoding') == 'gzip' or match.group(2).endswith('.gz'):
+            body = gzip.decompress(body)
+        return body.decode('utf-8')
+    except Exception as e:
+        # The preview before the reference is still worth sending
+        print(f"Failed to resolve payload reference {match.group(0)}: {str(e)}")
+        return text
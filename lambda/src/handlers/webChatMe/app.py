@@ -1,4 +1,6 @@
 import os
+import re
+import gzip
 import json
 import boto3
 import uuid
@@ -7,11 +9,20 @@ from datetime import datetime, timezone
 
 dynamodb_client = boto3.client('dynamodb')
 apigateway_client = None
+s3_client = None
 
 # Environment variables
 connections_table_name = os.environ.get('CONNECTIONS_TABLE_NAME', 'WebSocketConnections')
 websocket_api_endpoint = os.environ.get('WEBSOCKET_API_ENDPOINT')
 
+# Reference to a large agent response offloaded by oheroAct (see oheroAct/payload_offload.py)
+payload_reference_pattern = re.compile(r'ohero-payload\+s3://([^/\s]+)/(\S+)')
+# References are resolved only under the prefix oheroAct offloads agent outputs to, in the transient payloads bucket
+payload_bucket = os.environ.get('PAYLOAD_BUCKET')
+payload_reference_prefix = 'ops-event-payloads/agent-outputs/'
+# API Gateway WebSocket messages are limited to 128 KB
+max_resolved_text_length = 100000
+
 
 def get_apigateway_client():
     """Initialize API Gateway client with WebSocket endpoint"""
@@ -22,6 +33,31 @@ def get_apigateway_client():
     return apigateway_client
 
 
+def resolve_payload_reference(text):
+    """
+    Replace a text carrying an offloaded payload reference with the stored payload, fetched only when referenced.
+    Only agent outputs in the transient payloads bucket are resolved, any other reference is sent as it is.
+    """
+    global s3_client
+    match = payload_reference_pattern.search(text or '')
+    if not match:
+        return text
+    if not payload_bucket or match.group(1) != payload_bucket or not match.group(2).startswith(payload_reference_prefix):
+        print(f"Ignoring payload reference outside s3://{payload_bucket}/{payload_reference_prefix}: {match.group(0)}")
+        return text
+    try:
+        if s3_client is None:
+            s3_client = boto3.client('s3')
+        response = s3_client.get_object(Bucket=match.group(1), Key=match.group(2))
+        body = response['Body'].read()
+        if response.get('ContentEncoding') == 'gzip' or match.group(2).endswith('.gz'):
+            body = gzip.decompress(body)
+        return body.decode('utf-8')
+    except Exception as e:
+        # The preview before the reference is still worth sending
+        print(f"Failed to resolve payload reference {match.group(0)}: {str(e)}")
+        return text
+
 
 def lambda_handler(event, context):
     """Send messages to all active WebSocket connections"""
@@ -46,6 +82,10 @@ def lambda_handler(event, context):
     # Extract channel from message (if present) and pass it through
     channel = message.get('channel')
 
+    # Large agent responses arrive as a reference to the offloaded payload
+    if isinstance(message.get('text'), str):
+        message = truncate_message({**message, 'text': resolve_payload_reference(message['text'])}, max_resolved_text_length)
+
     # Normalize thread ID
     if thread_id:
         if isinstance(thread_id, dict):
@@ -19,6 +19,7 @@ export interface OpsHealthAgentProps extends cdk.StackProps {
   opsHealthBucketName: string,
   opsSecHubBucketName: string,
   transientPayloadsBucketName: string,
+  opsEventLakeBucketName: string,
   slackChannelId: string
   slackAccessToken: string
   eventManagementTableName: string
@@ -27,6 +28,7 @@ export interface OpsHealthAgentProps extends cdk.StackProps {
   sourceEventDomains: string[]
   appEventDomainPrefix: string
   teamManagementTableName: string
+  healthTriageBatching?: boolean // queue Health events so related events arriving together are triaged in one agent run
 }
 
 export class OpsHealthAgentStack extends cdk.Stack {
@@ -92,7 +94,7 @@ export class OpsHealthAgentStack extends cdk.Stack {
     });
 
     const healthBufferKbSyncSqs = new sqs.Queue(this, 'BufferHealthKbSyncSqs', {
-      visibilityTimeout: cdk.Duration.seconds(300), //6 times the function timeout, plus the value of MaximumBatchingWindowInSeconds
+      visibilityTimeout: cdk.Duration.seconds(360), //6 times the function timeout, plus the value of MaximumBatchingWindowInSeconds
     })
     const sechubBufferKbSyncSqs = new sqs.Queue(this, 'BufferSechubKbSyncSqs', {
       visibilityTimeout: cdk.Duration.seconds(300), //6 times the function timeout, plus the value of MaximumBatchingWindowInSeconds
@@ -102,7 +104,7 @@ export class OpsHealthAgentStack extends cdk.Stack {
       runtime: lambda.Runtime.NODEJS_20_X,
       code: lambda.Code.fromAsset('lambda/src/.aws-sam/build/IngestOpsKbFunction'),
       handler: 'app.lambdaHandler',
-      timeout: cdk.Duration.seconds(15),
+      timeout: cdk.Duration.seconds(30), // writes the metadata sidecars of new Health event documents before starting the sync
       memorySize: 128,
       architecture: lambda.Architecture.ARM_64,
       reservedConcurrentExecutions: 1,
@@ -144,6 +146,7 @@ export class OpsHealthAgentStack extends cdk.Stack {
         statements: [ingestKbPolicy],
       }),
     );
+    opsHealthBucket.grantReadWrite(ingestKbFunction);
 
     new events.Rule(this, `OpsKbFileArrivalRule`, {
       // from default event bus
@@ -176,6 +179,7 @@ export class OpsHealthAgentStack extends cdk.Stack {
       // architecture: lambda.Architecture.ARM_64,
       architecture: lambda.Architecture.X86_64, // Arch choice needs to be consistent with what is defined in SAM template.yaml file.
       reservedConcurrentExecutions: 1, // Allowed concurrency set to 1 to accommodate LLM API throttling retries, make sure your AWS account and region has the appropriate API quota for used LLMs if faster processing speed needed.
+      snapStart: lambda.SnapStartConf.ON_PUBLISHED_VERSIONS, // Resumes from a snapshot taken after imports, AWS clients are recreated after restore (see aws_clients.py)
       environment: {
         MEM_BUCKET: props.transientPayloadsBucketName,
         KNOWLEDGE_BUCKET: props.opsHealthBucketName,
@@ -184,9 +188,30 @@ export class OpsHealthAgentStack extends cdk.Stack {
         TICKET_TABLE: props.ticketManagementTableName,
         EVENT_SOURCE_NAME: `${props.appEventDomainPrefix}.ops-orchestration`,
         EVENT_BUS_NAME: props.oheroEventBus.eventBusName,
-        TEAM_TABLE: props.teamManagementTableName
+        TEAM_TABLE: props.teamManagementTableName,
+        EVENT_TABLE: props.eventManagementTableName, // fingerprints of processed Health events, unchanged updates skip the agent, and per-event leases (see event_lease.py)
+        MODEL_ROUTER_MODE: 'rules' // simple tasks start on a lighter model (see ops_agent/model_routes.json), 'off' always uses the preferred one
       },
     });
+    // SnapStart only applies to published versions, state machines invoke the function through this alias
+    const invokeOheroActAlias = invokeOheroActFunction.addAlias('live');
+
+    // Batch mode: the ai-integration state machine queues Health events here and waits for the function to answer,
+    // events that arrive within the batching window are grouped by service, region and event type (see batch.py)
+    const healthTriageBatchSqs = new sqs.Queue(this, 'HealthTriageBatchSqs', {
+      visibilityTimeout: cdk.Duration.seconds(960), // longer than the function timeout
+      // Waiting state machine tasks time out before (TimeoutSeconds 3600), they get a heartbeat before every agent run
+      // (HeartbeatSeconds 1000: the function timeout plus the batching window, a message may wait behind a running invocation)
+      retentionPeriod: cdk.Duration.minutes(65),
+      encryption: sqs.QueueEncryption.SQS_MANAGED,
+    });
+    if (props.healthTriageBatching) {
+      invokeOheroActAlias.addEventSource(new SqsEventSource(healthTriageBatchSqs, {
+        batchSize: 10,
+        maxBatchingWindow: cdk.Duration.seconds(30),
+        reportBatchItemFailures: true
+      }));
+    }
     // ============================
 
     const invokeAgentLogGroup = new logs.LogGroup(this, 'InvokeAgentLogGroup', {
@@ -206,6 +231,7 @@ export class OpsHealthAgentStack extends cdk.Stack {
         "dynamodb:*",
         "states:SendTaskFailure",
         "states:SendTaskSuccess",
+        "states:SendTaskHeartbeat",
         "events:PutEvents",
         "s3:ListBucket",
         "s3:GetObject",
@@ -223,6 +249,128 @@ export class OpsHealthAgentStack extends cdk.Stack {
       }),
     );
 
+    // ===== Index of past knowledge reports for the search_past_resolutions tool =====
+    // Reuses the OheroAct build, new reports are added to the index shards in the transient payloads bucket (see resolution_index.py)
+    const resolutionIndexSqs = new sqs.Queue(this, 'BufferResolutionIndexSqs', {
+      visibilityTimeout: cdk.Duration.seconds(960), //6 times the function timeout, plus the value of MaximumBatchingWindowInSeconds
+      encryption: sqs.QueueEncryption.SQS_MANAGED,
+    });
+
+    const indexResolutionsFunction = new lambda.Function(this, 'IndexResolutionsFunction', {
+      runtime: lambda.Runtime.PYTHON_3_12,
+      code: lambda.Code.fromAsset('lambda/src/.aws-sam/build/OheroActFunction'),
+      handler: 'resolution_index.lambda_handler',
+      timeout: cdk.Duration.seconds(120),
+      memorySize: 512,
+      architecture: lambda.Architecture.X86_64, // same build as OheroActFunction
+      reservedConcurrentExecutions: 1, // the index shards and manifest are rewritten by one writer at a time
+      environment: {
+        MEM_BUCKET: props.transientPayloadsBucketName,
+        KNOWLEDGE_BUCKET: props.opsHealthBucketName
+      },
+    });
+
+    indexResolutionsFunction.addEventSource(new SqsEventSource(resolutionIndexSqs, {
+      batchSize: 100,
+      maxBatchingWindow: cdk.Duration.minutes(3)
+    }));
+
+    new logs.LogGroup(this, 'IndexResolutionsLogGroup', {
+      logGroupName: `/aws/lambda/${indexResolutionsFunction.functionName}`,
+      retention: logs.RetentionDays.ONE_WEEK,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    opsHealthBucket.grantRead(indexResolutionsFunction, 'ohero-knowledge/*');
+    s3.Bucket.fromBucketName(this, 'ResolutionIndexBucket', props.transientPayloadsBucketName)
+      .grantReadWrite(indexResolutionsFunction, 'ohero-knowledge-index/*');
+
+    new events.Rule(this, `KnowledgeReportArrivalRule`, {
+      // from default event bus
+      eventPattern: {
+        source: [
+          "aws.s3"
+        ],
+        detailType: [
+          "Object Created"
+        ],
+        detail: {
+          bucket: {
+            name: [props.opsHealthBucketName]
+          },
+          object: {
+            key: [{ prefix: 'ohero-knowledge/' }]
+          }
+        }
+      },
+      targets: [new evtTargets.SqsQueue(resolutionIndexSqs)]
+    });
+    // ============================
+
+    // ===== Local vector index of ops events, fast path and fallback of the search_ops_events tool =====
+    // Reuses the OheroAct build, Health events archived in the event lake are embedded into ops-event-vectors/ (see event_vectors.py)
+    const eventVectorsSqs = new sqs.Queue(this, 'BufferEventVectorsSqs', {
+      visibilityTimeout: cdk.Duration.seconds(1980), //6 times the function timeout, plus the value of MaximumBatchingWindowInSeconds
+      encryption: sqs.QueueEncryption.SQS_MANAGED,
+    });
+
+    const indexEventVectorsFunction = new lambda.Function(this, 'IndexEventVectorsFunction', {
+      runtime: lambda.Runtime.PYTHON_3_12,
+      code: lambda.Code.fromAsset('lambda/src/.aws-sam/build/OheroActFunction'),
+      handler: 'event_vectors.lambda_handler',
+      timeout: cdk.Duration.seconds(300),
+      memorySize: 1024,
+      architecture: lambda.Architecture.X86_64, // same build as OheroActFunction
+      reservedConcurrentExecutions: 1, // the index files are rewritten by one writer at a time
+      environment: {
+        MEM_BUCKET: props.transientPayloadsBucketName,
+        EVENT_LAKE_BUCKET: props.opsEventLakeBucketName
+      },
+    });
+
+    indexEventVectorsFunction.addEventSource(new SqsEventSource(eventVectorsSqs, {
+      batchSize: 50,
+      maxBatchingWindow: cdk.Duration.minutes(3)
+    }));
+
+    new logs.LogGroup(this, 'IndexEventVectorsLogGroup', {
+      logGroupName: `/aws/lambda/${indexEventVectorsFunction.functionName}`,
+      retention: logs.RetentionDays.ONE_WEEK,
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    s3.Bucket.fromBucketName(this, 'OpsEventLakeBucket', props.opsEventLakeBucketName)
+      .grantRead(indexEventVectorsFunction, 'ops-events/*');
+    s3.Bucket.fromBucketName(this, 'EventVectorsBucket', props.transientPayloadsBucketName)
+      .grantReadWrite(indexEventVectorsFunction, 'ops-event-vectors/*');
+    indexEventVectorsFunction.addToRolePolicy(new iam.PolicyStatement({
+      actions: ["bedrock:InvokeModel"],
+      resources: [`arn:aws:bedrock:${this.region}::foundation-model/amazon.titan-embed-text-v2:0`],
+      effect: iam.Effect.ALLOW
+    }));
+
+    new events.Rule(this, `OpsEventLakeArrivalRule`, {
+      // from default event bus
+      eventPattern: {
+        source: [
+          "aws.s3"
+        ],
+        detailType: [
+          "Object Created"
+        ],
+        detail: {
+          bucket: {
+            name: [props.opsEventLakeBucketName]
+          },
+          object: {
+            key: [{ prefix: 'ops-events/' }]
+          }
+        }
+      },
+      targets: [new evtTargets.SqsQueue(eventVectorsSqs)]
+    });
+    // ============================
+
     /*** Role to be used by event processing and integration state machines ************/
     const eventAiProcessingRole = new iam.Role(this, 'EventAiProcessingRole', {
       roleName: 'EventAiProcessingRole',
@@ -245,6 +393,7 @@ export class OpsHealthAgentStack extends cdk.Stack {
       ],
       resources: ['*']
     }));
+    healthTriageBatchSqs.grantSendMessages(eventAiProcessingRole);
     /******************************************************************************* */
 
     /*** State machine for AI agent integration microservices *****/
@@ -256,7 +405,9 @@ export class OpsHealthAgentStack extends cdk.Stack {
     const aiIntegrationSfn = new sfn.StateMachine(this, 'OheroAiIntegration', {
       definitionBody: sfn.DefinitionBody.fromString(fs.readFileSync(path.join(__dirname, '../state-machine/ai-integration.asl')).toString().trim()),
       definitionSubstitutions: {
-        "InvokeBedRockAgentFunctionNamePlaceholder": invokeOheroActFunction.functionName,
+        "InvokeBedRockAgentFunctionNamePlaceholder": `${invokeOheroActFunction.functionName}:${invokeOheroActAlias.aliasName}`,
+        "HealthTriageModePlaceholder": props.healthTriageBatching ? 'batch' : 'single',
+        "HealthTriageBatchQueueUrlPlaceholder": healthTriageBatchSqs.queueUrl,
         "EventManagementTablePlaceHolder": props.eventManagementTableName,
         "AppEventBusPlaceholder": props.oheroEventBus.eventBusName,
         "AppEventDomainPrefixPlaceholder": props.appEventDomainPrefix
@@ -319,7 +470,7 @@ export class OpsHealthAgentStack extends cdk.Stack {
     const oheroChatSfn = new sfn.StateMachine(this, 'OheroChatIntegration', {
       definitionBody: sfn.DefinitionBody.fromString(fs.readFileSync(path.join(__dirname, '../state-machine/ai-chat.asl')).toString().trim()),
       definitionSubstitutions: {
-        "InvokeBedRockAgentFunctionNamePlaceholder": invokeOheroActFunction.functionName,
+        "InvokeBedRockAgentFunctionNamePlaceholder": `${invokeOheroActFunction.functionName}:${invokeOheroActAlias.aliasName}`,
         "SlackChannelIdPlaceholder": props.slackChannelId,
         "ChatUserSessionsTableNamePlaceholder": chatUserSessionsTable.tableName,
         "AppEventBusPlaceholder": props.oheroEventBus.eventBusName,
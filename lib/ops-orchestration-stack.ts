@@ -205,7 +205,8 @@ export class OpsOrchestrationStack extends cdk.Stack {
       tracing: lambda.Tracing.DISABLED,
       environment: {
         SLACK_ACCESS_TOKEN: props.slackAccessToken,
-        SLACK_CHANNEL_ID: props.slackChannelId
+        SLACK_CHANNEL_ID: props.slackChannelId,
+        PAYLOAD_BUCKET: props.transientPayloadsBucketName // only offloaded agent outputs in this bucket are resolved
       },
     });
 
@@ -230,6 +231,7 @@ export class OpsOrchestrationStack extends cdk.Stack {
       tracing: lambda.Tracing.DISABLED,
       environment: {
         CONNECTIONS_TABLE_NAME: props.webSocketConnectionsTableName,
+        PAYLOAD_BUCKET: props.transientPayloadsBucketName, // only offloaded agent outputs in this bucket are resolved
         // WEBSOCKET_API_ENDPOINT will be set below after WebSocket API creation
       },
     });
@@ -40,7 +40,11 @@ export class OrgAdminOrgStack extends cdk.Stack {
         architecture: lambda.Architecture.ARM_64,
         reservedConcurrentExecutions: 1,
         environment: {
-          S3_NAME: props.secHubBucketName
+          S3_NAME: props.secHubBucketName,
+          EXPORT_MODE: 'full', // 'incremental' writes only changed findings as JSONL partitions so KB sync scales with change volume
+          SECHUB_REGIONS: cdk.Stack.of(this).region, // comma separated list of regions to collect findings from in parallel
+          MAX_WORKERS: '4',
+          WATERMARK_PARAMETER: '/ohero/securityhub/export-watermarks' // incremental mode state, kept out of the knowledge base bucket
         },
       });
 
@@ -56,6 +60,7 @@ export class OrgAdminOrgStack extends cdk.Stack {
           "s3:GetObject",
           "s3:GetBucketLocation",
           "s3:ListMultipartUploadParts",
+          "s3:AbortMultipartUpload",
           "s3:PutObject",
           "s3:DeleteObject",
           "s3:DeleteObjects",
@@ -65,9 +70,18 @@ export class OrgAdminOrgStack extends cdk.Stack {
         effect: cdk.aws_iam.Effect.ALLOW
       });
 
+      const secHubWatermarkPolicy = new iam.PolicyStatement({
+        actions: [
+          "ssm:GetParameter",
+          "ssm:PutParameter"
+        ],
+        resources: [`arn:aws:ssm:${cdk.Stack.of(this).region}:${cdk.Stack.of(this).account}:parameter/ohero/securityhub/*`],
+        effect: cdk.aws_iam.Effect.ALLOW
+      });
+
       secHubReportFunction.role?.attachInlinePolicy(
         new iam.Policy(this, 'securityhub-function-policy', {
-          statements: [secHubReportPolicy],
+          statements: [secHubReportPolicy, secHubWatermarkPolicy],
         }),
       );
 